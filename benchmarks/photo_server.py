@@ -0,0 +1,140 @@
+import argparse
+import hashlib
+import json
+import posixpath
+import threading
+import time
+from email.utils import formatdate
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+DEFAULT_IMAGE_BYTES = 48 * 1024
+
+
+class PhotoServer:
+    """
+    Local stand-in for cdn.realtor.ca that serves a deterministic image for any path.
+
+    The content depends only on the file name, so the same photo under two
+    directories (as with re-uploaded photos under a new TS... segment) is
+    byte-identical. Responses carry an ETag and Last-Modified and answer
+    conditional requests with 304. Bump `generation` to make every image
+    change. GET /stats returns the request counters.
+    """
+
+    def __init__(self, host="127.0.0.1", port=0, image_bytes=DEFAULT_IMAGE_BYTES, latency_ms=0.0):
+        self.image_bytes = image_bytes
+        self.latency_ms = latency_ms
+        self.generation = 0
+        self.last_modified = formatdate(time.time(), usegmt=True)
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "full": 0, "not_modified": 0, "bytes_sent": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def change_images(self):
+        """Makes every image (and its validators) change, as after new photos are uploaded."""
+        with self._lock:
+            self.generation += 1
+            self.last_modified = formatdate(time.time() + self.generation, usegmt=True)
+
+    def image(self, path):
+        """Content and ETag served for a path."""
+        name = posixpath.basename(path.split("?", 1)[0])
+        seed = hashlib.sha256(f"{self.generation}:{name}".encode()).digest()
+        content = (seed * (self.image_bytes // len(seed) + 1))[:self.image_bytes]
+        return content, f'"{seed.hex()[:16]}"'
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="photo-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path.rstrip("/") == "/stats":
+                    body = json.dumps(server.stats()).encode()
+                    self.send_response(200)
+                    self.send_header("Content-Type", "application/json")
+                    self.send_header("Content-Length", str(len(body)))
+                    self.end_headers()
+                    self.wfile.write(body)
+                    return
+                if server.latency_ms:
+                    time.sleep(server.latency_ms / 1000)
+                content, etag = server.image(self.path)
+                with server._lock:
+                    server._counts["requests"] += 1
+                    last_modified = server.last_modified
+                if self.headers.get("If-None-Match") == etag:
+                    with server._lock:
+                        server._counts["not_modified"] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.send_header("Content-Length", "0")
+                    self.end_headers()
+                    return
+                with server._lock:
+                    server._counts["full"] += 1
+                    server._counts["bytes_sent"] += len(content)
+                self.send_response(200)
+                self.send_header("Content-Type", "image/jpeg")
+                self.send_header("Content-Length", str(len(content)))
+                self.send_header("ETag", etag)
+                self.send_header("Last-Modified", last_modified)
+                self.end_headers()
+                self.wfile.write(content)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the realtor.ca photo CDN.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--image-bytes", type=int, default=DEFAULT_IMAGE_BYTES, help="Size of every image.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response.")
+    args = parser.parse_args()
+
+    server = PhotoServer(args.host, args.port, args.image_bytes, args.latency_ms)
+    print(f"Serving photos at {server.url} (Ctrl-C to stop).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,261 @@
+import argparse
+import bisect
+import copy
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLE_RESPONSE_PATH = os.path.join(REPO_ROOT, 'MapSearchAPI_Return.json')
+
+# Area the synthesized listings are spread over (Ottawa, around the recorded sample).
+DEFAULT_AREA = (45.25, -75.95, 45.55, -75.45)
+DEFAULT_LISTING_COUNT = 20000
+# The API pages through at most this many records of a search.
+MAX_RECORDS = 600
+# .NET ticks of the newest synthesized listing; older listings step back one minute each.
+_NEWEST_TICKS = 638835152343730000
+_TICKS_PER_MINUTE = 60 * 10 ** 7
+_BLOCK_PAGE = b"<html><head><title>Request unsuccessful</title></head><body>Incapsula incident</body></html>"
+
+
+class ListingCorpus:
+    """
+    The listings a ReplayServer answers from.
+
+    The Results of a recorded PropertySearch_Post response (MapSearchAPI_Return.json)
+    are replayed at their recorded position, and further listings are synthesized by
+    copying them with a new Id, MlsNumber, position, price and insertion date.
+    Every listing is serialized once up front, so answering a request costs little
+    more than a bbox lookup and a join.
+    """
+
+    def __init__(self, count=DEFAULT_LISTING_COUNT, area=DEFAULT_AREA, sample_path=SAMPLE_RESPONSE_PATH, seed=1):
+        """
+        Args:
+            count (int): Total number of listings, recorded ones included.
+            area (tuple): (lat_min, lon_min, lat_max, lon_max) the synthesized listings are spread over.
+            sample_path (str): Recorded response whose Results are replayed and used as templates.
+            seed (int): Seed of the synthesized positions and prices.
+        """
+        with open(sample_path, 'r') as f:
+            sample = json.load(f)
+        self.error_code = sample.get("ErrorCode", {"Id": 200})
+        templates = sample["Results"]
+        rng = random.Random(seed)
+        lat_min, lon_min, lat_max, lon_max = area
+
+        listings = [copy.deepcopy(listing) for listing in templates[:count]]
+        for number in range(len(listings), count):
+            listing = copy.deepcopy(templates[number % len(templates)])
+            listing_id = str(90000000 + number)
+            latitude = rng.uniform(lat_min, lat_max)
+            longitude = rng.uniform(lon_min, lon_max)
+            price = rng.randrange(250, 2500) * 1000
+            listing["Id"] = listing_id
+            listing["MlsNumber"] = f"B{listing_id}"
+            listing["Property"]["Address"]["Latitude"] = f"{latitude:.7f}"
+            listing["Property"]["Address"]["Longitude"] = f"{longitude:.7f}"
+            listing["Property"]["PriceUnformattedValue"] = str(price)
+            listing["Property"]["Price"] = f"${price:,}"
+            listings.append(listing)
+
+        # Index order is newest-first (the default 6-D sort).
+        entries = []
+        for rank, listing in enumerate(listings):
+            listing["InsertedDateUTC"] = str(_NEWEST_TICKS - rank * _TICKS_PER_MINUTE)
+            address = listing["Property"]["Address"]
+            latitude, longitude = float(address["Latitude"]), float(address["Longitude"])
+            pin = {"key": "", "propertyId": listing["Id"], "count": 1,
+                   "longitude": address["Longitude"], "latitude": address["Latitude"]}
+            entries.append((latitude, longitude, rank, json.dumps(listing).encode(), json.dumps(pin).encode()))
+        entries.sort()
+        self._latitudes = [entry[0] for entry in entries]
+        self._entries = entries
+        self.count = len(entries)
+
+    def search(self, lat_min, lon_min, lat_max, lon_max):
+        """Entries inside the bbox, newest first."""
+        start = bisect.bisect_left(self._latitudes, lat_min)
+        end = bisect.bisect_right(self._latitudes, lat_max)
+        found = [entry for entry in self._entries[start:end] if lon_min <= entry[1] <= lon_max]
+        found.sort(key=lambda entry: entry[2])
+        return found
+
+    def render(self, lat_min, lon_min, lat_max, lon_max, page=1, per_page=12):
+        """The response body for one page of a search, shaped like MapSearchAPI_Return.json."""
+        found = self.search(lat_min, lon_min, lat_max, lon_max)
+        showing = min(len(found), MAX_RECORDS)
+        start = (page - 1) * per_page
+        results = found[start:min(start + per_page, showing)] if start < showing else []
+        paging = {
+            "RecordsPerPage": per_page,
+            "CurrentPage": page,
+            "TotalRecords": len(found),
+            "MaxRecords": MAX_RECORDS,
+            "TotalPages": -(-showing // per_page) if per_page else 0,
+            "RecordsShowing": showing,
+            "Pins": len(found),
+        }
+        return b"".join((
+            b'{"ErrorCode": ', json.dumps(self.error_code).encode(),
+            b', "Paging": ', json.dumps(paging).encode(),
+            b', "Results": [', b", ".join(entry[3] for entry in results),
+            b'], "Pins": [', b", ".join(entry[4] for entry in found),
+            b'], "GroupingLevel": ""}',
+        ))
+
+
+class ReplayServer:
+    """
+    Local stand-in for api2.realtor.ca's PropertySearch_Post, for benchmarks and offline runs.
+
+    Answers form-encoded POSTs from a ListingCorpus with real paging and the
+    600-record cap. Latency (fixed plus uniform jitter) and 403 block pages
+    (a fraction `block_rate` of requests) can be injected. GET /stats returns
+    the request counters.
+    """
+
+    def __init__(self, corpus=None, host="127.0.0.1", port=0, latency_ms=0.0, jitter_ms=0.0,
+                 block_rate=0.0, seed=1):
+        """
+        Args:
+            corpus (ListingCorpus): Listings to serve; defaults to a ListingCorpus().
+            host (str): Interface to listen on.
+            port (int): Port to listen on; 0 picks a free one.
+            latency_ms (float): Delay added before every response.
+            jitter_ms (float): Extra uniformly distributed delay, up to this much.
+            block_rate (float): Fraction of requests answered with a 403 block page.
+            seed (int): Seed of the jitter and block decisions.
+        """
+        self.corpus = corpus or ListingCorpus()
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.block_rate = block_rate
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._counts = {"requests": 0, "blocked": 0, "bytes_sent": 0}
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}/Listing.svc/PropertySearch_Post"
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counts)
+
+    def reset_stats(self):
+        with self._lock:
+            for name in self._counts:
+                self._counts[name] = 0
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="replay-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self):
+        self._httpd.serve_forever()
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def _decide(self):
+        """Returns (delay in seconds, blocked) for the next request."""
+        with self._lock:
+            self._counts["requests"] += 1
+            delay = (self.latency_ms + self._rng.uniform(0, self.jitter_ms)) / 1000
+            blocked = self.block_rate > 0 and self._rng.random() < self.block_rate
+            if blocked:
+                self._counts["blocked"] += 1
+        return delay, blocked
+
+    def _answer(self, form):
+        """Response body for a parsed PropertySearch_Post form."""
+        lat_min, lat_max = sorted((float(form["LatitudeMin"]), float(form["LatitudeMax"])))
+        lon_min, lon_max = sorted((float(form["LongitudeMin"]), float(form["LongitudeMax"])))
+        return self.corpus.render(lat_min, lon_min, lat_max, lon_max,
+                                  page=int(form.get("CurrentPage", 1)), per_page=int(form.get("RecordsPerPage", 12)))
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, like the real endpoint.
+
+            def log_message(self, format, *args):
+                pass
+
+            def _send(self, status, content_type, body):
+                self.send_response(status)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+                with server._lock:
+                    server._counts["bytes_sent"] += len(body)
+
+            def do_GET(self):
+                if self.path.rstrip("/") != "/stats":
+                    self._send(404, "text/plain", b"Not found")
+                    return
+                self._send(200, "application/json", json.dumps(server.stats()).encode())
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers.get("Content-Length") or 0)).decode()
+                delay, blocked = server._decide()
+                if delay > 0:
+                    time.sleep(delay)
+                if blocked:
+                    self._send(403, "text/html", _BLOCK_PAGE)
+                    return
+                form = {name: values[0] for name, values in parse_qs(body).items()}
+                try:
+                    answer = server._answer(form)
+                except (KeyError, ValueError) as e:
+                    self._send(400, "application/json", json.dumps({"ErrorCode": {"Id": 400, "Description": str(e)}}).encode())
+                    return
+                self._send(200, "application/json; charset=utf-8", answer)
+
+        return Handler
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stand-in for the realtor.ca PropertySearch_Post API.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--listings", type=int, default=DEFAULT_LISTING_COUNT, help="Number of listings served.")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="Delay added to every response.")
+    parser.add_argument("--jitter-ms", type=float, default=0.0, help="Extra random delay, up to this much.")
+    parser.add_argument("--block-rate", type=float, default=0.0, help="Fraction of requests answered with a 403.")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    server = ReplayServer(ListingCorpus(args.listings, seed=args.seed), args.host, args.port,
+                          args.latency_ms, args.jitter_ms, args.block_rate, args.seed)
+    print(f"Serving {server.corpus.count} listings at {server.url} (Ctrl-C to stop).")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
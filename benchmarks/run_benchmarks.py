@@ -0,0 +1,338 @@
+import argparse
+import contextlib
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+BENCHMARKS_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_ROOT = os.path.dirname(BENCHMARKS_DIR)
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, 'map_drawer_app'))
+
+import realtor_client
+from cookie_provider import StaticCookieProvider
+from crawl_jobs import JobManager
+from listing_export import ListingColumns, shape_statistics
+from listing_parser import compare_parsing, parse_listing_stream
+from rate_limiter import AdaptiveConcurrency, RateLimiter
+from realtor_client import RealtorClient, fetch_property_listings
+from replay_server import DEFAULT_AREA, ListingCorpus, ReplayServer
+
+DEFAULT_RESULTS_DIR = os.path.join(BENCHMARKS_DIR, 'results')
+# Polygon (lat, lon ring) for the end-to-end benchmark: a skewed quadrilateral inside DEFAULT_AREA.
+BENCHMARK_POLYGON = [[45.30, -75.90], [45.50, -75.80], [45.48, -75.55], [45.32, -75.60]]
+# Metrics compared against a baseline run, with whether higher is better.
+HEADLINE_METRICS = {
+    "fetch.requests_per_second": True,
+    "fetch.latency_p50_ms": False,
+    "polygon.seconds": False,
+    "polygon.listings_per_second": True,
+    "parse.full_dict.ms_per_mb": False,
+    "parse.streaming.ms_per_mb": False,
+    "memory.full_dict.bytes_per_10k": False,
+    "memory.streaming.bytes_per_10k": False,
+    "export.load_seconds": False,
+    "export.aggregate_seconds": False,
+}
+
+
+def make_client(server, concurrency, max_retries=4):
+    """Client for the replay server: fixed cookie, no shared token bucket, fast backoff."""
+    limiter = RateLimiter(
+        None, AdaptiveConcurrency(initial=concurrency, minimum=1, maximum=concurrency),
+        max_retries=max_retries, backoff_base_seconds=0.01, backoff_max_seconds=0.1
+    )
+    return RealtorClient(server.url, cookie_provider=StaticCookieProvider("benchmark=1"),
+                         pool_maxsize=max(concurrency, 1), rate_limiter=limiter)
+
+
+@contextlib.contextmanager
+def quiet(enabled=True):
+    """Silences the per-request progress prints, which would otherwise dominate the timings."""
+    if not enabled:
+        yield
+        return
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def random_bbox(rng, area=DEFAULT_AREA, size=0.02):
+    lat_min, lon_min, lat_max, lon_max = area
+    lat = rng.uniform(lat_min, lat_max - size)
+    lon = rng.uniform(lon_min, lon_max - size)
+    return lat, lon, lat + size, lon + size
+
+
+def bench_fetch(server, requests=400, concurrency=8, seed=1):
+    """Requests per second through fetch_property_listings, with `concurrency` callers."""
+    client = make_client(server, concurrency)
+    # fetch_property_listings always goes through the process-wide client.
+    realtor_client._default_client = client
+    rng = random.Random(seed)
+    queries = [(random_bbox(rng), rng.randint(1, 3)) for _ in range(requests)]
+    server.reset_stats()
+
+    def run(query):
+        (lat_min, lon_min, lat_max, lon_max), page = query
+        started = time.perf_counter()
+        response = fetch_property_listings(lat_max, lon_max, lat_min, lon_min, page_number=page)
+        return time.perf_counter() - started, response is not None
+
+    try:
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            outcomes = list(pool.map(run, queries))
+        seconds = time.perf_counter() - started
+    finally:
+        realtor_client._default_client = None
+        client.close()
+    latencies = sorted(duration * 1000 for duration, _ in outcomes)
+    percentiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "seconds": seconds,
+        "requests_per_second": requests / seconds,
+        "failed": sum(1 for _, ok in outcomes if not ok),
+        "latency_p50_ms": percentiles[49],
+        "latency_p99_ms": percentiles[98],
+        "server": server.stats(),
+    }
+
+
+def bench_polygon(server, polygon=BENCHMARK_POLYGON, workers=4, concurrency=8, tolerance=0.0):
+    """
+    End-to-end time from a drawn polygon to its listings, along the map app's path:
+    /api/process_polygon decomposes the polygon into rectangles, and a JobManager
+    crawls them and streams the listings back.
+    """
+    from app import app
+
+    client = make_client(server, concurrency)
+    manager = JobManager(workers=workers, client=client)
+    server.reset_stats()
+    try:
+        started = time.perf_counter()
+        response = app.test_client().post('/api/process_polygon', json={
+            "polygon": polygon, "optimize": True, "tolerance": tolerance
+        })
+        rectangles = [(r['lat_min'], r['lon_min'], r['lat_max'], r['lon_max']) for r in response.get_json()['rectangles']]
+        decomposed = time.perf_counter()
+        job = manager.submit(rectangles)
+        listing_ids = set()
+        first_listing = None
+        seq = 0
+        while not job.done:
+            for event in job.events_after(seq, timeout=1):
+                seq = event["seq"]
+                if event["type"] == "listings":
+                    if first_listing is None:
+                        first_listing = time.perf_counter()
+                    listing_ids.update(listing["id"] for listing in event["listings"])
+        seconds = time.perf_counter() - started
+    finally:
+        manager.shutdown(wait=False)
+        client.close()
+    return {
+        "rectangles": len(rectangles),
+        "listings": len(listing_ids),
+        "seconds": seconds,
+        "decompose_seconds": decomposed - started,
+        "first_listings_seconds": first_listing - started if first_listing else None,
+        "listings_per_second": len(listing_ids) / seconds,
+        "failed_rectangles": job.failed_rectangles,
+        "server": server.stats(),
+    }
+
+
+def bench_parse(corpus, repeat=20):
+    """Parse cost per MB of the full json.loads path and the streaming projection, on recorded and synthesized pages."""
+    lat_min, lon_min, lat_max, lon_max = DEFAULT_AREA
+    bodies = {
+        "recorded_page": None,
+        "page_600": corpus.render(lat_min, lon_min, lat_max, lon_max, page=1, per_page=600),
+    }
+    report = {}
+    for name, body in bodies.items():
+        path = os.path.join(REPO_ROOT, 'MapSearchAPI_Return.json')
+        if body is not None:
+            with tempfile.NamedTemporaryFile('wb', suffix='.json', delete=False) as f:
+                f.write(body)
+            path = f.name
+        try:
+            comparison = compare_parsing(path, repeat=repeat)
+        finally:
+            if body is not None:
+                os.remove(path)
+        megabytes = comparison["body_bytes"] / 1e6
+        report[name] = {"body_bytes": comparison["body_bytes"]}
+        for mode in ("full_dict", "streaming"):
+            report[name][mode] = dict(comparison[mode], ms_per_mb=comparison[mode]["ms_per_parse"] / megabytes)
+    # Headline numbers: the 600-listing page, the largest one a search returns.
+    for mode in ("full_dict", "streaming"):
+        report[mode] = {"ms_per_mb": report["page_600"][mode]["ms_per_mb"]}
+    return report
+
+
+def bench_memory(corpus, listings=10000):
+    """Memory held per 10k listings as full response dicts and as streamed Listing projections."""
+    entries = corpus.search(*DEFAULT_AREA)[:listings]
+    body = b'{"ErrorCode": {"Id": 200}, "Paging": {}, "Results": [' + b", ".join(e[3] for e in entries) + b'], "Pins": []}'
+    chunk_size = 64 * 1024
+
+    def full_dict():
+        return json.loads(body)["Results"]
+
+    def streaming():
+        return parse_listing_stream(body[i:i + chunk_size] for i in range(0, len(body), chunk_size)).listings
+
+    report = {"listings": len(entries), "body_bytes": len(body)}
+    for name, parse in (("full_dict", full_dict), ("streaming", streaming)):
+        tracemalloc.start()
+        parsed = parse()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del parsed
+        report[name] = {
+            "retained_bytes": retained,
+            "peak_bytes": peak,
+            "bytes_per_10k": retained * 10000 / max(len(entries), 1),
+        }
+    return report
+
+
+def bench_export(corpus, listings=100000, shape_count=36, seed=1):
+    """Columnar export of `listings` listings (the corpus repeated), reload, and per-shape price statistics."""
+    entries = corpus.search(*DEFAULT_AREA)
+    results = [json.loads(entry[3]) for entry in entries]
+    results = (results * (listings // max(len(results), 1) + 1))[:listings]
+    rng = random.Random(seed)
+    shapes = []
+    for number in range(shape_count):
+        lat_min, lon_min, lat_max, lon_max = random_bbox(rng, size=0.05)
+        shapes.append({"id": number, "name": f"shape {number}", "polygon": [
+            [lat_min, lon_min], [lat_max, lon_min + 0.01], [lat_max - 0.01, lon_max], [lat_min + 0.01, lon_max - 0.01]
+        ]})
+
+    started = time.perf_counter()
+    columns = ListingColumns.from_listings(results)
+    built = time.perf_counter()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "listings.npz")
+        columns.save(path)
+        saved = time.perf_counter()
+        columns = ListingColumns.load(path)
+        loaded = time.perf_counter()
+        statistics_by_shape = shape_statistics(columns, shapes)
+        aggregated = time.perf_counter()
+        file_bytes = os.path.getsize(path)
+    return {
+        "listings": len(columns),
+        "shapes": len(statistics_by_shape),
+        "build_seconds": built - started,
+        "save_seconds": saved - built,
+        "load_seconds": loaded - saved,
+        "aggregate_seconds": aggregated - loaded,
+        "file_bytes": file_bytes,
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def headline(results):
+    """Flattens HEADLINE_METRICS out of a results dict; missing ones are skipped."""
+    values = {}
+    for dotted in HEADLINE_METRICS:
+        value = results.get("benchmarks", {})
+        for key in dotted.split("."):
+            value = value.get(key) if isinstance(value, dict) else None
+        if isinstance(value, (int, float)):
+            values[dotted] = value
+    return values
+
+
+def compare(results, baseline):
+    """Prints the headline metrics next to a baseline run, flagging changes for the worse."""
+    current, previous = headline(results), headline(baseline)
+    print(f"\nCompared with {baseline.get('revision') or 'baseline'} ({baseline.get('timestamp')}):")
+    for name, higher_is_better in HEADLINE_METRICS.items():
+        if name not in current or not previous.get(name):
+            continue
+        change = (current[name] - previous[name]) / previous[name] * 100
+        worse = change < 0 if higher_is_better else change > 0
+        print(f"  {name:<34} {previous[name]:>14.2f} -> {current[name]:>14.2f}  {change:+6.1f}%"
+              f"{'  (worse)' if worse and abs(change) >= 5 else ''}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline benchmarks against a local replay of PropertySearch_Post.")
+    parser.add_argument("--only", nargs="+", choices=("fetch", "polygon", "parse", "memory", "export"),
+                        help="Benchmarks to run (default: all).")
+    parser.add_argument("--listings", type=int, default=20000, help="Listings served by the replay server.")
+    parser.add_argument("--latency-ms", type=float, default=20.0, help="Simulated server latency.")
+    parser.add_argument("--jitter-ms", type=float, default=10.0, help="Extra random server latency, up to this much.")
+    parser.add_argument("--block-rate", type=float, default=0.0, help="Fraction of requests answered with a 403.")
+    parser.add_argument("--requests", type=int, default=400, help="Requests made by the fetch benchmark.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Requests in flight.")
+    parser.add_argument("--output", help="Results file (default: benchmarks/results/<timestamp>.json).")
+    parser.add_argument("--baseline", help="Earlier results file to compare against.")
+    parser.add_argument("--verbose", action="store_true", help="Keep the client's per-request output.")
+    args = parser.parse_args()
+    selected = args.only or ["fetch", "polygon", "parse", "memory", "export"]
+
+    print(f"Building a corpus of {args.listings} listings...")
+    corpus = ListingCorpus(args.listings)
+    server = ReplayServer(corpus, latency_ms=args.latency_ms, jitter_ms=args.jitter_ms, block_rate=args.block_rate)
+    results = {
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "revision": git_revision(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "settings": {name: value for name, value in vars(args).items() if name not in ("output", "baseline", "verbose")},
+        "benchmarks": {},
+    }
+    with server:
+        for name in selected:
+            print(f"Running {name} benchmark...")
+            with quiet(not args.verbose):
+                if name == "fetch":
+                    report = bench_fetch(server, args.requests, args.concurrency)
+                elif name == "polygon":
+                    report = bench_polygon(server, concurrency=args.concurrency)
+                elif name == "parse":
+                    report = bench_parse(corpus)
+                elif name == "memory":
+                    report = bench_memory(corpus)
+                else:
+                    report = bench_export(corpus)
+            results["benchmarks"][name] = report
+
+    for name, value in headline(results).items():
+        print(f"  {name:<34} {value:>14.2f}")
+    output = args.output or os.path.join(DEFAULT_RESULTS_DIR, time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {output}")
+
+    if args.baseline:
+        with open(args.baseline, 'r') as f:
+            compare(results, json.load(f))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,301 @@
+import queue
+import threading
+import time
+
+from cookie_retriever import (
+    INITIAL_REALTOR_PAGE_URL,
+    REALTOR_API_URL,
+    REALTOR_PAYLOAD_FOR_FETCH,
+    select_realtor_cookie,
+)
+from metrics import timed
+
+# How long a captured cookie is trusted, and how long before expiry a background
+# refresh is started so callers never have to wait on the browser.
+DEFAULT_COOKIE_TTL_SECONDS = 15 * 60
+DEFAULT_REFRESH_AHEAD_SECONDS = 2 * 60
+DEFAULT_REFRESH_WAIT_SECONDS = 60
+# Background refreshes after a failed capture wait 30 s, then 60 s, ... up to 15 min.
+FAILURE_BACKOFF_SECONDS = 30
+MAX_FAILURE_BACKOFF_SECONDS = 15 * 60
+
+_STOP = object()
+
+
+class _BrowserSession:
+    """
+    A warm Playwright browser context used to (re)capture the Realtor.ca cookie.
+
+    Playwright's sync API is bound to the thread that started it, so an instance
+    must only ever be used from the CookieProvider's browser thread.
+    """
+
+    def __init__(self, headless=True):
+        self.headless = headless
+        self._playwright = None
+        self._browser = None
+        self._context = None
+        self._page = None
+
+    def _start(self):
+        # Imported here so processes that never need a browser don't pay Playwright's import cost.
+        from playwright.sync_api import sync_playwright
+
+        print("Launching browser for cookie provider...")
+        self._playwright = sync_playwright().start()
+        self._browser = self._playwright.chromium.launch(headless=self.headless)
+        self._context = self._browser.new_context()
+        self._page = self._context.new_page()
+        self._page.goto(INITIAL_REALTOR_PAGE_URL, wait_until="networkidle", timeout=30000)
+        print("Browser is warm.")
+
+    def capture_cookie(self, reset=False):
+        """
+        Returns a fresh cookie string from the warm context, launching the browser if needed.
+
+        Args:
+            reset (bool): Drop the context's cookies first, e.g. after the server rejected them.
+        """
+        if self._page is None:
+            self._start()
+        else:
+            if reset:
+                self._context.clear_cookies()
+            self._page.reload(wait_until="networkidle", timeout=30000)
+
+        # A real search from inside the page makes Incapsula issue/renew its cookies.
+        response = self._page.request.post(
+            REALTOR_API_URL,
+            headers={'Content-Type': 'application/x-www-form-urlencoded; charset=UTF-8'},
+            data=REALTOR_PAYLOAD_FOR_FETCH
+        )
+        if not response.ok:
+            print(f"Cookie provider warm-up request failed with status: {response.status}")
+        return select_realtor_cookie(self._context.cookies())
+
+    def close(self):
+        try:
+            if self._browser:
+                self._browser.close()
+            if self._playwright:
+                self._playwright.stop()
+        except Exception as e:
+            print(f"Error while closing cookie provider browser: {e}")
+        finally:
+            self._playwright = self._browser = self._context = self._page = None
+
+
+class CookieProvider:
+    """
+    Serves the Realtor.ca cookie from memory and keeps it fresh in the background.
+
+    The cookie is cached with a TTL. Once it enters the refresh-ahead window a
+    background refresh is started while callers keep receiving the cached value;
+    callers only block when there is no usable cookie at all. All refreshes run on
+    a single browser thread that keeps its Playwright context alive between
+    refreshes, and concurrent callers share the refresh that is already in flight.
+    """
+
+    def __init__(self, ttl_seconds=DEFAULT_COOKIE_TTL_SECONDS,
+                 refresh_ahead_seconds=DEFAULT_REFRESH_AHEAD_SECONDS,
+                 refresh_wait_seconds=DEFAULT_REFRESH_WAIT_SECONDS,
+                 headless=True):
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ahead_seconds = min(refresh_ahead_seconds, ttl_seconds)
+        self.refresh_wait_seconds = refresh_wait_seconds
+        self.headless = headless
+
+        # (cookie, expires_at) is swapped as a single tuple so the fast path can read it without locking.
+        self._state = (None, 0.0)
+        self._last_used = 0.0
+        self._failures = 0
+        self._retry_at = 0.0  # No background refresh before this (monotonic) time after failed captures.
+        self._lock = threading.Lock()
+        self._inflight = None  # threading.Event of the refresh currently queued or running
+        self._reset_requested = False
+        self._requests = queue.Queue()
+        self._thread = None
+        self._closed = False
+
+    def get_cookie(self, wait=True):
+        """
+        Returns the current cookie, refreshing it through the browser only when needed.
+
+        After a failed capture no new refresh is started until the failure backoff
+        (doubling from FAILURE_BACKOFF_SECONDS) has passed; meanwhile the cached
+        cookie is returned while it is valid, and None otherwise.
+
+        Args:
+            wait (bool): Block (up to refresh_wait_seconds) when no valid cookie is cached.
+
+        Returns:
+            str: The cookie as "name=value", or None if none could be captured.
+        """
+        now = time.monotonic()
+        self._last_used = now
+        cookie, expires_at = self._state
+        if cookie and now < expires_at - self.refresh_ahead_seconds:
+            return cookie
+        if now < self._retry_at:
+            # A capture failed recently; don't relaunch the browser before the backoff ends.
+            return cookie if cookie and now < expires_at else None
+
+        with self._lock:
+            done = self._request_refresh_locked()
+        if cookie and now < expires_at:
+            return cookie  # Still valid; the refresh happens in the background.
+        if not wait:
+            return None
+        done.wait(self.refresh_wait_seconds)
+        return self._valid_cookie()
+
+    def invalidate(self, rejected_cookie=None):
+        """
+        Marks the cached cookie as rejected and schedules a refresh with cleared browser cookies.
+
+        Args:
+            rejected_cookie (str): The cookie the server rejected. If the cache already holds a
+                different (newer) cookie, nothing is invalidated.
+        """
+        with self._lock:
+            cookie, _ = self._state
+            if rejected_cookie is not None and cookie != rejected_cookie:
+                return
+            self._state = (None, 0.0)
+            self._reset_requested = True
+            if time.monotonic() >= self._retry_at:
+                self._request_refresh_locked()
+
+    def close(self):
+        """Stops the browser thread and closes the warm browser."""
+        with self._lock:
+            self._closed = True
+            thread = self._thread
+        if thread is not None:
+            self._requests.put(_STOP)
+            thread.join(timeout=10)
+
+    def _valid_cookie(self):
+        cookie, expires_at = self._state
+        if cookie and time.monotonic() < expires_at:
+            return cookie
+        return None
+
+    def _request_refresh_locked(self, enqueue=True):
+        """Returns the Event of the in-flight refresh, queueing a new one if none exists. Caller holds _lock."""
+        if self._closed:
+            closed = threading.Event()
+            closed.set()
+            return closed
+        if self._inflight is None:
+            self._inflight = threading.Event()
+            if enqueue:
+                self._ensure_thread_locked()
+                self._requests.put(self._inflight)
+        return self._inflight
+
+    def _ensure_thread_locked(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="realtor-cookie-provider", daemon=True)
+            self._thread.start()
+
+    def _seconds_until_proactive_refresh(self):
+        """
+        Time until the refresh-ahead point (or the end of the failure backoff), or None.
+
+        None means no refresh ahead: when idle, when nothing is cached, or when the
+        cached cookie has already expired, in which case the next get_cookie() call
+        asks for the refresh.
+        """
+        cookie, expires_at = self._state
+        now = time.monotonic()
+        if not cookie or now >= expires_at or now - self._last_used > self.ttl_seconds:
+            return None
+        return max(0.0, expires_at - self.refresh_ahead_seconds - now, self._retry_at - now)
+
+    def _run(self):
+        session = _BrowserSession(headless=self.headless)
+        try:
+            while True:
+                try:
+                    done = self._requests.get(timeout=self._seconds_until_proactive_refresh())
+                except queue.Empty:
+                    with self._lock:
+                        done = self._request_refresh_locked(enqueue=False)
+                if done is _STOP:
+                    break
+                if done.is_set():
+                    continue  # Already served by an earlier refresh.
+                self._refresh(session, done)
+        finally:
+            session.close()
+
+    def _refresh(self, session, done):
+        with self._lock:
+            reset, self._reset_requested = self._reset_requested, False
+        cookie = None
+        try:
+            started = time.monotonic()
+            with timed("cookie_refresh"):
+                cookie = session.capture_cookie(reset=reset)
+            if cookie:
+                print(f"Cookie provider refreshed cookie in {time.monotonic() - started:.2f}s.")
+            else:
+                print("Cookie provider failed to capture a relevant cookie for Realtor.ca.")
+        except Exception as e:
+            print(f"Cookie provider refresh failed: {e}")
+            session.close()  # Relaunch from scratch on the next refresh.
+        with self._lock:
+            if cookie:
+                self._state = (cookie, time.monotonic() + self.ttl_seconds)
+                self._failures = 0
+                self._retry_at = 0.0
+            else:
+                self._failures += 1
+                backoff = min(MAX_FAILURE_BACKOFF_SECONDS, FAILURE_BACKOFF_SECONDS * 2 ** (self._failures - 1))
+                self._retry_at = time.monotonic() + backoff
+            self._inflight = None
+            done.set()
+
+
+class StaticCookieProvider:
+    """Provider with a fixed cookie, for local test servers and cookies captured elsewhere."""
+
+    def __init__(self, cookie):
+        self.cookie = cookie
+
+    def get_cookie(self, wait=True):
+        return self.cookie
+
+    def invalidate(self, rejected_cookie=None):
+        pass  # Nothing to refresh; the same cookie is used again.
+
+    def close(self):
+        pass
+
+
+_default_provider = None
+_default_provider_lock = threading.Lock()
+
+
+def get_default_provider():
+    """Returns the process-wide CookieProvider, creating it on first use."""
+    global _default_provider
+    with _default_provider_lock:
+        if _default_provider is None:
+            _default_provider = CookieProvider()
+        return _default_provider
+
+
+def get_cookie():
+    """Returns the cookie from the process-wide CookieProvider."""
+    return get_default_provider().get_cookie()
+
+
+if __name__ == '__main__':
+    provider = CookieProvider()
+    for attempt in range(3):
+        started = time.perf_counter()
+        cookie = provider.get_cookie()
+        print(f"Attempt {attempt + 1}: {cookie} ({(time.perf_counter() - started) * 1000:.3f} ms)")
+    provider.close()
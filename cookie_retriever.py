@@ -1,11 +1,46 @@
-import requests
-import json
-from playwright.sync_api import sync_playwright
+from metrics import RECORDER
+
+REALTOR_API_URL = "https://api2.realtor.ca/Listing.svc/PropertySearch_Post"
+REALTOR_PAYLOAD_FOR_FETCH = "ZoomLevel=15&LatitudeMax=45.43411&LongitudeMax=-75.68209&LatitudeMin=45.41715&LongitudeMin=-75.72110&Sort=6-D&PropertyTypeGroupID=1&TransactionTypeId=2&PropertySearchTypeId=0&Currency=CAD&IncludeHiddenListings=false&RecordsPerPage=12&ApplicationId=1&CultureId=1&Version=7.0&CurrentPage=1"
+INITIAL_REALTOR_PAGE_URL = "https://www.realtor.ca/map#ZoomLevel=15&Center=45.425629%2C-75.701596&LatitudeMax=45.43411&LongitudeMax=-75.68209&LatitudeMin=45.41715&LongitudeMin=-75.72110&Sort=6-D&PropertyTypeGroupID=1&TransactionTypeId=2&PropertySearchTypeId=0&Currency=CAD"
+
+def select_realtor_cookie(all_cookies):
+    """
+    Picks the cookie to send with PropertySearch_Post from a browser context's cookies.
+
+    Incapsula security cookies (visid_incap, nlbi_, incap_ses) are preferred; a
+    general session cookie is used only if none of those are present.
+
+    Args:
+        all_cookies (list): Cookie dicts as returned by Playwright's context.cookies().
+
+    Returns:
+        str: The cookie as "name=value", or None if no relevant cookie was found.
+    """
+    for cookie in all_cookies:
+        # Prioritize cookies that seem relevant for session/tracking
+        if "realtor.ca" in cookie['domain']:
+            if "visid_incap" in cookie['name'] or "nlbi_" in cookie['name'] or "incap_ses" in cookie['name']:
+                return f"{cookie['name']}={cookie['value']}"
+
+    # If no specific security cookie is found, try to get a general session cookie
+    for cookie in all_cookies:
+        if "realtor.ca" in cookie['domain'] and "ASP.NET_SessionId" in cookie['name']:
+            return f"{cookie['name']}={cookie['value']}"
+        elif "realtor.ca" in cookie['domain'] and "realtor.ca_session" in cookie['name']:
+            return f"{cookie['name']}={cookie['value']}"
+    return None
 
 def get_realtor_cookie():
-    realtor_api_url = "https://api2.realtor.ca/Listing.svc/PropertySearch_Post"
-    realtor_payload_for_fetch = "ZoomLevel=15&LatitudeMax=45.43411&LongitudeMax=-75.68209&LatitudeMin=45.41715&LongitudeMin=-75.72110&Sort=6-D&PropertyTypeGroupID=1&TransactionTypeId=2&PropertySearchTypeId=0&Currency=CAD&IncludeHiddenListings=false&RecordsPerPage=12&ApplicationId=1&CultureId=1&Version=7.0&CurrentPage=1"
-    initial_realtor_page_url = "https://www.realtor.ca/map#ZoomLevel=15&Center=45.425629%2C-75.701596&LatitudeMax=45.43411&LongitudeMax=-75.68209&LatitudeMin=45.41715&LongitudeMin=-75.72110&Sort=6-D&PropertyTypeGroupID=1&TransactionTypeId=2&PropertySearchTypeId=0&Currency=CAD"
+    # Playwright takes a noticeable time to import; only pay for it when a browser is launched.
+    from playwright.sync_api import sync_playwright
+
+    # The intercepted request, the response and the cookie are only kept when this run is sampled
+    # for capture (see 'capture' in config.json); they are written in the background.
+    capture = RECORDER.sampled()
+    realtor_api_url = REALTOR_API_URL
+    realtor_payload_for_fetch = REALTOR_PAYLOAD_FOR_FETCH
+    initial_realtor_page_url = INITIAL_REALTOR_PAGE_URL
 
     js_script_to_trigger_fetch = f"""
     fetch('{realtor_api_url}', {{
@@ -30,16 +65,10 @@ def get_realtor_cookie():
             def handle_request(request):
                 if "PropertySearch_Post" in request.url:
                     print(f"Intercepted PropertySearch_Post request to: {request.url}")
-                    # Save request headers
-                    with open("property_search_request_headers.json", "w") as f:
-                        json.dump(request.headers, f, indent=4)
-                    print("Saved request headers to property_search_request_headers.json")
-                    # Save request body (since it's a POST with a known payload)
-                    with open("property_search_request_body.txt", "w") as f:
-                        f.write(request.post_data)
-                    print("Saved request body to property_search_request_body.txt")
+                    RECORDER.record("cookie_request", {"headers": request.headers, "body": request.post_data})
 
-            page.on("request", handle_request)
+            if capture:
+                page.on("request", handle_request)
 
             print(f"Navigating to initial page: {initial_realtor_page_url}")
             page.goto(initial_realtor_page_url, wait_until="networkidle", timeout=30000)
@@ -59,50 +88,25 @@ def get_realtor_cookie():
             # Process the response directly
             if response.ok:
                 print(f"PropertySearch_Post response received with status: {response.status}")
-                # Save response headers
-                with open("property_search_response_headers.json", "w") as f:
-                    json.dump(response.headers, f, indent=4)
-                print("Saved response headers to property_search_response_headers.json")
-                # Save response body
-                try:
-                    response_body = response.json()
-                    with open("property_search_response_body.json", "w") as f:
-                        json.dump(response_body, f, indent=4)
-                    print("Saved response body to property_search_response_body.json")
-                except Exception as e:
-                    print(f"Could not parse response body as JSON: {e}")
-                    with open("property_search_response_body.txt", "w") as f:
-                        f.write(response.text())
-                    print("Saved response body as text to property_search_response_body.txt")
+                if capture:
+                    try:
+                        response_body = response.json()
+                    except Exception as e:
+                        print(f"Could not parse response body as JSON: {e}")
+                        response_body = response.text()
+                    RECORDER.record("cookie_response", {"headers": response.headers, "body": response_body})
             else:
                 print(f"PropertySearch_Post request failed with status: {response.status}")
                 print(f"Response text: {response.text()}")
 
             # Retrieve all cookies from the browser context after the request
             all_cookies = page.context.cookies()
-            captured_cookie = None
-            for cookie in all_cookies:
-                # Prioritize cookies that seem relevant for session/tracking
-                if "realtor.ca" in cookie['domain']:
-                    if "visid_incap" in cookie['name'] or "nlbi_" in cookie['name'] or "incap_ses" in cookie['name']:
-                        captured_cookie = f"{cookie['name']}={cookie['value']}"
-                        break
-            
-            # If no specific security cookie is found, try to get a general session cookie
-            if not captured_cookie:
-                for cookie in all_cookies:
-                    if "realtor.ca" in cookie['domain'] and "ASP.NET_SessionId" in cookie['name']:
-                        captured_cookie = f"{cookie['name']}={cookie['value']}"
-                        break
-                    elif "realtor.ca" in cookie['domain'] and "realtor.ca_session" in cookie['name']:
-                        captured_cookie = f"{cookie['name']}={cookie['value']}"
-                        break
+            captured_cookie = select_realtor_cookie(all_cookies)
 
             if captured_cookie:
                 print(f"Successfully captured cookie: {captured_cookie}")
-                with open("realtor_cookie.txt", "w") as f:
-                    f.write(captured_cookie)
-                print("Saved captured cookie to realtor_cookie.txt")
+                if capture:
+                    RECORDER.record("cookie", {"cookie": captured_cookie})
                 return captured_cookie
             else:
                 print("Failed to capture a relevant cookie for Realtor.ca.")
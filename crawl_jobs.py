@@ -0,0 +1,233 @@
+import asyncio
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+
+from listing_store import SUMMARY_COLUMNS, listing_row
+from quadtree_crawler import crawl_bbox
+from realtor_client import get_default_client
+
+DEFAULT_JOB_WORKERS = 4
+# Listings are streamed to subscribers in batches of this size.
+LISTING_BATCH_SIZE = 50
+# Finished jobs (and their event logs) are kept this long for late or reconnecting subscribers.
+JOB_RETENTION_SECONDS = 15 * 60
+
+
+def listing_summary(listing):
+    """Compact dict of a 'Results' entry for streaming to the map, or None if it has no Id."""
+    row = listing_row(listing)
+    if row is None:
+        return None
+    return dict(zip(SUMMARY_COLUMNS, row), relative_url=listing.get("RelativeDetailsURL"))
+
+
+class CrawlJob:
+    """
+    One shape's crawl: a list of rectangles and an append-only log of events.
+
+    Events are dicts with a sequence number 'seq' and a 'type' of 'progress',
+    'listings' or 'done'. Subscribers read them with events_after(), which
+    blocks until something newer than the last seen sequence number exists.
+    """
+
+    def __init__(self, rectangles, shape_id=None, name=None):
+        self.id = uuid.uuid4().hex
+        self.shape_id = shape_id
+        self.name = name
+        self.rectangles = list(rectangles)
+        self.status = "queued"
+        self.created = time.time()
+        self.finished = None
+        self.listing_count = 0
+        self.failed_rectangles = 0
+        self._pending = deque(enumerate(self.rectangles))
+        self._running = 0
+        self._completed = 0
+        self._events = []
+        self._seq = itertools.count(1)
+        self._cond = threading.Condition()
+
+    def emit(self, event_type, **data):
+        with self._cond:
+            self._events.append(dict(data, seq=next(self._seq), type=event_type))
+            self._cond.notify_all()
+
+    def events_after(self, seq, timeout=None):
+        """Returns events with a sequence number above `seq`, waiting up to `timeout` seconds for one."""
+        with self._cond:
+            self._cond.wait_for(lambda: self._events and self._events[-1]["seq"] > seq, timeout)
+            return [event for event in self._events if event["seq"] > seq]
+
+    @property
+    def done(self):
+        return self.status in ("done", "cancelled")
+
+    def to_dict(self):
+        return {
+            "jobId": self.id,
+            "shapeId": self.shape_id,
+            "name": self.name,
+            "status": self.status,
+            "rectangles": len(self.rectangles),
+            "completed": self._completed,
+            "failed": self.failed_rectangles,
+            "listings": self.listing_count,
+        }
+
+
+class JobManager:
+    """
+    Runs crawl jobs on a bounded pool of worker threads.
+
+    Work is scheduled one rectangle at a time, round-robin across the active
+    jobs, so a large job never holds every worker while a smaller one (for
+    example another user's) waits behind it. Each rectangle is crawled with
+    quadtree_crawler.crawl_bbox and its listings are emitted in batches as they
+    arrive, and optionally upserted into a ListingStore.
+    """
+
+    def __init__(self, workers=DEFAULT_JOB_WORKERS, client=None, store=None, **fetch_kwargs):
+        self.workers = max(1, workers)
+        self.client = client
+        self.store = store
+        self.fetch_kwargs = fetch_kwargs
+        self._jobs = {}
+        self._ready = deque()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+        self._stopped = False
+
+    def submit(self, rectangles, shape_id=None, name=None):
+        """Queues a crawl of the given (lat_min, lon_min, lat_max, lon_max) rectangles and returns the CrawlJob."""
+        job = CrawlJob(rectangles, shape_id, name)
+        job.emit("progress", **job.to_dict())
+        with self._lock:
+            self._prune()
+            self._jobs[job.id] = job
+            if job.rectangles:
+                self._ready.append(job)
+                self._wakeup.notify()
+            self._start_workers()
+        if not job.rectangles:
+            self._finish(job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def cancel(self, job_id):
+        """Drops a job's queued rectangles; rectangles already running finish normally."""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None or job.done:
+                return False
+            job._pending.clear()
+            if job in self._ready:
+                self._ready.remove(job)
+            idle = job._running == 0
+        if idle:
+            self._finish(job)
+        return True
+
+    def stats(self):
+        with self._lock:
+            active = [job for job in self._jobs.values() if not job.done]
+            return {
+                "workers": self.workers,
+                "active_jobs": len(active),
+                "queued_rectangles": sum(len(job._pending) for job in active),
+                "running_rectangles": sum(job._running for job in active),
+            }
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            self._stopped = True
+            self._wakeup.notify_all()
+        if wait:
+            for thread in self._threads:
+                thread.join()
+
+    def _start_workers(self):
+        if self._threads:
+            return
+        for number in range(self.workers):
+            thread = threading.Thread(target=self._worker, name=f"crawl-job-worker-{number}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    def _prune(self):
+        cutoff = time.time() - JOB_RETENTION_SECONDS
+        for job_id in [job_id for job_id, job in self._jobs.items() if job.done and job.finished < cutoff]:
+            del self._jobs[job_id]
+
+    def _next_task(self):
+        """Takes the next rectangle round-robin across jobs; blocks while there is none."""
+        with self._lock:
+            while not self._ready and not self._stopped:
+                self._wakeup.wait()
+            if self._stopped:
+                return None
+            job = self._ready.popleft()
+            index, rectangle = job._pending.popleft()
+            if job._pending:
+                self._ready.append(job)
+            job._running += 1
+            job.status = "running"
+            return job, index, rectangle
+
+    def _worker(self):
+        while True:
+            task = self._next_task()
+            if task is None:
+                return
+            job, index, rectangle = task
+            try:
+                count = asyncio.run(self._crawl_rectangle(job, index, rectangle))
+                failed = False
+            except Exception as e:  # One failed rectangle must not take the worker down.
+                print(f"Job {job.id}: rectangle {index + 1} failed: {e}")
+                count, failed = 0, True
+            with self._lock:
+                job._running -= 1
+                job._completed += 1
+                job.failed_rectangles += failed
+                finished = not job._pending and job._running == 0
+            job.emit("progress", rectangle=index, rectangle_listings=count, rectangle_failed=failed,
+                     **job.to_dict())
+            if finished:
+                self._finish(job)
+
+    def _finish(self, job):
+        job.status = "done" if job._completed == len(job.rectangles) else "cancelled"
+        job.finished = time.time()
+        job.emit("done", **job.to_dict())
+
+    async def _crawl_rectangle(self, job, index, rectangle):
+        client = self.client or get_default_client()
+        batch = []
+        count = 0
+
+        def flush():
+            if self.store is not None:
+                self.store.upsert_listings(batch)
+            summaries = [summary for summary in map(listing_summary, batch) if summary is not None]
+            with self._lock:
+                job.listing_count += len(summaries)
+            job.emit("listings", rectangle=index, listings=summaries)
+            batch.clear()
+
+        # Crawls store what they find, so they always ask the API rather than the response cache.
+        async for listing in crawl_bbox(rectangle, client=client, **dict(self.fetch_kwargs, use_cache=False)):
+            # Listings on a shared rectangle edge are reported by both neighbours; the map dedupes by id.
+            batch.append(listing)
+            count += 1
+            if len(batch) >= LISTING_BATCH_SIZE:
+                flush()
+        if batch:
+            flush()
+        return count
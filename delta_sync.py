@@ -0,0 +1,185 @@
+import asyncio
+
+from listing_store import ListingStore, listing_row
+from realtor_client import get_default_client, normalize_bbox
+from realtor_pagination import reachable_page_count
+from two_phase_crawl import DEFAULT_CONCURRENCY, CountingClient, harvest_pins, hydrate_group, plan_hydration
+
+# Sort=6-D returns the newest listings first (see config.json).
+NEWEST_FIRST_SORT = "6-D"
+# Paging stops after this many consecutive listings that are stored and unchanged.
+DEFAULT_STOP_AFTER_KNOWN = 12
+
+
+def area_key_for_bbox(bbox):
+    """Default watermark key of an area: its bbox rounded to 5 decimals."""
+    return "bbox:" + ",".join(f"{value:.5f}" for value in normalize_bbox(bbox))
+
+
+def _inserted_ticks(listing):
+    try:
+        return int(listing.get("InsertedDateUTC"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _pins_complete(response):
+    """Returns True if a response's Pins list every property in its area individually."""
+    pins = response.get("Pins", [])
+    return all(int(pin.get("count") or 1) == 1 and pin.get("propertyId") for pin in pins)
+
+
+async def sync_area_async(bbox, area_key=None, client=None, store=None,
+                          stop_after_known=DEFAULT_STOP_AFTER_KNOWN,
+                          concurrency=DEFAULT_CONCURRENCY, **fetch_kwargs):
+    """
+    Brings the listing store up to date for an area with as few requests as possible.
+
+    Pages are read newest-first. A listing is written when it is new or its
+    PhotoChangeDateUTC / PriceChangeTagDateUTC differs from the stored copy.
+    Paging stops once it has reached listings inserted at or before the previous
+    sync's newest InsertedDateUTC (the watermark) and `stop_after_known`
+    consecutive listings were already stored unchanged, so every listing
+    inserted since the last sync is read. The first sync of an area (no
+    watermark yet) reads every page. The watermark only advances when every
+    request of the sync succeeded, so listings on a failed page are read
+    again next time. Pages are always fetched from the API, never from the
+    response cache.
+
+    The Pins of page 1 give the complete Id set of the area (resolved through
+    finer pin queries when clustered). Stored listings in the bbox that are no
+    longer pinned are deleted, and pinned Ids that paging stopped before are
+    hydrated individually.
+
+    Args:
+        bbox: Bounding box accepted by realtor_client.normalize_bbox.
+        area_key (str): Watermark key; defaults to area_key_for_bbox(bbox).
+        client (RealtorClient): Client to use; defaults to the process-wide client.
+        store (ListingStore): Store to sync; defaults to the default store file.
+        stop_after_known (int): Consecutive unchanged listings that end paging.
+        concurrency (int): Maximum requests in flight for pin resolution and hydration.
+        fetch_kwargs: Extra arguments for RealtorClient.fetch.
+
+    Returns:
+        dict: Counts of requests, pages, new, updated, removed and hydrated listings,
+        and failed_requests (requests that got no response).
+    """
+    client = client or get_default_client()
+    counting = CountingClient(client)
+    store = store or ListingStore()
+    bbox = normalize_bbox(bbox)
+    area_key = area_key or area_key_for_bbox(bbox)
+    lat_min, lon_min, lat_max, lon_max = bbox
+    # Cached pages would hide new listings and end the sync early as "unchanged".
+    fetch_kwargs = dict(fetch_kwargs, sort_order=NEWEST_FIRST_SORT, use_cache=False)
+    watermark = store.get_area_watermark(area_key)
+    report = {"requests": 0, "pages": 0, "new": 0, "updated": 0, "removed": 0, "hydrated": 0,
+              "failed_requests": 0}
+
+    def fetch_page(page_number):
+        return counting.fetch(lat_max, lon_max, lat_min, lon_min, page_number=page_number, **fetch_kwargs)
+
+    first_page = await asyncio.to_thread(fetch_page, 1)
+    if first_page is None:
+        print(f"Sync of {area_key} failed: first page could not be fetched.")
+        report["requests"] = counting.requests
+        report["failed_requests"] = counting.failures
+        return report
+
+    seen_ids = set()
+    previous_newest = watermark["newest_inserted"] if watermark else None
+    newest_inserted = previous_newest
+    # Without a stored InsertedDateUTC the known-listing streak alone ends paging.
+    reached_watermark = previous_newest is None
+    known_streak = 0
+    paging_complete = True
+    page, page_number = first_page, 1
+    page_count = reachable_page_count(first_page.get("Paging", {}))
+    while True:
+        report["pages"] += 1
+        results = page.get("Results", [])
+        stamps = store.get_change_stamps(
+            listing.get("Id") for listing in results if str(listing.get("Id", "")).isdigit()
+        )
+        changed = []
+        for listing in results:
+            row = listing_row(listing)
+            if row is None:
+                continue
+            seen_ids.add(row[0])
+            ticks = _inserted_ticks(listing)
+            if ticks is not None and (newest_inserted is None or ticks > newest_inserted):
+                newest_inserted = ticks
+            if ticks is not None and previous_newest is not None and ticks <= previous_newest:
+                reached_watermark = True
+            stored = stamps.get(row[0])
+            if stored is not None and stored == (row[8], row[9]):
+                known_streak += 1
+                continue
+            known_streak = 0
+            report["new" if stored is None else "updated"] += 1
+            changed.append(listing)
+        store.upsert_listings(changed)
+
+        if watermark is not None and reached_watermark and known_streak >= stop_after_known:
+            break
+        page_number += 1
+        if page_number > page_count:
+            break
+        page = await asyncio.to_thread(fetch_page, page_number)
+        if page is None:
+            print(f"Page {page_number} of {area_key} could not be fetched; stopping early.")
+            paging_complete = False
+            break
+
+    # Removal detection and gap filling from the complete set of pinned Ids.
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    other_kwargs = {k: v for k, v in fetch_kwargs.items() if k != "zoom_level"}
+    pins = {}
+    if _pins_complete(first_page):
+        for pin in first_page.get("Pins", []):
+            try:
+                pins[str(pin["propertyId"])] = (float(pin["latitude"]), float(pin["longitude"]))
+            except (KeyError, TypeError, ValueError):
+                continue
+    else:
+        zoom = fetch_kwargs.get("zoom_level") or client.default_zoom_level
+        await harvest_pins(bbox, counting, zoom, semaphore, pins, other_kwargs)
+
+    # Deletions are only trusted when the pins account for every listing the area reports;
+    # a failed sub-query or an unresolved cluster would otherwise look like removed listings.
+    total_records = int(first_page.get("Paging", {}).get("TotalRecords") or 0)
+    if pins:
+        stored_ids = {listing["id"] for listing in store.listings_in_bbox(bbox)}
+        pinned_ids = {int(pid) for pid in pins if pid.isdigit()}
+        removed = stored_ids - pinned_ids
+        if removed and len(pins) >= total_records:
+            report["removed"] = store.delete_listings(removed)
+        elif removed:
+            print(f"Only {len(pins)} of {total_records} listings of {area_key} were pinned; skipping removals.")
+
+        unseen = {pid: coordinates for pid, coordinates in pins.items()
+                  if pid.isdigit() and int(pid) not in stored_ids and int(pid) not in seen_ids}
+        found = await asyncio.gather(*(
+            hydrate_group(group_bbox, wanted, counting, semaphore, other_kwargs)
+            for group_bbox, wanted in plan_hydration(unseen, pins, client.default_records_per_page)
+        ))
+        report["hydrated"] = store.upsert_listings(listing for listings in found for listing in listings)
+
+    if paging_complete and counting.failures == 0:
+        store.set_area_watermark(area_key, newest_inserted, len(pins) or None)
+    else:
+        print(f"Keeping the watermark of {area_key}: {counting.failures} requests failed.")
+    report["requests"] = counting.requests
+    report["failed_requests"] = counting.failures
+    print(f"Synced {area_key}: {report}")
+    return report
+
+
+def sync_area(bbox, **kwargs):
+    """Synchronous wrapper around sync_area_async."""
+    return asyncio.run(sync_area_async(bbox, **kwargs))
+
+
+if __name__ == '__main__':
+    sync_area((45.41715, -75.72110, 45.43411, -75.68209))
@@ -0,0 +1,315 @@
+import argparse
+import json
+import re
+import sys
+import time
+
+import numpy as np
+
+from listing_parser import Listing
+from listing_store import DEFAULT_STORE_PATH, ListingStore
+from polygon_geometry import normalize_polygons, points_in_polygons, polygons_bounds
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:  # Parquet export is optional; the .npz format needs only NumPy.
+    pyarrow = None
+
+# Column name -> dtype of the exported arrays.
+COLUMNS = {
+    "id": np.int64,
+    "latitude": np.float64,
+    "longitude": np.float64,
+    "price": np.float64,
+    "property_type": np.str_,
+    "size_sqft": np.float64,
+    "inserted": "datetime64[s]",
+}
+DEFAULT_PERCENTILES = (10, 25, 50, 75, 90)
+# Square feet per unit of Building.SizeInterior, keyed by the unit with spaces and dots removed.
+SQFT_PER_UNIT = {
+    "sqft": 1.0, "ft2": 1.0, "ft²": 1.0, "sf": 1.0, "squarefeet": 1.0,
+    "m2": 10.763910417, "m²": 10.763910417, "sqm": 10.763910417,
+    "ac": 43560.0, "acre": 43560.0, "acres": 43560.0,
+    "ha": 107639.10417, "hec": 107639.10417, "hectare": 107639.10417, "hectares": 107639.10417,
+}
+# .NET ticks (100 ns since 0001-01-01) at the Unix epoch; InsertedDateUTC is in ticks.
+_EPOCH_TICKS = 621355968000000000
+# One SizeInterior value per line: a number or a 'low - high' range, then the unit. Every line matches.
+_SIZE_LINE = re.compile(r"^[ \t]*(?:([\d,]*\.?\d+)(?:[ \t]*-[ \t]*([\d,]*\.?\d+))?)?[ \t]*([^\n]*?)[ \t]*$", re.M)
+
+
+def _numbers(strings):
+    """Float array from numeric strings with thousands separators; empty strings become NaN."""
+    values = np.char.replace(np.asarray(strings, dtype=np.str_), ",", "")
+    return np.where(values == "", "nan", values).astype(np.float64)
+
+
+def parse_sizes(sizes):
+    """
+    Converts SizeInterior strings ('92.9023 m2', '1100 - 1500 sqft', '0.125 ac') to square feet.
+
+    Ranges use their midpoint. Missing values and unknown units give NaN.
+
+    Args:
+        sizes (list): Strings, or None where a listing has no size.
+
+    Returns:
+        numpy.ndarray: float64 square feet.
+    """
+    if not sizes:
+        return np.empty(0, dtype=np.float64)
+    # One regex pass over all values instead of a parse per listing.
+    text = "\n".join(" ".join((size or "").split()) for size in sizes)
+    parts = _SIZE_LINE.findall(text)
+    low, high, units = (np.array(column, dtype=np.str_) for column in zip(*parts))
+    low = _numbers(low)
+    high = np.where(high == "", low, _numbers(high))
+    unique_units, unit_index = np.unique(units, return_inverse=True)
+    factors = np.array([SQFT_PER_UNIT.get(unit.lower().replace(" ", "").replace(".", ""), np.nan)
+                        for unit in unique_units], dtype=np.float64)
+    return (low + high) / 2 * factors[unit_index]
+
+
+def ticks_to_datetimes(ticks):
+    """Converts .NET tick strings (InsertedDateUTC) to datetime64[s]; unparseable values become NaT."""
+    strings = np.asarray(ticks, dtype=np.str_)
+    valid = np.char.isdigit(strings)
+    values = np.where(valid, strings, "0").astype(np.int64)
+    seconds = (values - _EPOCH_TICKS) // 10 ** 7
+    return np.where(valid, seconds.astype("datetime64[s]"), np.datetime64("NaT"))
+
+
+class ListingColumns:
+    """
+    Listings as parallel NumPy arrays, one per entry of COLUMNS.
+
+    price is PriceUnformattedValue and size_sqft the Building.SizeInterior
+    normalized to square feet; both are NaN where unknown. inserted is
+    InsertedDateUTC as datetime64[s].
+    """
+
+    def __init__(self, **arrays):
+        for name, dtype in COLUMNS.items():
+            setattr(self, name, np.asarray(arrays.get(name, []), dtype=dtype))
+
+    def __len__(self):
+        return self.id.size
+
+    @classmethod
+    def from_listings(cls, listings):
+        """
+        Builds the columns from 'Results' entries or listing_parser.Listing objects.
+
+        Entries without a numeric Id or without coordinates are skipped.
+        """
+        ids, lats, lons, prices, types, sizes, inserted = [], [], [], [], [], [], []
+        for listing in listings:
+            if isinstance(listing, Listing):
+                values = (listing.id, listing.latitude, listing.longitude, listing.price,
+                          listing.property_type, listing.size_interior, listing.inserted_date_utc)
+            else:
+                prop = listing.get("Property", {})
+                address = prop.get("Address", {})
+                values = (listing.get("Id"), address.get("Latitude"), address.get("Longitude"),
+                          prop.get("PriceUnformattedValue"), prop.get("Type"),
+                          listing.get("Building", {}).get("SizeInterior"), listing.get("InsertedDateUTC"))
+            listing_id, lat, lon, price, property_type, size, inserted_date = values
+            if not str(listing_id).isdigit() or lat in (None, "") or lon in (None, ""):
+                continue
+            ids.append(listing_id)
+            lats.append(lat)
+            lons.append(lon)
+            prices.append("" if price is None else str(price))
+            types.append(property_type or "")
+            sizes.append(size)
+            inserted.append(inserted_date or "")
+        return cls(
+            id=np.array(ids, dtype=np.str_).astype(np.int64),
+            latitude=np.array(lats, dtype=np.str_).astype(np.float64),
+            longitude=np.array(lons, dtype=np.str_).astype(np.float64),
+            price=_numbers(prices),
+            property_type=types,
+            size_sqft=parse_sizes(sizes),
+            inserted=ticks_to_datetimes(inserted),
+        )
+
+    @classmethod
+    def from_store(cls, store):
+        """Builds the columns from every listing in a ListingStore."""
+        return cls.from_listings(store.iter_listings())
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in COLUMNS}
+
+    def save(self, path):
+        """Writes the columns to `path`: Parquet for '.parquet' (needs pyarrow), otherwise NumPy .npz."""
+        if path.endswith(".parquet"):
+            _require_pyarrow()
+            pyarrow.parquet.write_table(self.to_arrow(), path)
+        else:
+            np.savez(path, **self.to_dict())
+
+    @classmethod
+    def load(cls, path):
+        """Reads columns written by save()."""
+        if path.endswith(".parquet"):
+            _require_pyarrow()
+            table = pyarrow.parquet.read_table(path)
+            return cls(**{name: table.column(name).to_numpy() for name in COLUMNS})
+        with np.load(path) as data:
+            return cls(**{name: data[name] for name in COLUMNS})
+
+    def to_arrow(self):
+        """The columns as a pyarrow.Table (needs pyarrow)."""
+        _require_pyarrow()
+        return pyarrow.table(self.to_dict())
+
+
+def _require_pyarrow():
+    if pyarrow is None:
+        raise RuntimeError("Parquet/Arrow export needs pyarrow (pip install pyarrow); use a .npz path instead.")
+
+
+def _grouped_quantiles(groups, values, group_count, quantiles):
+    """
+    Linear-interpolated quantiles of `values` per group, for all groups at once.
+
+    Returns:
+        tuple: (counts per group, (group_count, len(quantiles)) array; NaN for empty groups)
+    """
+    order = np.lexsort((values, groups))
+    values = values[order]
+    counts = np.bincount(groups, minlength=group_count)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    result = np.full((group_count, len(quantiles)), np.nan)
+    present = counts > 0
+    if present.any():
+        positions = starts[present, None] + np.asarray(quantiles)[None, :] * (counts[present, None] - 1)
+        below = np.floor(positions).astype(np.int64)
+        above = np.ceil(positions).astype(np.int64)
+        result[present] = values[below] + (values[above] - values[below]) * (positions - below)
+    return counts, result
+
+
+def _summary(counts, sums, quantiles, percentiles, index):
+    """JSON-friendly statistics of one group; None where there is nothing to summarize."""
+    if not counts[index]:
+        return {"count": 0, "mean": None, "median": None, **{f"p{p:g}": None for p in percentiles}}
+    values = quantiles[index]
+    return {
+        "count": int(counts[index]),
+        "mean": float(sums[index] / counts[index]),
+        "median": float(values[percentiles.index(50)]) if 50 in percentiles else None,
+        **{f"p{p:g}": float(value) for p, value in zip(percentiles, values)},
+    }
+
+
+def shape_statistics(columns, shapes, percentiles=DEFAULT_PERCENTILES):
+    """
+    Price statistics of the listings inside each shape.
+
+    Membership is found per shape with a bbox pre-filter and the vectorized
+    point-in-polygon test; the statistics of every shape are then computed in
+    one grouped pass (a listing inside overlapping shapes counts for each).
+
+    Args:
+        columns (ListingColumns): The listings.
+        shapes (list): Shapes as sent by the map app ({'id', 'name', 'polygon'}
+            and/or 'polygons'), or bare [lat, lon] rings.
+        percentiles (tuple): Price percentiles to report; the median is always added.
+
+    Returns:
+        list: Per shape, its id and name, the listing count, and 'price' and
+            'price_per_sqft' dicts with count, mean, median and the percentiles.
+    """
+    if not shapes:
+        return []
+    percentiles = tuple(sorted(set(percentiles) | {50}))
+    quantiles = [p / 100 for p in percentiles]
+    shape_index, row_index = [], []
+    described = []
+    for number, shape in enumerate(shapes):
+        if isinstance(shape, dict):
+            polygons = normalize_polygons(shape.get("polygon"), shape.get("polygons"))
+            described.append({"id": shape.get("id"), "name": shape.get("name")})
+        else:
+            polygons = normalize_polygons(shape)
+            described.append({"id": number, "name": None})
+        if not polygons or not len(columns):
+            continue
+        lat_min, lon_min, lat_max, lon_max = polygons_bounds(polygons)
+        candidates = np.flatnonzero((columns.latitude >= lat_min) & (columns.latitude <= lat_max) &
+                                    (columns.longitude >= lon_min) & (columns.longitude <= lon_max))
+        inside = candidates[points_in_polygons(columns.latitude[candidates], columns.longitude[candidates], polygons)]
+        shape_index.append(np.full(inside.size, number, dtype=np.int64))
+        row_index.append(inside)
+
+    group_count = len(described)
+    groups = np.concatenate(shape_index) if shape_index else np.empty(0, dtype=np.int64)
+    rows = np.concatenate(row_index) if row_index else np.empty(0, dtype=np.int64)
+    listing_counts = np.bincount(groups, minlength=group_count)
+
+    prices = columns.price[rows]
+    price_per_sqft = prices / columns.size_sqft[rows]
+    summaries = {}
+    for name, values in (("price", prices), ("price_per_sqft", price_per_sqft)):
+        known = np.isfinite(values) & (values > 0)
+        counts, values_at = _grouped_quantiles(groups[known], values[known], group_count, quantiles)
+        sums = np.bincount(groups[known], weights=values[known], minlength=group_count)
+        summaries[name] = (counts, sums, values_at)
+
+    return [
+        dict(shape, listings=int(listing_counts[index]),
+             **{name: _summary(counts, sums, values_at, percentiles, index)
+                for name, (counts, sums, values_at) in summaries.items()})
+        for index, shape in enumerate(described)
+    ]
+
+
+def _load_shapes(path):
+    """Shapes from a JSON file: a list of shapes, or the map app's {'shapes': [...]} request body."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return data.get("shapes", []) if isinstance(data, dict) else data
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Columnar export of stored listings and per-shape price statistics.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="Export the listing store to .npz or .parquet.")
+    export.add_argument("output", help="Output path; '.parquet' needs pyarrow, anything else is written as .npz.")
+    export.add_argument("--store", default=DEFAULT_STORE_PATH, help="Listing store to export.")
+    stats = commands.add_parser("stats", help="Price statistics per shape.")
+    stats.add_argument("shapes", help="JSON file with the shapes (as sent by the map app).")
+    stats.add_argument("--columns", help="Exported columns to use instead of reading the listing store.")
+    stats.add_argument("--store", default=DEFAULT_STORE_PATH, help="Listing store to read when --columns is not given.")
+    stats.add_argument("--percentiles", type=float, nargs="+", default=list(DEFAULT_PERCENTILES))
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    if args.command == "export":
+        store = ListingStore(args.store)
+        columns = ListingColumns.from_store(store)
+        store.close()
+        columns.save(args.output)
+        print(f"Exported {len(columns)} listings to {args.output} in {time.perf_counter() - started:.2f}s.",
+              file=sys.stderr)
+        return
+
+    if args.columns:
+        columns = ListingColumns.load(args.columns)
+    else:
+        store = ListingStore(args.store)
+        columns = ListingColumns.from_store(store)
+        store.close()
+    loaded = time.perf_counter()
+    results = shape_statistics(columns, _load_shapes(args.shapes), tuple(args.percentiles))
+    print(json.dumps(results, indent=2))
+    print(f"{len(columns)} listings loaded in {loaded - started:.3f}s; "
+          f"{len(results)} shapes aggregated in {time.perf_counter() - loaded:.3f}s.", file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+import codecs
+import json
+import re
+import sys
+import time
+import tracemalloc
+
+# Listing attribute -> (path inside a 'Results' entry, converter). Values that are
+# missing, empty or fail conversion are stored as None.
+LISTING_FIELDS = {
+    "id": (("Id",), str),
+    "mls_number": (("MlsNumber",), str),
+    "latitude": (("Property", "Address", "Latitude"), float),
+    "longitude": (("Property", "Address", "Longitude"), float),
+    "price": (("Property", "PriceUnformattedValue"), int),
+    "property_type": (("Property", "Type"), str),
+    "building_type": (("Building", "Type"), str),
+    "size_interior": (("Building", "SizeInterior"), str),
+    "address": (("Property", "Address", "AddressText"), str),
+    "postal_code": (("PostalCode",), str),
+    "inserted_date_utc": (("InsertedDateUTC",), str),
+    "photo_change_date_utc": (("PhotoChangeDateUTC",), str),
+    "price_change_date_utc": (("Property", "PriceChangeTagDateUTC"), str),
+    "relative_url": (("RelativeDetailsURL",), str),
+}
+
+DEFAULT_CHUNK_SIZE = 64 * 1024
+# Consumed text is cut off the front of the buffer once it grows past this.
+_BUFFER_TRIM_CHARS = 64 * 1024
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+
+class Listing:
+    """Compact projection of one 'Results' entry. Fields not selected for parsing are None."""
+
+    __slots__ = tuple(LISTING_FIELDS) + ("raw",)
+
+    def __init__(self, **values):
+        for name in self.__slots__:
+            setattr(self, name, values.get(name))
+
+    def to_dict(self):
+        values = {name: getattr(self, name) for name in LISTING_FIELDS}
+        if self.raw:
+            values["raw"] = self.raw
+        return values
+
+    def __repr__(self):
+        return f"Listing(id={self.id!r}, mls_number={self.mls_number!r}, price={self.price!r})"
+
+
+class Pin:
+    """Compact form of one 'Pins' entry."""
+
+    __slots__ = ("property_id", "latitude", "longitude", "count")
+
+    def __init__(self, property_id, latitude, longitude, count):
+        self.property_id = property_id
+        self.latitude = latitude
+        self.longitude = longitude
+        self.count = count
+
+    def __repr__(self):
+        return f"Pin(property_id={self.property_id!r}, count={self.count})"
+
+
+class ListingPage:
+    """Parsed form of a PropertySearch_Post response."""
+
+    __slots__ = ("error_code", "paging", "listings", "pins")
+
+    def __init__(self):
+        self.error_code = {}
+        self.paging = {}
+        self.listings = []
+        self.pins = []
+
+
+def _lookup(entry, path):
+    for key in path:
+        if not isinstance(entry, dict):
+            return None
+        entry = entry.get(key)
+    return entry
+
+
+def _convert(value, converter):
+    if value is None or value == "":
+        return None
+    try:
+        return converter(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def make_projector(fields=None, keep_raw=()):
+    """
+    Returns a function turning a 'Results' entry into a Listing.
+
+    Args:
+        fields (iterable): Names from LISTING_FIELDS to extract; defaults to all.
+        keep_raw (iterable): Dotted paths (e.g. 'Property.Photo') whose JSON values are
+            kept as-is in Listing.raw.
+    """
+    selected = [(name,) + LISTING_FIELDS[name] for name in (fields or LISTING_FIELDS)]
+    raw_paths = [(path, tuple(path.split("."))) for path in keep_raw]
+
+    def project(entry):
+        listing = Listing()
+        for name, path, converter in selected:
+            setattr(listing, name, _convert(_lookup(entry, path), converter))
+        if raw_paths:
+            listing.raw = {path: _lookup(entry, keys) for path, keys in raw_paths}
+        return listing
+
+    return project
+
+
+def make_pin(entry):
+    return Pin(
+        entry.get("propertyId"),
+        _convert(entry.get("latitude"), float),
+        _convert(entry.get("longitude"), float),
+        _convert(entry.get("count"), int) or 1,
+    )
+
+
+class ListingStreamParser:
+    """
+    Incremental parser for PropertySearch_Post response bodies.
+
+    Feed it the body in chunks. Elements of the 'Results' and 'Pins' arrays are
+    decoded one at a time as soon as they are complete, projected into Listing
+    and Pin records, and the decoded dicts are dropped, so memory is bounded by
+    one listing instead of the whole response. Other top-level members
+    (ErrorCode, Paging) are kept as plain values.
+    """
+
+    def __init__(self, fields=None, keep_raw=()):
+        self.page = ListingPage()
+        self._project = make_projector(fields, keep_raw)
+        self._decoder = json.JSONDecoder()
+        self._text = codecs.getincrementaldecoder("utf-8")()
+        self._buf = ""
+        self._pos = 0
+        self._state = "start"
+        self._key = None
+        self._finished = False
+
+    def feed(self, chunk):
+        """Parses as much of the body as is available after adding `chunk` (bytes or str)."""
+        if isinstance(chunk, bytes):
+            chunk = self._text.decode(chunk)
+        if self._pos > _BUFFER_TRIM_CHARS:
+            self._buf = self._buf[self._pos:]
+            self._pos = 0
+        self._buf += chunk
+        self._parse()
+
+    def close(self):
+        """Finishes parsing and returns the ListingPage. Raises ValueError on a truncated or malformed body."""
+        self._buf += self._text.decode(b"", final=True)
+        self._finished = True
+        self._parse()
+        if self._state != "done":
+            raise ValueError(f"Response body ended unexpectedly (parser state '{self._state}').")
+        return self.page
+
+    def _skip_whitespace(self):
+        pos = self._pos = _WHITESPACE.match(self._buf, self._pos).end()
+        return self._buf[pos] if pos < len(self._buf) else None
+
+    def _decode_value(self):
+        """Decodes the JSON value at the cursor, or returns (False, None) if it is not complete yet."""
+        try:
+            value, end = self._decoder.raw_decode(self._buf, self._pos)
+        except json.JSONDecodeError:
+            if self._finished:
+                raise ValueError(f"Malformed JSON at offset {self._pos} of the parse buffer.")
+            return False, None
+        if end == len(self._buf) and not self._finished:
+            return False, None  # A number at the end of the buffer may still have more digits coming.
+        self._pos = end
+        return True, value
+
+    def _expect(self, char):
+        raise ValueError(f"Expected {char} at offset {self._pos} of the parse buffer, got {self._buf[self._pos]!r}.")
+
+    def _parse(self):
+        while True:
+            char = self._skip_whitespace()
+            if char is None:
+                return
+            state = self._state
+            if state == "start":
+                if char != "{":
+                    self._expect("'{'")
+                self._pos += 1
+                self._state = "key"
+            elif state == "key":
+                if char == "}":
+                    self._pos += 1
+                    self._state = "done"
+                    continue
+                if char == ",":
+                    self._pos += 1
+                    continue
+                complete, key = self._decode_value()
+                if not complete:
+                    return
+                self._key = key
+                self._state = "colon"
+            elif state == "colon":
+                if char != ":":
+                    self._expect("':'")
+                self._pos += 1
+                self._state = "value"
+            elif state == "value":
+                if self._key in ("Results", "Pins") and char == "[":
+                    self._pos += 1
+                    self._state = "array"
+                    continue
+                complete, value = self._decode_value()
+                if not complete:
+                    return
+                if self._key == "Paging":
+                    self.page.paging = value
+                elif self._key == "ErrorCode":
+                    self.page.error_code = value
+                self._state = "key"
+            elif state == "array":
+                if char == "]":
+                    self._pos += 1
+                    self._state = "key"
+                    continue
+                if char == ",":
+                    self._pos += 1
+                    continue
+                complete, entry = self._decode_value()
+                if not complete:
+                    return
+                if self._key == "Results":
+                    self.page.listings.append(self._project(entry))
+                else:
+                    self.page.pins.append(make_pin(entry))
+            else:  # done
+                raise ValueError("Unexpected data after the end of the response object.")
+
+
+def parse_listing_stream(chunks, fields=None, keep_raw=()):
+    """
+    Parses a response body delivered as an iterable of chunks (e.g. response.iter_content()).
+
+    Args:
+        chunks (iterable): bytes or str pieces of the body.
+        fields (iterable): Names from LISTING_FIELDS to extract; defaults to all.
+        keep_raw (iterable): Dotted paths whose raw JSON values are kept in Listing.raw.
+
+    Returns:
+        ListingPage: The parsed page.
+    """
+    parser = ListingStreamParser(fields, keep_raw)
+    for chunk in chunks:
+        if chunk:
+            parser.feed(chunk)
+    return parser.close()
+
+
+def compare_parsing(path, chunk_size=DEFAULT_CHUNK_SIZE, repeat=20):
+    """
+    Compares the full json.loads path with the streaming projection on a saved response.
+
+    Reports wall time per parse, peak traced memory during a parse, and memory
+    still held by the parsed result.
+
+    Args:
+        path (str): File holding a PropertySearch_Post response body.
+        chunk_size (int): Chunk size fed to the streaming parser.
+        repeat (int): Parses timed per mode.
+
+    Returns:
+        dict: {'full_dict': {...}, 'streaming': {...}, 'body_bytes': int}
+    """
+    with open(path, 'rb') as f:
+        body = f.read()
+
+    def full_dict():
+        return json.loads(body)
+
+    def streaming():
+        return parse_listing_stream(body[i:i + chunk_size] for i in range(0, len(body), chunk_size))
+
+    report = {"body_bytes": len(body)}
+    for name, parse in (("full_dict", full_dict), ("streaming", streaming)):
+        started = time.perf_counter()
+        for _ in range(repeat):
+            parse()
+        seconds = (time.perf_counter() - started) / repeat
+
+        tracemalloc.start()
+        result = parse()
+        retained, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del result
+        report[name] = {
+            "ms_per_parse": seconds * 1000,
+            "mb_per_second": len(body) / seconds / 1e6,
+            "peak_bytes": peak,
+            "retained_bytes": retained,
+        }
+    return report
+
+
+if __name__ == '__main__':
+    sample_path = sys.argv[1] if len(sys.argv) > 1 else 'MapSearchAPI_Return.json'
+    comparison = compare_parsing(sample_path)
+    print(f"Body size: {comparison['body_bytes'] / 1024:.1f} KB")
+    for mode in ("full_dict", "streaming"):
+        stats = comparison[mode]
+        print(f"{mode:>10}: {stats['ms_per_parse']:.2f} ms/parse, {stats['mb_per_second']:.1f} MB/s, "
+              f"peak {stats['peak_bytes'] / 1024:.1f} KB, retained {stats['retained_bytes'] / 1024:.1f} KB")
@@ -0,0 +1,339 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+
+from metrics import timed
+
+DEFAULT_STORE_PATH = 'realtor_listings.sqlite'
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS listings ("
+    " id INTEGER PRIMARY KEY, mls_number TEXT, latitude REAL, longitude REAL,"
+    " price INTEGER, property_type TEXT, address TEXT,"
+    " inserted_date_utc TEXT, photo_change_date_utc TEXT, price_change_date_utc TEXT,"
+    " data BLOB, first_seen REAL NOT NULL, last_seen REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS listings_mls_number ON listings (mls_number)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS listings_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    "CREATE TABLE IF NOT EXISTS pins ("
+    " property_id INTEGER PRIMARY KEY, latitude REAL NOT NULL, longitude REAL NOT NULL,"
+    " count INTEGER NOT NULL, last_seen REAL NOT NULL)",
+    "CREATE VIRTUAL TABLE IF NOT EXISTS pins_rtree USING rtree(id, min_lat, max_lat, min_lon, max_lon)",
+    "CREATE TABLE IF NOT EXISTS area_watermarks ("
+    " area_key TEXT PRIMARY KEY, last_sync REAL NOT NULL, newest_inserted INTEGER, listing_count INTEGER)",
+]
+
+SUMMARY_COLUMNS = ("id", "mls_number", "latitude", "longitude", "price", "property_type", "address",
+                   "inserted_date_utc", "photo_change_date_utc", "price_change_date_utc")
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _to_int(value):
+    try:
+        return int(float(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def listing_row(listing):
+    """
+    Extracts the indexed columns of a 'Results' entry.
+
+    Returns:
+        tuple: Values in SUMMARY_COLUMNS order, or None if the listing has no numeric Id.
+    """
+    listing_id = _to_int(listing.get("Id"))
+    if listing_id is None:
+        return None
+    prop = listing.get("Property", {})
+    address = prop.get("Address", {})
+    return (
+        listing_id,
+        listing.get("MlsNumber"),
+        _to_float(address.get("Latitude")),
+        _to_float(address.get("Longitude")),
+        _to_int(prop.get("PriceUnformattedValue")),
+        prop.get("Type"),
+        address.get("AddressText"),
+        listing.get("InsertedDateUTC"),
+        listing.get("PhotoChangeDateUTC"),
+        prop.get("PriceChangeTagDateUTC"),
+    )
+
+
+class ListingStore:
+    """
+    Persistent listing store with R-tree indexes on listing and pin coordinates.
+
+    Listings are upserted by Id; a listing arriving under a new Id with an
+    MlsNumber that is already stored replaces the old row. The full listing
+    JSON is kept compressed next to the indexed columns. Safe to share between
+    threads.
+
+    The file uses WAL by default. Pass journal_mode='DELETE' when processes on
+    different machines share it over a network filesystem, where WAL's shared
+    memory does not work.
+    """
+
+    def __init__(self, path=DEFAULT_STORE_PATH, journal_mode="WAL"):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def upsert_listings(self, listings):
+        """
+        Inserts or updates 'Results' entries.
+
+        Args:
+            listings (iterable): Listing dicts as returned in a response's 'Results'.
+
+        Returns:
+            int: Number of listings written.
+        """
+        now = time.time()
+        rows = []
+        for listing in listings:
+            row = listing_row(listing)
+            if row is not None:
+                rows.append((row, zlib.compress(json.dumps(listing, separators=(',', ':')).encode('utf-8'))))
+        if not rows:
+            return 0
+        with timed("store_insert"), self._lock, self._conn:
+            for row, data in rows:
+                listing_id, mls_number, lat, lon = row[0], row[1], row[2], row[3]
+                if mls_number:
+                    stale = [r[0] for r in self._conn.execute(
+                        "SELECT id FROM listings WHERE mls_number = ? AND id != ?", (mls_number, listing_id))]
+                    for stale_id in stale:
+                        self._conn.execute("DELETE FROM listings WHERE id = ?", (stale_id,))
+                        self._conn.execute("DELETE FROM listings_rtree WHERE id = ?", (stale_id,))
+                self._conn.execute(
+                    "INSERT INTO listings (id, mls_number, latitude, longitude, price, property_type, address,"
+                    " inserted_date_utc, photo_change_date_utc, price_change_date_utc, data, first_seen, last_seen)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+                    " ON CONFLICT(id) DO UPDATE SET mls_number = excluded.mls_number,"
+                    " latitude = excluded.latitude, longitude = excluded.longitude, price = excluded.price,"
+                    " property_type = excluded.property_type, address = excluded.address,"
+                    " inserted_date_utc = excluded.inserted_date_utc,"
+                    " photo_change_date_utc = excluded.photo_change_date_utc,"
+                    " price_change_date_utc = excluded.price_change_date_utc,"
+                    " data = excluded.data, last_seen = excluded.last_seen",
+                    row + (data, now, now)
+                )
+                if lat is not None and lon is not None:
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO listings_rtree (id, min_lat, max_lat, min_lon, max_lon)"
+                        " VALUES (?, ?, ?, ?, ?)", (listing_id, lat, lat, lon, lon)
+                    )
+        return len(rows)
+
+    def upsert_pins(self, pins):
+        """
+        Inserts or updates entries of a response's 'Pins' array.
+
+        Returns:
+            int: Number of pins written.
+        """
+        now = time.time()
+        rows = []
+        for pin in pins:
+            property_id = _to_int(pin.get("propertyId"))
+            lat, lon = _to_float(pin.get("latitude")), _to_float(pin.get("longitude"))
+            if property_id is None or lat is None or lon is None:
+                continue
+            rows.append((property_id, lat, lon, _to_int(pin.get("count")) or 1, now))
+        if not rows:
+            return 0
+        with timed("store_insert_pins"), self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pins (property_id, latitude, longitude, count, last_seen)"
+                " VALUES (?, ?, ?, ?, ?)", rows
+            )
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO pins_rtree (id, min_lat, max_lat, min_lon, max_lon) VALUES (?, ?, ?, ?, ?)",
+                [(r[0], r[1], r[1], r[2], r[2]) for r in rows]
+            )
+        return len(rows)
+
+    def ingest_response(self, response):
+        """Stores the Results and Pins of a PropertySearch_Post response. Returns (listings, pins) written."""
+        if not response:
+            return 0, 0
+        return self.upsert_listings(response.get("Results", [])), self.upsert_pins(response.get("Pins", []))
+
+    def delete_listings(self, listing_ids):
+        """Removes listings (and their pins) that are no longer on the market."""
+        ids = [(int(listing_id),) for listing_id in listing_ids]
+        with self._lock, self._conn:
+            for table, column in (("listings", "id"), ("listings_rtree", "id"),
+                                  ("pins", "property_id"), ("pins_rtree", "id")):
+                self._conn.executemany(f"DELETE FROM {table} WHERE {column} = ?", ids)
+        return len(ids)
+
+    def get_listing(self, listing_id):
+        """Returns the full stored listing JSON for an Id, or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM listings WHERE id = ?", (int(listing_id),)).fetchone()
+        return json.loads(zlib.decompress(row[0])) if row and row[0] else None
+
+    def get_coordinates(self, listing_ids):
+        """Returns {id: (latitude, longitude)} for the given Ids that are stored."""
+        ids = [int(listing_id) for listing_id in listing_ids]
+        coordinates = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit.
+            for begin in range(0, len(ids), 500):
+                batch = ids[begin:begin + 500]
+                rows = self._conn.execute(
+                    f"SELECT id, latitude, longitude FROM listings WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+                coordinates.update((row[0], (row[1], row[2])) for row in rows)
+        return coordinates
+
+    def get_change_stamps(self, listing_ids):
+        """Returns {id: (photo_change_date_utc, price_change_date_utc)} for the given Ids that are stored."""
+        ids = [int(listing_id) for listing_id in listing_ids]
+        stamps = {}
+        with self._lock:
+            for begin in range(0, len(ids), 500):
+                batch = ids[begin:begin + 500]
+                rows = self._conn.execute(
+                    "SELECT id, photo_change_date_utc, price_change_date_utc FROM listings"
+                    f" WHERE id IN ({','.join('?' * len(batch))})", batch
+                )
+                stamps.update((row[0], (row[1], row[2])) for row in rows)
+        return stamps
+
+    def get_area_watermark(self, area_key):
+        """Returns the sync watermark of an area as a dict, or None if it was never synced."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT last_sync, newest_inserted, listing_count FROM area_watermarks WHERE area_key = ?",
+                (area_key,)
+            ).fetchone()
+        if row is None:
+            return None
+        return {"last_sync": row[0], "newest_inserted": row[1], "listing_count": row[2]}
+
+    def set_area_watermark(self, area_key, newest_inserted, listing_count):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO area_watermarks (area_key, last_sync, newest_inserted, listing_count)"
+                " VALUES (?, ?, ?, ?)", (area_key, time.time(), newest_inserted, listing_count)
+            )
+
+    def iter_listings(self, batch_size=1000):
+        """Yields the full stored listing JSON of every listing, reading `batch_size` rows at a time."""
+        last_id = None
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, data FROM listings WHERE data IS NOT NULL AND (? IS NULL OR id > ?)"
+                    " ORDER BY id LIMIT ?", (last_id, last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            for _, data in rows:
+                yield json.loads(zlib.decompress(data))
+            last_id = rows[-1][0]
+
+    def count(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM listings").fetchone()[0]
+
+    def listings_in_bbox(self, bbox, include_data=False):
+        """
+        Returns listings whose coordinates fall inside a bbox, using the R-tree.
+
+        The R-tree keeps float32 bounds, so its candidates are re-checked against the exact columns.
+
+        Args:
+            bbox (tuple): (lat_min, lon_min, lat_max, lon_max).
+            include_data (bool): Add the full listing JSON under 'data'.
+
+        Returns:
+            list: Dicts with the SUMMARY_COLUMNS keys.
+        """
+        columns = ", ".join(f"l.{c}" for c in SUMMARY_COLUMNS) + (", l.data" if include_data else "")
+        lat_min, lon_min, lat_max, lon_max = bbox
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {columns} FROM listings_rtree r JOIN listings l ON l.id = r.id"
+                " WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?"
+                " AND l.latitude BETWEEN ? AND ? AND l.longitude BETWEEN ? AND ?",
+                (lat_min, lat_max, lon_min, lon_max, lat_min, lat_max, lon_min, lon_max)
+            ).fetchall()
+        listings = []
+        for row in rows:
+            listing = dict(zip(SUMMARY_COLUMNS, row))
+            if include_data:
+                listing["data"] = json.loads(zlib.decompress(row[-1])) if row[-1] else None
+            listings.append(listing)
+        return listings
+
+    def listings_in_polygon(self, polygon=None, polygons=None, include_data=False):
+        """
+        Returns listings inside a drawn polygon, without touching the network.
+
+        Candidates come from an R-tree bbox query and are then tested exactly
+        with a vectorized point-in-polygon check.
+
+        Args:
+            polygon (list): A single [lat, lon] ring.
+            polygons (list): A multi-polygon, as accepted by polygon_geometry.normalize_polygons.
+            include_data (bool): Add the full listing JSON under 'data'.
+        """
+        # NumPy is only needed here; crawl workers that just store listings start faster without it.
+        import numpy as np
+        from polygon_geometry import normalize_polygons, points_in_polygons, polygons_bounds
+
+        shapes = normalize_polygons(polygon, polygons)
+        if not shapes:
+            return []
+        candidates = self.listings_in_bbox(polygons_bounds(shapes), include_data)
+        if not candidates:
+            return []
+        lats = np.array([c["latitude"] for c in candidates], dtype=np.float64)
+        lons = np.array([c["longitude"] for c in candidates], dtype=np.float64)
+        inside = points_in_polygons(lats, lons, shapes)
+        return [candidate for candidate, is_inside in zip(candidates, inside.tolist()) if is_inside]
+
+    def pins_in_bbox(self, bbox):
+        """Returns stored pins inside a bbox as dicts with property_id, latitude, longitude and count."""
+        lat_min, lon_min, lat_max, lon_max = bbox
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT p.property_id, p.latitude, p.longitude, p.count FROM pins_rtree r"
+                " JOIN pins p ON p.property_id = r.id"
+                " WHERE r.max_lat >= ? AND r.min_lat <= ? AND r.max_lon >= ? AND r.min_lon <= ?"
+                " AND p.latitude BETWEEN ? AND ? AND p.longitude BETWEEN ? AND ?",
+                (lat_min, lat_max, lon_min, lon_max, lat_min, lat_max, lon_min, lon_max)
+            ).fetchall()
+        return [dict(zip(("property_id", "latitude", "longitude", "count"), row)) for row in rows]
+
+
+if __name__ == '__main__':
+    with open('MapSearchAPI_Return.json', 'r') as f:
+        sample = json.load(f)
+    store = ListingStore()
+    print(f"Stored (listings, pins): {store.ingest_response(sample)}")
+    downtown = [[45.40, -75.72], [45.43, -75.72], [45.43, -75.68], [45.40, -75.68]]
+    started = time.perf_counter()
+    found = store.listings_in_polygon(downtown)
+    print(f"{len(found)} listings inside polygon ({(time.perf_counter() - started) * 1000:.2f} ms)")
+    store.close()
@@ -1,29 +1,40 @@
-from flask import Flask, request, jsonify
-import requests # Import the requests library
+import os
+import sys
+from flask import Flask, Response, request, jsonify, stream_with_context
 import json # Import the json library
-from playwright.sync_api import sync_playwright
+
+# Shared modules (geometry, client, ...) live in the repository root.
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+from crawl_jobs import JobManager
+from listing_store import DEFAULT_STORE_PATH, ListingStore
+from metrics import REGISTRY, summary as metrics_summary
+from polygon_geometry import DEFAULT_GRID_RESOLUTION, decompose_polygons, grid_mask, normalize_polygons
+from realtor_client import get_default_rate_limiter
+from rectangle_cover import (
+    cells_to_bounds, check_tolerance, cover_mask, merge_rectangles, optimize_shape_batch, rect_to_dict
+)
 
 app = Flask(__name__, static_folder='.', static_url_path='')
 
-# Basic point-in-polygon check using the ray casting algorithm
-def is_point_in_polygon(point, polygon):
-    x, y = point
-    num_vertices = len(polygon)
-    is_inside = False
-
-    p1x, p1y = polygon[0]
-    for i in range(num_vertices + 1):
-        p2x, p2y = polygon[i % num_vertices]
-        if y > min(p1y, p2y):
-            if y <= max(p1y, p2y):
-                if x <= max(p1x, p2x):
-                    if p1y != p2y:
-                        xinters = (y - p1y) * (p2x - p1x) / (p2y - p1y) + p1x
-                    if p1x == p2x or x <= xinters:
-                        is_inside = not is_inside
-        p1x, p1y = p2x, p2y
-
-    return is_inside
+_listing_store = None
+_job_manager = None
+# Seconds between keep-alive comments on an idle job event stream.
+EVENT_STREAM_KEEPALIVE_SECONDS = 15
+
+def get_listing_store():
+    """Opens the shared local listing store on first use."""
+    global _listing_store
+    if _listing_store is None:
+        _listing_store = ListingStore(os.path.join(REPO_ROOT, DEFAULT_STORE_PATH))
+    return _listing_store
+
+def get_job_manager():
+    """Creates the background crawl job manager on first use; crawled listings go into the listing store."""
+    global _job_manager
+    if _job_manager is None:
+        _job_manager = JobManager(store=get_listing_store())
+    return _job_manager
 
 @app.route('/')
 def index():
@@ -34,41 +45,42 @@ def process_polygon():
     data = request.get_json()
     polygon_coords = data.get('polygon', [])
 
-    # Implement polygon to rectangles logic here
+    # 'polygons' takes a multi-polygon whose items are rings or [outline, hole, ...] lists.
     print(f"Received polygon: {polygon_coords}")
 
-    rectangles = []
-    if polygon_coords:
-        # Calculate bounding box
-        min_lat = min(p[0] for p in polygon_coords)
-        max_lat = max(p[0] for p in polygon_coords)
-        min_lon = min(p[1] for p in polygon_coords)
-        max_lon = max(p[1] for p in polygon_coords)
-
-        # Define grid resolution (adjust as needed for precision)
-        lat_step = (max_lat - min_lat) / 50  # Example: 50 divisions in latitude
-        lon_step = (max_lon - min_lon) / 50  # Example: 50 divisions in longitude
-
-        # Iterate over grid cells
-        lat = min_lat
-        while lat < max_lat:
-            lon = min_lon
-            while lon < max_lon:
-                # Check if the center of the grid cell is inside the polygon
-                # Using a simple point-in-polygon check (ray casting algorithm)
-                # This is a basic implementation and can be improved for complex polygons or performance
-                point = (lat + lat_step / 2, lon + lon_step / 2)
-                if is_point_in_polygon(point, polygon_coords):
-                    rectangles.append({
-                        'lat_min': lat,
-                        'lon_min': lon,
-                        'lat_max': lat + lat_step,
-                        'lon_max': lon + lon_step
-                    })
-                lon += lon_step
-            lat += lat_step
-
-    return jsonify({"rectangles": rectangles})
+    try:
+        polygons = normalize_polygons(polygon_coords, data.get('polygons'))
+        resolution = data.get('resolution', DEFAULT_GRID_RESOLUTION)
+        if not data.get('optimize'):
+            return jsonify({"rectangles": decompose_polygons(polygons, resolution)})
+
+        # Merge inside-cells into as few rectangles (= API queries) as the tolerance allows.
+        tolerance = check_tolerance(data.get('tolerance', 0.0))
+        rectangles = []
+        cell_count = 0
+        if polygons:
+            mask, bounds, lat_step, lon_step = grid_mask(polygons, resolution)
+            cell_count = int(mask.sum())
+            exact_cover = cells_to_bounds(cover_mask(mask), bounds, lat_step, lon_step)
+            rectangles = [rect_to_dict(rect) for rect in merge_rectangles(exact_cover, tolerance)]
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"Invalid polygon request: {e}", "rectangles": []}), 400
+
+    return jsonify({
+        "rectangles": rectangles,
+        "request_estimate": {"before": cell_count, "after": len(rectangles)}
+    })
+
+@app.route('/api/listings_in_polygon', methods=['POST'])
+def listings_in_polygon():
+    data = request.get_json()
+    try:
+        listings = get_listing_store().listings_in_polygon(
+            data.get('polygon'), data.get('polygons'), include_data=bool(data.get('include_data'))
+        )
+    except (TypeError, ValueError) as e:
+        return jsonify({"message": f"Invalid polygon request: {e}", "listings": []}), 400
+    return jsonify({"count": len(listings), "listings": listings})
 
 @app.route('/send_multiple_rectangles', methods=['POST'])
 def send_multiple_rectangles():
@@ -80,19 +92,59 @@ def send_multiple_rectangles():
     if not shapes_data:
         return jsonify({"message": "No shapes data received.", "results": []}), 400
 
+    shape_ids = [shape.get('id') for shape in shapes_data]
+    duplicates = sorted({str(shape_id) for shape_id in shape_ids if shape_ids.count(shape_id) > 1})
+    if duplicates:
+        # Results and crawl jobs are matched to shapes by id.
+        return jsonify({"message": f"Duplicate shape ids: {', '.join(duplicates)}.", "results": []}), 400
+
+    try:
+        tolerance = check_tolerance(data.get('tolerance', 0.0))
+        shape_rects = {
+            shape.get('id'): [
+                (float(r['lat_min']), float(r['lon_min']), float(r['lat_max']), float(r['lon_max']))
+                for r in shape.get('rectangles', [])
+            ]
+            for shape in shapes_data
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"message": f"Invalid rectangles data: {e}", "results": []}), 400
+
+    try:
+        # Listings already crawled into the local store can be answered without the network.
+        shape_listings = {
+            shape.get('id'): get_listing_store().listings_in_polygon(shape['polygon']) if shape.get('polygon') else []
+            for shape in shapes_data
+        }
+    except (KeyError, TypeError, ValueError) as e:
+        return jsonify({"message": f"Invalid polygon data: {e}", "results": []}), 400
+
+    # Merge each shape's rectangles and drop those already covered by other shapes in this batch.
+    optimized_rects, request_estimate = optimize_shape_batch(shape_rects, tolerance)
+    print(f"\nRequest estimate for batch: {request_estimate['before']} -> {request_estimate['after']}")
+
     for shape in shapes_data:
         shape_id = shape.get('id')
         shape_name = shape.get('name', 'Unknown Shape')
         rectangles = shape.get('rectangles', [])
+        optimized = optimized_rects.get(shape_id, [])
 
         print(f"\nReceived Riemann Rectangles for Shape ID '{shape_id}' (Name: '{shape_name}'):")
         if rectangles:
-            for i, rect in enumerate(rectangles):
-                print(f"  Rectangle {i+1}: Lat: {rect['lat_min']}-{rect['lat_max']}, Lon: {rect['lon_min']}-{rect['lon_max']}")
+            for i, rect in enumerate(optimized):
+                print(f"  Rectangle {i+1}: Lat: {rect[0]}-{rect[2]}, Lon: {rect[1]}-{rect[3]}")
+            # The crawl runs in the background; its results are streamed from /jobs/<jobId>/events.
+            job = get_job_manager().submit(optimized, shape_id=shape_id, name=shape_name)
             response_results.append({
                 "shapeId": shape_id,
                 "status": "success",
-                "message": f"Rectangles for '{shape_name}' received successfully."
+                "message": f"Crawl of '{shape_name}' queued "
+                           f"({len(rectangles)} rectangles -> {len(optimized)} requests).",
+                "jobId": job.id,
+                "events_url": f"/jobs/{job.id}/events",
+                "rectangles": [rect_to_dict(rect) for rect in optimized],
+                "request_estimate": {"before": len(rectangles), "after": len(optimized)},
+                "local_listings": shape_listings[shape_id]
             })
         else:
             print("  No rectangles received for this shape.")
@@ -102,8 +154,64 @@ def send_multiple_rectangles():
                 "message": f"No rectangles received for '{shape_name}'."
             })
             
-    return jsonify({"message": "Processed all toggled shapes.", "results": response_results})
+    return jsonify({
+        "message": "Processed all toggled shapes.",
+        "results": response_results,
+        "request_estimate": request_estimate
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage latency histograms and counters: Prometheus text format, or JSON with ?format=json."""
+    if request.args.get('format') == 'json':
+        return jsonify(metrics_summary())
+    return Response(REGISTRY.prometheus_text(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/rate_limit', methods=['GET'])
+def rate_limit_stats():
+    """Current request rate, concurrency limit and queue depth of the API rate limiter, plus crawl job load."""
+    return jsonify(dict(get_default_rate_limiter().stats(), jobs=get_job_manager().stats()))
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"message": f"Unknown job '{job_id}'."}), 404
+    return jsonify(job.to_dict())
+
+@app.route('/jobs/<job_id>/cancel', methods=['POST'])
+def cancel_job(job_id):
+    if not get_job_manager().cancel(job_id):
+        return jsonify({"message": f"Job '{job_id}' is unknown or already finished."}), 404
+    return jsonify({"message": f"Job '{job_id}' cancelled."})
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """Streams a job's progress and listing batches as Server-Sent Events until it is done."""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"message": f"Unknown job '{job_id}'."}), 404
+    # A reconnecting EventSource resumes after the last event it received.
+    last_event_id = request.headers.get('Last-Event-ID', '')
+    last_seq = int(last_event_id) if last_event_id.isdigit() else 0
+
+    def stream(last_seq):
+        while True:
+            events = job.events_after(last_seq, timeout=EVENT_STREAM_KEEPALIVE_SECONDS)
+            if not events:
+                if job.done:
+                    return
+                yield ": keep-alive\n\n"
+                continue
+            for event in events:
+                last_seq = event["seq"]
+                yield f"id: {last_seq}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+                if event["type"] == "done":
+                    return
+
+    return Response(stream_with_context(stream(last_seq)), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
+    app.run(debug=True, threaded=True)
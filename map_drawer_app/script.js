@@ -67,11 +67,15 @@ mymap.on(L.Draw.Event.CREATED, function (event) {
         numRectangles: numRectangles,
         drawnPolygonLayer: layer, // Store the actual Leaflet layer for the polygon
         riemannRectanglesLayer: new L.FeatureGroup(), // New feature group for its rectangles
+        listingsLayer: new L.FeatureGroup(), // Markers for listings streamed back from crawl jobs
+        listingIds: new Set(), // Ids already shown, since neighbouring rectangles can return the same listing
+        eventSource: null, // EventSource of the shape's running crawl job, if any
         visible: true, // New property: initially visible
         sendToServer: false // New property: determines if rectangles for this shape are sent to server
     };
     mymap.addLayer(newShape.drawnPolygonLayer); // Add polygon layer to map
     mymap.addLayer(newShape.riemannRectanglesLayer); // Add Riemann layer to map
+    mymap.addLayer(newShape.listingsLayer);
 
     savedShapes.push(newShape);
 
@@ -121,8 +125,12 @@ async function sendMultipleShapesToServer(shapesToSend) {
                     if (serverMessageDiv) {
                         const shapeResult = result.results.find(r => r.shapeId === shape.id);
                         if (shapeResult && shapeResult.status === 'success') {
-                            serverMessageDiv.textContent = `Server response: ${shapeResult.message}`;
+                            const localCount = (shapeResult.local_listings || []).length;
+                            serverMessageDiv.textContent = `Server response: ${shapeResult.message} ${localCount} listings already stored locally.`;
                             serverMessageDiv.style.color = 'green';
+                            if (shapeResult.jobId) {
+                                streamJobResults(shape.id, shapeResult.jobId);
+                            }
                         } else if (shapeResult && shapeResult.status === 'error') {
                             serverMessageDiv.textContent = `Error: ${shapeResult.message}`;
                             serverMessageDiv.style.color = 'red';
@@ -164,6 +172,64 @@ async function sendMultipleShapesToServer(shapesToSend) {
     }
 }
 
+// Follows a background crawl job and adds its listings to the map as they arrive
+function streamJobResults(shapeId, jobId) {
+    const shape = savedShapes.find(s => s.id === shapeId);
+    if (!shape) return;
+
+    if (shape.eventSource) {
+        shape.eventSource.close(); // A newer job replaces the shape's previous one
+    }
+    shape.listingsLayer.clearLayers();
+    shape.listingIds.clear();
+
+    const serverMessageDiv = tabsContent.querySelector(`div[data-shape-id="${shapeId}"] .server-message-per-shape`);
+    const showMessage = (text, color) => {
+        if (serverMessageDiv) {
+            serverMessageDiv.textContent = text;
+            serverMessageDiv.style.color = color;
+        }
+    };
+
+    const eventSource = new EventSource(`/jobs/${jobId}/events`);
+    shape.eventSource = eventSource;
+
+    eventSource.addEventListener('progress', (e) => {
+        const job = JSON.parse(e.data);
+        showMessage(`Crawling: ${job.completed}/${job.rectangles} rectangles done, ${shape.listingIds.size} listings found.`, 'orange');
+    });
+
+    eventSource.addEventListener('listings', (e) => {
+        const batch = JSON.parse(e.data);
+        batch.listings.forEach(listing => {
+            if (listing.latitude === null || listing.longitude === null || shape.listingIds.has(listing.id)) {
+                return;
+            }
+            shape.listingIds.add(listing.id);
+            const price = listing.price !== null ? `$${listing.price.toLocaleString()}` : 'Price n/a';
+            L.circleMarker([listing.latitude, listing.longitude], {radius: 4, color: '#d9534f', weight: 1, fillOpacity: 0.8})
+                .bindPopup(`${price}<br>${listing.address || ''}<br>MLS ${listing.mls_number || ''}`)
+                .addTo(shape.listingsLayer);
+        });
+    });
+
+    eventSource.addEventListener('done', (e) => {
+        const job = JSON.parse(e.data);
+        eventSource.close(); // Otherwise EventSource reconnects once the server ends the stream
+        shape.eventSource = null;
+        const failed = job.failed ? `, ${job.failed} rectangles failed` : '';
+        showMessage(`Crawl ${job.status}: ${shape.listingIds.size} listings in ${job.rectangles} rectangles${failed}.`,
+                    job.failed ? 'red' : 'green');
+    });
+
+    eventSource.onerror = () => {
+        // EventSource retries on its own (resuming via Last-Event-ID); only report a closed stream.
+        if (eventSource.readyState === EventSource.CLOSED) {
+            showMessage('Lost connection to the crawl job.', 'red');
+        }
+    };
+}
+
 // Function to draw Riemann approximation rectangles for a specific shape
 // Returns the array of rectangle data
 function drawRiemannRectangles(shapeId) {
@@ -371,9 +437,11 @@ function toggleShapeVisibility(shapeId, isVisible) {
     if (isVisible) {
         mymap.addLayer(shape.drawnPolygonLayer);
         mymap.addLayer(shape.riemannRectanglesLayer);
+        mymap.addLayer(shape.listingsLayer);
     } else {
         mymap.removeLayer(shape.drawnPolygonLayer);
         mymap.removeLayer(shape.riemannRectanglesLayer);
+        mymap.removeLayer(shape.listingsLayer);
     }
 }
 
@@ -459,6 +527,7 @@ document.getElementById('process-button').addEventListener('click', function() {
             shapesToSend.push({
                 id: shape.id,
                 name: shape.name,
+                polygon: shape.polygonCoords, // Lets the server answer from its local listing store
                 rectangles: rectanglesData
             });
         } else {
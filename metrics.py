@@ -0,0 +1,240 @@
+import atexit
+import bisect
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Upper bounds, in seconds, of the latency histogram buckets: 0.5 ms doubling up to about 65 s.
+# Observations above the last bound fall into an overflow bucket.
+HISTOGRAM_BOUNDS = tuple(0.0005 * 2 ** i for i in range(18))
+SUMMARY_QUANTILES = (0.5, 0.9, 0.99)
+# Captures waiting to be written; further captures are dropped (and counted) while it is full.
+CAPTURE_QUEUE_SIZE = 256
+
+
+class Histogram:
+    """Latency histogram over HISTOGRAM_BOUNDS; quantiles are estimated from the bucket bounds."""
+
+    def __init__(self):
+        self.counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def observe(self, seconds):
+        self.counts[bisect.bisect_left(HISTOGRAM_BOUNDS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        self.counts = [mine + theirs for mine, theirs in zip(self.counts, other["buckets"])]
+        self.count += other["count"]
+        self.total += other["sum"]
+        self.max = max(self.max, other["max"])
+
+    def quantile(self, q):
+        if not self.count:
+            return None
+        target = q * self.count
+        cumulative = 0
+        for index, count in enumerate(self.counts):
+            cumulative += count
+            if cumulative >= target:
+                return min(HISTOGRAM_BOUNDS[index], self.max) if index < len(HISTOGRAM_BOUNDS) else self.max
+        return self.max
+
+    def to_dict(self):
+        summary = {
+            "count": self.count,
+            "sum": self.total,
+            "mean": self.total / self.count if self.count else None,
+            "max": self.max,
+            "buckets": list(self.counts),
+        }
+        for q in SUMMARY_QUANTILES:
+            summary[f"p{int(q * 100)}"] = self.quantile(q)
+        return summary
+
+
+class MetricsRegistry:
+    """
+    Process-wide counters and latency histograms.
+
+    Stage timings (cookie acquisition, payload build, network round trip,
+    decode, store insert) are recorded with timed(); retries, cache hits and
+    bytes transferred with increment(). Safe to use from any thread.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+        self._histograms = {}
+        self.started = time.time()
+
+    def increment(self, name, value=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + value
+
+    def observe(self, name, seconds):
+        with self._lock:
+            histogram = self._histograms.get(name)
+            if histogram is None:
+                histogram = self._histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    @contextmanager
+    def timed(self, name):
+        """Records the duration of the with-block in the histogram `name`, also when it raises."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - started)
+
+    def snapshot(self):
+        """JSON-serializable summary: counters plus count/sum/mean/max/quantiles per histogram."""
+        with self._lock:
+            return {
+                "uptime_seconds": time.time() - self.started,
+                "counters": dict(self._counters),
+                "histograms": {name: histogram.to_dict() for name, histogram in self._histograms.items()},
+            }
+
+    def merge(self, snapshot):
+        """Adds a snapshot taken in another process (e.g. a crawl worker) into this registry."""
+        with self._lock:
+            for name, value in snapshot.get("counters", {}).items():
+                self._counters[name] = self._counters.get(name, 0) + value
+            for name, data in snapshot.get("histograms", {}).items():
+                histogram = self._histograms.get(name)
+                if histogram is None:
+                    histogram = self._histograms[name] = Histogram()
+                histogram.merge(data)
+
+    def reset(self):
+        with self._lock:
+            self._counters.clear()
+            self._histograms.clear()
+            self.started = time.time()
+
+    def prometheus_text(self, prefix="realtor"):
+        """The metrics in the Prometheus text exposition format."""
+        snapshot = self.snapshot()
+        lines = []
+        for name, value in sorted(snapshot["counters"].items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {value}")
+        for name, data in sorted(snapshot["histograms"].items()):
+            metric = f"{prefix}_{name}_seconds"
+            lines.append(f"# TYPE {metric} histogram")
+            cumulative = 0
+            for bound, count in zip(HISTOGRAM_BOUNDS, data["buckets"]):
+                cumulative += count
+                lines.append(f'{metric}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{metric}_bucket{{le="+Inf"}} {data["count"]}')
+            lines.append(f"{metric}_sum {data['sum']}")
+            lines.append(f"{metric}_count {data['count']}")
+        return "\n".join(lines) + "\n"
+
+
+class SampledRecorder:
+    """
+    Opt-in debug capture of requests and responses.
+
+    Callers check sampled() once per operation and, for a fraction
+    `sample_rate` of them, record() what they want kept. Captures are written
+    as JSON files to `directory` by a background thread, so capturing never
+    blocks the caller on disk I/O. With the default sample rate of 0 nothing is
+    recorded.
+    """
+
+    def __init__(self, directory="captures", sample_rate=0.0):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=CAPTURE_QUEUE_SIZE)
+        self._thread = None
+        self._thread_lock = threading.Lock()
+        self._sequence = 0
+
+    def sampled(self):
+        """Decides whether the current call is captured; False whenever the sample rate is 0."""
+        return self.sample_rate > 0 and random.random() < self.sample_rate
+
+    def record(self, kind, data):
+        """Queues `data` (JSON-serializable) to be written as one capture file. Returns False if it was dropped."""
+        with self._thread_lock:
+            self._sequence += 1
+            name = f"{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}-{self._sequence:06d}-{kind}.json"
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._write_loop, name="capture-writer", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((name, data))
+        except queue.Full:
+            self.dropped += 1
+            return False
+        return True
+
+    def flush(self, timeout=5.0):
+        """Waits until queued captures are written (e.g. before a CLI run exits)."""
+        deadline = time.monotonic() + timeout
+        while self._queue.unfinished_tasks and time.monotonic() < deadline:
+            time.sleep(0.01)
+
+    def _write_loop(self):
+        while True:
+            name, data = self._queue.get()
+            try:
+                os.makedirs(self.directory, exist_ok=True)
+                with open(os.path.join(self.directory, name), 'w') as f:
+                    json.dump(data, f, indent=4, default=str)
+                self.written += 1
+            except (OSError, TypeError, ValueError) as e:
+                print(f"Error writing capture {name}: {e}")
+            finally:
+                self._queue.task_done()
+
+
+REGISTRY = MetricsRegistry()
+RECORDER = SampledRecorder()
+# The writer thread is a daemon; give queued captures a chance to reach disk before exit.
+atexit.register(RECORDER.flush)
+
+
+def timed(name):
+    return REGISTRY.timed(name)
+
+
+def increment(name, value=1):
+    REGISTRY.increment(name, value)
+
+
+def configure_capture(directory=None, sample_rate=None):
+    """Sets up the process-wide recorder (see the 'capture' section of config.json)."""
+    if directory is not None:
+        RECORDER.directory = directory
+    if sample_rate is not None:
+        RECORDER.sample_rate = float(sample_rate)
+
+
+def summary():
+    """Snapshot of the process-wide registry plus capture counts, for JSON output of CLI runs."""
+    return dict(REGISTRY.snapshot(), captures={"written": RECORDER.written, "dropped": RECORDER.dropped})
+
+
+def write_summary(path=None):
+    """Writes summary() as JSON to `path`, or prints it when no path is given."""
+    RECORDER.flush()
+    text = json.dumps(summary(), indent=2)
+    if path:
+        with open(path, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
@@ -0,0 +1,330 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from urllib.parse import urlparse
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from listing_store import DEFAULT_STORE_PATH, ListingStore
+from metrics import increment, timed
+from realtor_client import DEFAULT_HEADERS
+
+DEFAULT_PHOTO_DIRECTORY = 'realtor_photos'
+DEFAULT_CONCURRENCY = 8
+DEFAULT_TIMEOUT_SECONDS = 30
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Resolution -> (Property.Photo key, Individual key) holding the URL to download.
+RESOLUTIONS = {
+    "high": ("HighResPath", "PhotoHighRes"),
+    "medium": ("MedResPath", "Photo"),
+    "low": ("LowResPath", "Photo"),
+}
+# The CDN serves images to browsers coming from the site; send the same identity.
+PHOTO_HEADERS = {name: DEFAULT_HEADERS[name] for name in ("User-Agent", "Referer", "Accept-Language")}
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS photos ("
+    " url TEXT PRIMARY KEY, stamp TEXT, digest TEXT, etag TEXT, last_modified TEXT,"
+    " bytes INTEGER, fetched REAL NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS listing_photos ("
+    " listing_id TEXT NOT NULL, url TEXT NOT NULL, kind TEXT NOT NULL, sequence INTEGER,"
+    " PRIMARY KEY (listing_id, url))",
+]
+
+
+def listing_photos(listing, resolution="high", include_agents=True):
+    """
+    Lists the images of a 'Results' entry.
+
+    Listing photos come from Property.Photo, stamped with their LastUpdated (or
+    the listing's PhotoChangeDateUTC). With `include_agents`, agent photos and
+    brokerage logos from Individual are added; they are shared by many listings
+    and stamped with AgentPhotoLastUpdated / PhotoLastupdate. Media entries link
+    tours and floor plans on other sites and are not included.
+
+    Returns:
+        list: (url, stamp, kind, sequence) tuples; kind is 'listing', 'agent' or 'logo'.
+    """
+    photo_key, agent_key = RESOLUTIONS[resolution]
+    listing_stamp = listing.get("PhotoChangeDateUTC")
+    photos = []
+    for number, photo in enumerate(listing.get("Property", {}).get("Photo") or []):
+        url = photo.get(photo_key)
+        if url:
+            photos.append((url, photo.get("LastUpdated") or listing_stamp, "listing",
+                           int(photo.get("SequenceId") or number + 1)))
+    if include_agents:
+        for individual in listing.get("Individual") or []:
+            url = individual.get(agent_key) or individual.get("Photo")
+            if url:
+                photos.append((url, individual.get("AgentPhotoLastUpdated"), "agent", None))
+            organization = individual.get("Organization") or {}
+            if organization.get("Logo"):
+                photos.append((organization["Logo"], organization.get("PhotoLastupdate"), "logo", None))
+    return photos
+
+
+class PhotoIndex:
+    """
+    SQLite record of downloaded photos: per URL the stamp it was fetched at, the
+    sha256 of its content and the validators (ETag, Last-Modified) for
+    conditional re-downloads, plus which listing uses which photo.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+        self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def get(self, url):
+        """Returns the record of a URL as a dict, or None if it was never downloaded."""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT stamp, digest, etag, last_modified, bytes FROM photos WHERE url = ?", (url,)
+            ).fetchone()
+        return dict(zip(("stamp", "digest", "etag", "last_modified", "bytes"), row)) if row else None
+
+    def put(self, url, stamp, digest, etag, last_modified, size):
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO photos (url, stamp, digest, etag, last_modified, bytes, fetched)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)", (url, stamp, digest, etag, last_modified, size, time.time())
+            )
+
+    def set_stamp(self, url, stamp):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE photos SET stamp = ?, fetched = ? WHERE url = ?", (stamp, time.time(), url))
+
+    def link(self, rows):
+        """Records (listing_id, url, kind, sequence) rows."""
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO listing_photos (listing_id, url, kind, sequence) VALUES (?, ?, ?, ?)", rows
+            )
+
+    def photos_for_listing(self, listing_id):
+        """Returns the downloaded photos of a listing as dicts with url, kind, sequence and digest."""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT lp.url, lp.kind, lp.sequence, p.digest FROM listing_photos lp"
+                " JOIN photos p ON p.url = lp.url WHERE lp.listing_id = ? ORDER BY lp.kind, lp.sequence",
+                (str(listing_id),)
+            ).fetchall()
+        return [dict(zip(("url", "kind", "sequence", "digest"), row)) for row in rows]
+
+
+class PhotoPrefetcher:
+    """
+    Downloads listing photos into a content-addressed directory.
+
+    Files are stored under their sha256 (photos/ab/cd/abcd....jpg), so an image
+    served under several URLs, such as an agent photo or brokerage logo shown on
+    many listings, is kept once. A URL whose stamp has not changed since it was
+    downloaded is skipped without a request; a changed stamp triggers a
+    conditional GET (If-None-Match / If-Modified-Since). Downloads run on a
+    bounded pool of threads sharing one keep-alive session.
+    """
+
+    def __init__(self, directory=DEFAULT_PHOTO_DIRECTORY, resolution="high", include_agents=True,
+                 concurrency=DEFAULT_CONCURRENCY, timeout=DEFAULT_TIMEOUT_SECONDS, url_rewrites=None):
+        """
+        Args:
+            directory (str): Root of the photo store; holds index.sqlite and the files.
+            resolution (str): 'high', 'medium' or 'low' (see RESOLUTIONS).
+            include_agents (bool): Also fetch agent photos and brokerage logos.
+            concurrency (int): Downloads in flight.
+            timeout (float): Per-request timeout in seconds.
+            url_rewrites (dict): URL prefix -> replacement applied before fetching,
+                e.g. to point the CDN at a local server. The index keeps the original URLs.
+        """
+        if resolution not in RESOLUTIONS:
+            raise ValueError(f"Unknown resolution '{resolution}'; expected one of {', '.join(RESOLUTIONS)}.")
+        self.directory = directory
+        self.resolution = resolution
+        self.include_agents = include_agents
+        self.concurrency = max(1, concurrency)
+        self.timeout = timeout
+        self.url_rewrites = dict(url_rewrites or {})
+        os.makedirs(directory, exist_ok=True)
+        self.index = PhotoIndex(os.path.join(directory, "index.sqlite"))
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=self.concurrency, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.update(PHOTO_HEADERS)
+
+    def close(self):
+        self.session.close()
+        self.index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def path_for(self, digest, url=""):
+        """File path of the content with the given sha256 hex digest."""
+        extension = os.path.splitext(urlparse(url).path)[1].lower() or ".jpg"
+        return os.path.join(self.directory, "photos", digest[:2], digest[2:4], digest + extension)
+
+    def _fetch_url(self, url):
+        for prefix, replacement in self.url_rewrites.items():
+            if url.startswith(prefix):
+                return replacement + url[len(prefix):]
+        return url
+
+    def _download(self, url, stamp, known):
+        """Fetches one URL (conditionally if it is known) and stores it. Returns (outcome, bytes downloaded)."""
+        headers = {}
+        if known:
+            if known["etag"]:
+                headers["If-None-Match"] = known["etag"]
+            if known["last_modified"]:
+                headers["If-Modified-Since"] = known["last_modified"]
+        with timed("photo_download"), self.session.get(self._fetch_url(url), headers=headers,
+                                                       timeout=self.timeout, stream=True) as response:
+            if response.status_code == 304 and known:
+                self.index.set_stamp(url, stamp)
+                return "not_modified", 0
+            response.raise_for_status()
+            digest = hashlib.sha256()
+            size = 0
+            photos_dir = os.path.join(self.directory, "photos")
+            os.makedirs(photos_dir, exist_ok=True)
+            with tempfile.NamedTemporaryFile(dir=photos_dir, delete=False) as f:
+                try:
+                    for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        digest.update(chunk)
+                        f.write(chunk)
+                        size += len(chunk)
+                except BaseException:
+                    f.close()
+                    os.remove(f.name)
+                    raise
+            etag, last_modified = response.headers.get("ETag"), response.headers.get("Last-Modified")
+        increment("photo_bytes_received", size)
+        digest = digest.hexdigest()
+        path = self.path_for(digest, url)
+        if os.path.exists(path):
+            os.remove(f.name)
+            outcome = "deduplicated"
+        else:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            os.replace(f.name, path)
+            outcome = "downloaded"
+        self.index.put(url, stamp, digest, etag, last_modified, size)
+        return outcome, size
+
+    async def prefetch_async(self, listings):
+        """
+        Downloads the photos of the given 'Results' entries.
+
+        Returns:
+            dict: Counts of photos 'downloaded', 'deduplicated' (content already
+                stored), 'not_modified' (304), 'unchanged' (skipped, same stamp),
+                'failed', and 'bytes' downloaded.
+        """
+        wanted = {}
+        links = []
+        for listing in listings:
+            listing_id = str(listing.get("Id", ""))
+            for url, stamp, kind, sequence in listing_photos(listing, self.resolution, self.include_agents):
+                # A URL shared by many listings is fetched once per run.
+                wanted.setdefault(url, stamp)
+                if listing_id:
+                    links.append((listing_id, url, kind, sequence))
+        self.index.link(links)
+
+        report = {"downloaded": 0, "deduplicated": 0, "not_modified": 0, "unchanged": 0, "failed": 0, "bytes": 0}
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def fetch(url, stamp):
+            known = self.index.get(url)
+            if known and known["digest"] and known["stamp"] == stamp and os.path.exists(self.path_for(known["digest"], url)):
+                report["unchanged"] += 1
+                return
+            async with semaphore:
+                try:
+                    outcome, size = await asyncio.to_thread(self._download, url, stamp, known)
+                except (requests.exceptions.RequestException, OSError) as e:
+                    increment("photo_errors")
+                    print(f"Failed to download {url}: {e}")
+                    report["failed"] += 1
+                    return
+            report[outcome] += 1
+            report["bytes"] += size
+
+        await asyncio.gather(*(fetch(url, stamp) for url, stamp in wanted.items()))
+        increment("photos_downloaded", report["downloaded"] + report["deduplicated"])
+        print(f"Photos: {report}")
+        return report
+
+    def prefetch(self, listings):
+        """Synchronous wrapper around prefetch_async."""
+        return asyncio.run(self.prefetch_async(listings))
+
+
+def _parse_rewrites(values):
+    rewrites = {}
+    for value in values or []:
+        prefix, separator, replacement = value.partition("=")
+        if not separator:
+            raise ValueError(f"Expected PREFIX=REPLACEMENT, got '{value}'.")
+        rewrites[prefix] = replacement
+    return rewrites
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Download the photos of crawled listings.")
+    parser.add_argument("responses", nargs="*",
+                        help="Saved PropertySearch_Post responses to read listings from (default: the listing store).")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Listing store to read when no responses are given.")
+    parser.add_argument("--directory", default=DEFAULT_PHOTO_DIRECTORY, help="Photo store directory.")
+    parser.add_argument("--resolution", choices=tuple(RESOLUTIONS), default="high")
+    parser.add_argument("--no-agents", action="store_true", help="Skip agent photos and brokerage logos.")
+    parser.add_argument("--concurrency", type=int, default=DEFAULT_CONCURRENCY)
+    parser.add_argument("--rewrite", action="append", metavar="PREFIX=REPLACEMENT",
+                        help="Fetch URLs starting with PREFIX from REPLACEMENT instead (repeatable), "
+                             "e.g. https://cdn.realtor.ca/=http://127.0.0.1:8000/")
+    args = parser.parse_args()
+    try:
+        url_rewrites = _parse_rewrites(args.rewrite)
+    except ValueError as e:
+        parser.error(str(e))
+
+    if args.responses:
+        listings = []
+        for path in args.responses:
+            with open(path, 'r') as f:
+                listings.extend(json.load(f).get("Results", []))
+    else:
+        store = ListingStore(args.store)
+        listings = list(store.iter_listings())
+        store.close()
+
+    started = time.perf_counter()
+    with PhotoPrefetcher(args.directory, args.resolution, not args.no_agents, args.concurrency,
+                         url_rewrites=url_rewrites) as prefetcher:
+        prefetcher.prefetch(listings)
+    print(f"Done in {time.perf_counter() - started:.2f}s.")
+
+
+if __name__ == '__main__':
+    main()
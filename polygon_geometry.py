@@ -0,0 +1,190 @@
+import numpy as np
+
+DEFAULT_GRID_RESOLUTION = 50
+MAX_GRID_RESOLUTION = 2000
+# Upper bound on points x edges evaluated in one broadcast by points_in_polygons.
+_POINT_CHUNK_ELEMENTS = 2_000_000
+
+
+def normalize_polygons(polygon=None, polygons=None):
+    """
+    Normalizes polygon input into a list of polygons, each a list of rings.
+
+    Coordinates are [lat, lon] pairs, as sent by the map app. A ring does not
+    need to repeat its first vertex. The first ring of a polygon is its outline
+    and any further rings are holes; insideness uses the even-odd rule over all
+    rings, so holes need no particular winding order.
+
+    Args:
+        polygon (list): A single ring, e.g. the map app's 'polygon' field.
+        polygons (list): A multi-polygon: each item is either a ring or a list of
+            rings [outline, hole, ...].
+
+    Returns:
+        list: Polygons, each a list of float64 arrays of shape (n, 2).
+    """
+    result = []
+    items = []
+    if polygon:
+        items.append(polygon)
+    if polygons:
+        items.extend(polygons)
+    for item in items:
+        if not item:
+            continue
+        rings = [item] if _is_ring(item) else item
+        arrays = [np.asarray(ring, dtype=np.float64).reshape(-1, 2) for ring in rings if len(ring) >= 3]
+        if arrays:
+            result.append(arrays)
+    return result
+
+
+def _is_ring(item):
+    first = item[0]
+    return len(first) == 2 and not isinstance(first[0], (list, tuple))
+
+
+def _edge_arrays(polygons):
+    """Returns (lat1, lon1, lat2, lon2) arrays with one entry per edge of every ring."""
+    rings = [ring for rings in polygons for ring in rings]
+    start = np.concatenate(rings)
+    end = np.concatenate([np.roll(ring, -1, axis=0) for ring in rings])
+    return start[:, 0], start[:, 1], end[:, 0], end[:, 1]
+
+
+def polygons_bounds(polygons):
+    """Returns (lat_min, lon_min, lat_max, lon_max) over all rings."""
+    points = np.concatenate([ring for rings in polygons for ring in rings])
+    lat_min, lon_min = points.min(axis=0)
+    lat_max, lon_max = points.max(axis=0)
+    return float(lat_min), float(lon_min), float(lat_max), float(lon_max)
+
+
+def points_in_polygons(lats, lons, polygons):
+    """
+    Vectorized even-odd point-in-polygon test for many points at once.
+
+    Args:
+        lats (array-like): Point latitudes.
+        lons (array-like): Point longitudes.
+        polygons (list): Output of normalize_polygons.
+
+    Returns:
+        numpy.ndarray: Boolean array, True where the point is inside.
+    """
+    lats = np.asarray(lats, dtype=np.float64)
+    lons = np.asarray(lons, dtype=np.float64)
+    inside = np.zeros(lats.shape, dtype=bool)
+    if not polygons or lats.size == 0:
+        return inside
+
+    lat1, lon1, lat2, lon2 = _edge_arrays(polygons)
+    spanning = lat1 != lat2  # Horizontal edges never cross a horizontal ray.
+    lat1, lon1, lat2, lon2 = lat1[spanning], lon1[spanning], lat2[spanning], lon2[spanning]
+    slope = (lon2 - lon1) / (lat2 - lat1)
+
+    chunk = max(1, _POINT_CHUNK_ELEMENTS // max(1, lat1.size))
+    flat_lats, flat_lons, flat_inside = lats.ravel(), lons.ravel(), inside.ravel()
+    for begin in range(0, flat_lats.size, chunk):
+        y = flat_lats[begin:begin + chunk, None]
+        x = flat_lons[begin:begin + chunk, None]
+        # Half-open test so a ray through a vertex counts exactly one of its edges.
+        crosses = (lat1 <= y) != (lat2 <= y)
+        crossing_lon = lon1 + (y - lat1) * slope
+        flat_inside[begin:begin + chunk] = np.count_nonzero(crosses & (crossing_lon < x), axis=1) % 2 == 1
+    return flat_inside.reshape(lats.shape)
+
+
+def _grid_shape(resolution):
+    if isinstance(resolution, (list, tuple)):
+        rows, cols = resolution
+    else:
+        rows = cols = resolution
+    rows, cols = int(rows), int(cols)
+    if not (1 <= rows <= MAX_GRID_RESOLUTION and 1 <= cols <= MAX_GRID_RESOLUTION):
+        raise ValueError(f"Grid resolution must be between 1 and {MAX_GRID_RESOLUTION}, got {rows}x{cols}.")
+    return rows, cols
+
+
+def grid_mask(polygons, resolution=DEFAULT_GRID_RESOLUTION, bounds=None):
+    """
+    Rasterizes polygons onto a regular grid by scanline, testing cell centres.
+
+    Each edge is intersected with the centre line of every grid row it spans in
+    one batch; each crossing toggles insideness for all cells east of it, which
+    a cumulative sum along the row then resolves. The cost is proportional to
+    crossings plus cells rather than cells times vertices.
+
+    Args:
+        polygons (list): Output of normalize_polygons.
+        resolution: Number of rows and columns (int), or a (rows, cols) pair.
+        bounds (tuple): Grid extent (lat_min, lon_min, lat_max, lon_max); defaults
+            to the polygons' bounding box.
+
+    Returns:
+        tuple: (mask, bounds, lat_step, lon_step) where mask is a boolean
+        (rows, cols) array with row 0 at lat_min and column 0 at lon_min.
+    """
+    rows, cols = _grid_shape(resolution)
+    bounds = bounds or polygons_bounds(polygons)
+    lat_min, lon_min, lat_max, lon_max = bounds
+    lat_step = (lat_max - lat_min) / rows
+    lon_step = (lon_max - lon_min) / cols
+    # Centres come from integer indices so no row or column is gained or lost to float drift.
+    row_centers = lat_min + (np.arange(rows) + 0.5) * lat_step
+    col_centers = lon_min + (np.arange(cols) + 0.5) * lon_step
+
+    lat1, lon1, lat2, lon2 = _edge_arrays(polygons)
+    edge_lat_min = np.minimum(lat1, lat2)
+    edge_lat_max = np.maximum(lat1, lat2)
+    # Rows whose centre y satisfies edge_lat_min <= y < edge_lat_max (half-open, as above).
+    first_row = np.searchsorted(row_centers, edge_lat_min, side='left')
+    end_row = np.searchsorted(row_centers, edge_lat_max, side='left')
+    counts = end_row - first_row
+    total = int(counts.sum())
+
+    toggles = np.zeros((rows, cols + 1), dtype=np.int32)
+    if total:
+        edge_index = np.repeat(np.arange(counts.size), counts)
+        offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+        crossing_rows = first_row[edge_index] + offsets
+        y = row_centers[crossing_rows]
+        e_lat1, e_lon1 = lat1[edge_index], lon1[edge_index]
+        crossing_lon = e_lon1 + (y - e_lat1) * (lon2[edge_index] - e_lon1) / (lat2[edge_index] - e_lat1)
+        # A crossing affects cells whose centre lies strictly east of it.
+        first_col = np.searchsorted(col_centers, crossing_lon, side='right')
+        np.add.at(toggles, (crossing_rows, first_col), 1)
+
+    mask = (np.cumsum(toggles, axis=1)[:, :cols] % 2).astype(bool)
+    return mask, bounds, lat_step, lon_step
+
+
+def mask_to_rectangles(mask, bounds, lat_step, lon_step):
+    """Converts the True cells of a grid mask into the map app's rectangle dicts."""
+    lat_min, lon_min = bounds[0], bounds[1]
+    row_idx, col_idx = np.nonzero(mask)
+    cell_lat_min = (lat_min + row_idx * lat_step).tolist()
+    cell_lon_min = (lon_min + col_idx * lon_step).tolist()
+    cell_lat_max = (lat_min + (row_idx + 1) * lat_step).tolist()
+    cell_lon_max = (lon_min + (col_idx + 1) * lon_step).tolist()
+    return [
+        {'lat_min': a, 'lon_min': b, 'lat_max': c, 'lon_max': d}
+        for a, b, c, d in zip(cell_lat_min, cell_lon_min, cell_lat_max, cell_lon_max)
+    ]
+
+
+def decompose_polygons(polygons, resolution=DEFAULT_GRID_RESOLUTION):
+    """
+    Returns one rectangle per grid cell whose centre is inside the polygons.
+
+    Args:
+        polygons (list): Output of normalize_polygons.
+        resolution: Number of rows and columns (int), or a (rows, cols) pair.
+
+    Returns:
+        list: Rectangle dicts with 'lat_min', 'lon_min', 'lat_max' and 'lon_max'.
+    """
+    if not polygons:
+        return []
+    mask, bounds, lat_step, lon_step = grid_mask(polygons, resolution)
+    return mask_to_rectangles(mask, bounds, lat_step, lon_step)
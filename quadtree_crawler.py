@@ -0,0 +1,263 @@
+import asyncio
+import json
+
+from realtor_client import get_default_client, normalize_bbox
+from realtor_pagination import DEFAULT_PAGE_CONCURRENCY, fetch_all_pages
+
+# How deep a bbox may be split. Each level quarters the area, so 8 levels turn a
+# city-sized box into tiles a few hundred metres wide.
+DEFAULT_MAX_DEPTH = 8
+# Number of quadrant probes in flight while building the tree.
+DEFAULT_PROBE_CONCURRENCY = 4
+
+
+def is_truncated(paging):
+    """
+    Returns True if a search has more listings than the API will page through.
+
+    The cheap Pins count is checked as well as TotalRecords: the pins array
+    always covers the whole area, even when Results are capped at MaxRecords.
+
+    Args:
+        paging (dict): The 'Paging' block of a PropertySearch_Post response.
+    """
+    max_records = paging.get("MaxRecords")
+    if not max_records:
+        return False
+    total = max(int(paging.get("TotalRecords") or 0), int(paging.get("Pins") or 0))
+    return total > int(max_records)
+
+
+class TileNode:
+    """A bbox in the crawl's tile tree. Leaves are crawled; inner nodes were split because they overflowed."""
+
+    def __init__(self, bbox, depth=0, total_records=None, children=None):
+        self.bbox = normalize_bbox(bbox)
+        self.depth = depth
+        self.total_records = total_records
+        self.children = children or []
+
+    def split(self):
+        """Creates the four quadrant children of this tile."""
+        lat_min, lon_min, lat_max, lon_max = self.bbox
+        lat_mid = (lat_min + lat_max) / 2
+        lon_mid = (lon_min + lon_max) / 2
+        self.children = [
+            TileNode((lat_mid, lon_min, lat_max, lon_mid), self.depth + 1),
+            TileNode((lat_mid, lon_mid, lat_max, lon_max), self.depth + 1),
+            TileNode((lat_min, lon_min, lat_mid, lon_mid), self.depth + 1),
+            TileNode((lat_min, lon_mid, lat_mid, lon_max), self.depth + 1),
+        ]
+        return self.children
+
+    def leaves(self):
+        if not self.children:
+            return [self]
+        return [leaf for child in self.children for leaf in child.leaves()]
+
+    def count(self):
+        return 1 + sum(child.count() for child in self.children)
+
+    def to_dict(self):
+        return {
+            "bbox": list(self.bbox),
+            "depth": self.depth,
+            "total_records": self.total_records,
+            "children": [child.to_dict() for child in self.children],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(
+            data["bbox"], data.get("depth", 0), data.get("total_records"),
+            [cls.from_dict(child) for child in data.get("children", [])]
+        )
+
+
+def save_tile_tree(tree, path):
+    """Writes a tile tree to a JSON file so later crawls can reuse its layout."""
+    with open(path, 'w') as f:
+        json.dump(tree.to_dict(), f, indent=2)
+    print(f"Saved tile tree ({tree.count()} tiles, {len(tree.leaves())} leaves) to {path}")
+
+
+def load_tile_tree(path):
+    """Reads a tile tree written by save_tile_tree."""
+    with open(path, 'r') as f:
+        return TileNode.from_dict(json.load(f))
+
+
+async def _probe(client, tile, semaphore, fetch_kwargs):
+    """Fetches page 1 of a tile and records its record count. Returns the response or None."""
+    lat_min, lon_min, lat_max, lon_max = tile.bbox
+    async with semaphore:
+        response = await asyncio.to_thread(
+            client.fetch, lat_max, lon_max, lat_min, lon_min, page_number=1, **fetch_kwargs
+        )
+    if response is not None:
+        _record_total(tile, response)
+    return response
+
+
+def _record_total(tile, response):
+    paging = response.get("Paging", {})
+    tile.total_records = max(int(paging.get("TotalRecords") or 0), int(paging.get("Pins") or 0))
+
+
+async def _expand(client, tile, max_depth, semaphore, first_pages, fetch_kwargs, response=None):
+    """
+    Splits `tile` until no leaf below it overflows MaxRecords.
+
+    Existing children (from a reused tree) are descended into without probing the
+    tile itself; only leaves are probed, unless their page 1 is passed as
+    `response`. Page 1 of every final leaf is kept in `first_pages` so the crawl
+    does not request it again.
+    """
+    if tile.children:
+        await asyncio.gather(*(
+            _expand(client, child, max_depth, semaphore, first_pages, fetch_kwargs) for child in tile.children
+        ))
+        return
+
+    if response is None:
+        response = await _probe(client, tile, semaphore, fetch_kwargs)
+    else:
+        _record_total(tile, response)
+    if response is None:
+        print(f"Could not probe tile {tile.bbox}; it will be crawled without splitting.")
+        return
+    if not is_truncated(response.get("Paging", {})):
+        first_pages[id(tile)] = response
+        return
+    if tile.depth >= max_depth:
+        print(f"Tile {tile.bbox} still has {tile.total_records} records at max depth {max_depth}; "
+              f"results beyond the API cap will be missing.")
+        first_pages[id(tile)] = response
+        return
+
+    tile.split()
+    await asyncio.gather(*(
+        _expand(client, child, max_depth, semaphore, first_pages, fetch_kwargs) for child in tile.children
+    ))
+
+
+async def build_tile_tree(bbox, client=None, tile_tree=None, max_depth=DEFAULT_MAX_DEPTH,
+                          probe_concurrency=DEFAULT_PROBE_CONCURRENCY, first_page=None, **fetch_kwargs):
+    """
+    Builds the tile tree for a bbox, splitting only quadrants that exceed MaxRecords.
+
+    Args:
+        bbox: Bounding box accepted by realtor_client.normalize_bbox. May be None
+            when `tile_tree` is given, which then defines the area.
+        client (RealtorClient): Client to use; defaults to the process-wide client.
+        tile_tree (TileNode): A tree from an earlier run to start from. Its inner
+            nodes are trusted, only its leaves are probed (and split further if
+            they now overflow). Its root must cover exactly `bbox`.
+        max_depth (int): Maximum split depth.
+        probe_concurrency (int): Maximum number of probes in flight.
+        first_page (dict): Already fetched page-1 response for `bbox`, used instead of
+            probing the root. Ignored when `tile_tree` is given.
+        fetch_kwargs: Extra arguments for RealtorClient.fetch.
+
+    Returns:
+        tuple: (root TileNode, dict mapping id(leaf) to its page-1 response)
+
+    Raises:
+        ValueError: If `tile_tree` was built for a different bbox.
+    """
+    if tile_tree is not None and bbox is not None and normalize_bbox(bbox) != tile_tree.bbox:
+        raise ValueError(f"Tile tree covers {tile_tree.bbox}, not the requested bbox {normalize_bbox(bbox)}.")
+    client = client or get_default_client()
+    root = tile_tree or TileNode(bbox)
+    first_pages = {}
+    await _expand(client, root, max_depth, asyncio.Semaphore(max(1, probe_concurrency)), first_pages, fetch_kwargs,
+                  response=None if tile_tree else first_page)
+    return root, first_pages
+
+
+async def crawl_bbox(bbox, client=None, tile_tree=None, max_depth=DEFAULT_MAX_DEPTH,
+                     page_concurrency=DEFAULT_PAGE_CONCURRENCY, report=None, first_page=None, **fetch_kwargs):
+    """
+    Streams every listing in a bbox, splitting it into quadrants where the API would truncate.
+
+    Args:
+        bbox: Bounding box accepted by realtor_client.normalize_bbox.
+        client (RealtorClient): Client to use; defaults to the process-wide client.
+        tile_tree (TileNode): Tree from an earlier run whose split layout should be reused;
+            it must cover exactly `bbox` (see build_tile_tree).
+        max_depth (int): Maximum split depth.
+        page_concurrency (int): Pages in flight per leaf tile.
+        report (dict): If given, filled with 'tile_tree' (the TileNode built) and
+            'leaf_count' once the tree is known.
+        first_page (dict): Already fetched page-1 response for `bbox`, if the caller has one.
+        fetch_kwargs: Extra arguments for RealtorClient.fetch.
+
+    Yields:
+        dict: Listing entries, deduplicated by Id across tiles.
+    """
+    client = client or get_default_client()
+    root, first_pages = await build_tile_tree(bbox, client, tile_tree, max_depth, first_page=first_page,
+                                              **fetch_kwargs)
+    leaves = root.leaves()
+    print(f"Tile tree has {root.count()} tiles; crawling {len(leaves)} leaves.")
+    if report is not None:
+        report["tile_tree"] = root
+        report["leaf_count"] = len(leaves)
+
+    seen_ids = set()
+    for leaf in leaves:
+        async for listing in fetch_all_pages(leaf.bbox, client=client, concurrency=page_concurrency,
+                                             first_page=first_pages.get(id(leaf)), **fetch_kwargs):
+            # Listings on a shared tile edge can be returned by both neighbours.
+            listing_id = listing.get("Id")
+            if listing_id in seen_ids:
+                continue
+            seen_ids.add(listing_id)
+            yield listing
+
+
+def crawl_bbox_listings(bbox, tile_tree_path=None, **kwargs):
+    """
+    Synchronous helper around crawl_bbox that can load and save the tile layout.
+
+    Args:
+        bbox: Bounding box accepted by realtor_client.normalize_bbox.
+        tile_tree_path (str): JSON file holding the tile tree. It is reused if it
+            exists and rewritten with the (possibly further split) tree afterwards.
+        kwargs: Passed through to crawl_bbox.
+
+    Returns:
+        tuple: (list of listing dicts, TileNode)
+    """
+    tile_tree = None
+    if tile_tree_path:
+        try:
+            tile_tree = load_tile_tree(tile_tree_path)
+            if tile_tree.bbox != normalize_bbox(bbox):
+                print(f"Warning: Tile tree '{tile_tree_path}' covers {tile_tree.bbox}, not {normalize_bbox(bbox)}. "
+                      f"Rebuilding it.")
+                tile_tree = None
+            else:
+                print(f"Reusing tile tree from {tile_tree_path}")
+        except FileNotFoundError:
+            pass
+        except json.JSONDecodeError:
+            print(f"Warning: Error decoding tile tree '{tile_tree_path}'. Rebuilding it.")
+
+    report = {}
+
+    async def collect():
+        return [listing async for listing in crawl_bbox(bbox, tile_tree=tile_tree, report=report, **kwargs)]
+
+    listings = asyncio.run(collect())
+    tree = report.get("tile_tree")
+    if tile_tree_path and tree is not None:
+        save_tile_tree(tree, tile_tree_path)
+    return listings, tree
+
+
+if __name__ == '__main__':
+    # Central Ottawa; large enough to exceed the 600-record cap.
+    example_bbox = (45.38, -75.76, 45.45, -75.63)
+    listings, tree = crawl_bbox_listings(example_bbox, tile_tree_path='ottawa_tile_tree.json')
+    print(f"Fetched {len(listings)} unique listings from {len(tree.leaves())} tiles.")
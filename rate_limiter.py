@@ -0,0 +1,291 @@
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+DEFAULT_STATE_PATH = 'realtor_rate_limit.sqlite'
+DEFAULT_REQUESTS_PER_SECOND = 4.0
+DEFAULT_BURST = 8
+DEFAULT_INITIAL_CONCURRENCY = 4
+DEFAULT_MIN_CONCURRENCY = 1
+DEFAULT_MAX_CONCURRENCY = 16
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BACKOFF_BASE_SECONDS = 2.0
+DEFAULT_BACKOFF_MAX_SECONDS = 120.0
+# Statuses the Incapsula front end answers with when it throttles or blocks a client.
+BLOCK_STATUS_CODES = (403, 429)
+# Longest single sleep while waiting for a token, so a lifted block is noticed promptly.
+_MAX_WAIT_SLICE_SECONDS = 1.0
+# Window over which the observed request rate is measured.
+_RATE_WINDOW_SECONDS = 60.0
+
+
+def is_block_response(response):
+    """True for responses that mean the client is being throttled: 403/429, or an HTML challenge page."""
+    if response.status_code in BLOCK_STATUS_CODES:
+        return True
+    return response.status_code == 200 and "text/html" in response.headers.get("Content-Type", "")
+
+
+def retry_after_seconds(response):
+    """Returns the Retry-After header in seconds, or None if absent or not a number of seconds."""
+    value = response.headers.get("Retry-After", "").strip()
+    return float(value) if value.isdigit() else None
+
+
+class TokenBucket:
+    """
+    Token bucket whose state lives in SQLite, so every thread and process opening
+    the same file draws from one shared budget.
+
+    A block seen by any of them can also pause the whole bucket (block_for),
+    which makes every other caller wait out the same cool-down.
+    """
+
+    def __init__(self, path=DEFAULT_STATE_PATH, name="realtor", rate=DEFAULT_REQUESTS_PER_SECOND, burst=DEFAULT_BURST,
+                 journal_mode="WAL"):
+        """
+        Args:
+            path (str): SQLite file holding the bucket state.
+            name (str): Bucket name; callers sharing a name share a budget.
+            rate (float): Tokens added per second.
+            burst (float): Bucket capacity.
+            journal_mode (str): SQLite journal mode. Use 'DELETE' when processes on different
+                machines share the file over a network filesystem, where WAL's shared memory
+                does not work.
+        """
+        self.path = path
+        self.name = name
+        self.rate = float(rate)
+        self.burst = float(burst)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        try:
+            self._conn.execute(f"PRAGMA journal_mode={journal_mode}")
+        except sqlite3.OperationalError as e:
+            # Leaving WAL needs the file to itself; another process using it in WAL mode keeps it there.
+            print(f"Keeping the journal mode of {path}: {e}")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets ("
+            " name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL, blocked_until REAL NOT NULL)"
+        )
+
+    def _take(self):
+        """Takes a token if one is available; returns 0, or the seconds to wait before trying again."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute(
+                    "SELECT tokens, updated, blocked_until FROM buckets WHERE name = ?", (self.name,)
+                ).fetchone()
+                tokens, updated, blocked_until = row if row else (self.burst, now, 0.0)
+                if blocked_until > now:
+                    wait = blocked_until - now
+                else:
+                    tokens = min(self.burst, tokens + max(0.0, now - updated) * self.rate)
+                    if tokens >= 1.0:
+                        tokens -= 1.0
+                        wait = 0.0
+                    else:
+                        wait = (1.0 - tokens) / self.rate
+                    updated = now
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO buckets (name, tokens, updated, blocked_until) VALUES (?, ?, ?, ?)",
+                    (self.name, tokens, updated, blocked_until)
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def acquire(self, timeout=None):
+        """Blocks until a token is taken. Returns False if `timeout` seconds pass first."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self._take()
+            if wait <= 0:
+                return True
+            if deadline is not None and time.monotonic() + wait > deadline:
+                return False
+            time.sleep(min(wait, _MAX_WAIT_SLICE_SECONDS))
+
+    def block_for(self, seconds):
+        """Empties the bucket and stops every caller from taking tokens for `seconds`."""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO buckets (name, tokens, updated, blocked_until) VALUES (?, 0, ?, ?)"
+                " ON CONFLICT(name) DO UPDATE SET tokens = 0, updated = excluded.updated,"
+                " blocked_until = MAX(blocked_until, excluded.blocked_until)",
+                (self.name, now, now + seconds)
+            )
+
+    def blocked_seconds(self):
+        """Seconds left on a shared block, 0 if none."""
+        with self._lock:
+            row = self._conn.execute("SELECT blocked_until FROM buckets WHERE name = ?", (self.name,)).fetchone()
+        return max(0.0, row[0] - time.time()) if row else 0.0
+
+    def close(self):
+        self._conn.close()
+
+
+class AdaptiveConcurrency:
+    """
+    AIMD limit on requests in flight: grows by one after a window of healthy
+    responses (about `limit` of them) and halves on every block.
+    """
+
+    def __init__(self, initial=DEFAULT_INITIAL_CONCURRENCY, minimum=DEFAULT_MIN_CONCURRENCY,
+                 maximum=DEFAULT_MAX_CONCURRENCY):
+        self.minimum = max(1, minimum)
+        self.maximum = max(self.minimum, maximum)
+        self.limit = float(min(max(initial, self.minimum), self.maximum))
+        self.in_flight = 0
+        self.waiting = 0
+        self._cond = threading.Condition()
+
+    def acquire(self):
+        with self._cond:
+            self.waiting += 1
+            try:
+                self._cond.wait_for(lambda: self.in_flight < int(self.limit))
+            finally:
+                self.waiting -= 1
+            self.in_flight += 1
+
+    def release(self):
+        with self._cond:
+            self.in_flight -= 1
+            self._cond.notify()
+
+    def on_success(self):
+        with self._cond:
+            previous = int(self.limit)
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            if int(self.limit) > previous:
+                self._cond.notify()
+
+    def on_block(self):
+        with self._cond:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class RateLimiter:
+    """
+    Rate control for PropertySearch_Post calls: a shared TokenBucket for the
+    sustained rate, AdaptiveConcurrency for requests in flight, and exponential
+    backoff with jitter after block responses.
+
+    Callers wrap each request in slot(), then report the outcome with
+    record_success(), record_block() or record_server_error(). Without a bucket
+    only concurrency and backoff apply.
+    """
+
+    def __init__(self, bucket=None, concurrency=None, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base_seconds=DEFAULT_BACKOFF_BASE_SECONDS, backoff_max_seconds=DEFAULT_BACKOFF_MAX_SECONDS):
+        """
+        Args:
+            bucket (TokenBucket): Shared request budget; None for no rate limit.
+            concurrency (AdaptiveConcurrency): In-flight limit; defaults to the module defaults.
+            max_retries (int): Retries of a blocked request before giving up.
+            backoff_base_seconds (float): Backoff after the first block; doubles per retry.
+            backoff_max_seconds (float): Upper bound of a single backoff.
+        """
+        self.bucket = bucket
+        self.concurrency = concurrency or AdaptiveConcurrency()
+        self.max_retries = max_retries
+        self.backoff_base_seconds = backoff_base_seconds
+        self.backoff_max_seconds = backoff_max_seconds
+        self.requests = 0
+        self.successes = 0
+        self.blocks = 0
+        self.server_errors = 0
+        self._lock = threading.Lock()
+        self._waiting_for_token = 0
+        self._blocked_until = 0.0
+        self._recent = deque()
+
+    @contextmanager
+    def slot(self):
+        """Waits for a concurrency slot, any block cool-down and a token, then holds the slot."""
+        self.concurrency.acquire()
+        try:
+            with self._lock:
+                self._waiting_for_token += 1
+            try:
+                pause = self._blocked_until - time.monotonic()
+                if pause > 0:
+                    time.sleep(pause)
+                if self.bucket is not None:
+                    self.bucket.acquire()
+            finally:
+                with self._lock:
+                    self._waiting_for_token -= 1
+            with self._lock:
+                self.requests += 1
+                now = time.monotonic()
+                self._recent.append(now)
+                while self._recent and self._recent[0] < now - _RATE_WINDOW_SECONDS:
+                    self._recent.popleft()
+            yield
+        finally:
+            self.concurrency.release()
+
+    def record_success(self):
+        with self._lock:
+            self.successes += 1
+        self.concurrency.on_success()
+
+    def record_server_error(self):
+        """Registers a 5xx response: halves the concurrency limit, without a block cool-down."""
+        with self._lock:
+            self.server_errors += 1
+        self.concurrency.on_block()
+
+    def record_block(self, attempt, retry_after=None):
+        """
+        Registers a block response for the given retry attempt (0 for the first try).
+
+        Halves the concurrency limit and pauses this limiter, and the shared
+        bucket, for a jittered exponential backoff (at least `retry_after`).
+
+        Returns:
+            float: The backoff in seconds.
+        """
+        ceiling = min(self.backoff_max_seconds, self.backoff_base_seconds * (2 ** attempt))
+        # Jitter keeps blocked workers from retrying in lockstep.
+        delay = random.uniform(ceiling / 2, ceiling)
+        if retry_after is not None:
+            delay = max(delay, min(retry_after, self.backoff_max_seconds))
+        with self._lock:
+            self.blocks += 1
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        self.concurrency.on_block()
+        if self.bucket is not None:
+            self.bucket.block_for(delay)
+        return delay
+
+    def stats(self):
+        """Current limits and load: configured and observed request rate, concurrency and queue depth."""
+        with self._lock:
+            now = time.monotonic()
+            recent = sum(1 for started in self._recent if started >= now - _RATE_WINDOW_SECONDS)
+            waiting_for_token = self._waiting_for_token
+            local_block = max(0.0, self._blocked_until - now)
+            counts = {"requests": self.requests, "successes": self.successes, "blocks": self.blocks,
+                      "server_errors": self.server_errors}
+        return dict(
+            counts,
+            rate_limit=self.bucket.rate if self.bucket is not None else None,
+            burst=self.bucket.burst if self.bucket is not None else None,
+            observed_rate=recent / _RATE_WINDOW_SECONDS,
+            concurrency_limit=int(self.concurrency.limit),
+            in_flight=self.concurrency.in_flight,
+            queue_depth=self.concurrency.waiting + waiting_for_token,
+            blocked_seconds=max(local_block, self.bucket.blocked_seconds() if self.bucket is not None else 0.0),
+        )
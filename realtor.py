@@ -0,0 +1,183 @@
+import time
+
+STARTED = time.perf_counter()
+
+import argparse
+import contextlib
+import json
+import os
+import sys
+
+# Subcommand modules (requests, NumPy, the crawlers, ...) are imported inside their handlers so
+# a short-lived invocation only pays for what it runs. Playwright is only imported if a cookie
+# has to be captured with the browser; pass --cookie (or set REALTOR_COOKIE) to skip it.
+
+DEFAULT_STORE_PATH = 'realtor_listings.sqlite'
+BBOX_METAVAR = ("LAT_MIN", "LON_MIN", "LAT_MAX", "LON_MAX")
+
+
+def make_client(args):
+    """RealtorClient for the global --api-url/--cookie options, or the process-wide client."""
+    import realtor_client
+
+    if args.config:
+        # Read by realtor_client.ensure_config() when the client is created.
+        realtor_client.CONFIG_FILE_PATH = args.config
+    if not args.api_url and not args.cookie:
+        return realtor_client.get_default_client()
+    from cookie_provider import StaticCookieProvider
+
+    return realtor_client.RealtorClient(
+        api_url=args.api_url or realtor_client.REALTOR_API_URL,
+        cookie_provider=StaticCookieProvider(args.cookie) if args.cookie else None)
+
+
+def fetch_kwargs(args):
+    kwargs = {}
+    if args.sort_order:
+        kwargs["sort_order"] = args.sort_order
+    if args.zoom_level is not None:
+        kwargs["zoom_level"] = args.zoom_level
+    return kwargs
+
+
+def load_shapes(path):
+    """Shapes from a JSON file: a list of shapes, or the map app's {'shapes': [...]} request body."""
+    with open(path, 'r') as f:
+        data = json.load(f)
+    return data.get("shapes", []) if isinstance(data, dict) else data
+
+
+def failure(command, result):
+    """Why a command's result means it failed, or None if it succeeded."""
+    if result is None:
+        return "no response"
+    if result.get("failed_requests"):
+        return f"{result['failed_requests']} requests failed"
+    error_id = result.get("ErrorCode", {}).get("Id", 200)
+    if command == "search" and error_id != 200:
+        return f"API error {error_id}"
+    return None
+
+
+def search(args):
+    client = make_client(args)
+    if args.all_pages:
+        from realtor_pagination import CountingClient, fetch_all_listings
+
+        counting = CountingClient(client)
+        listings = fetch_all_listings(tuple(args.bbox), client=counting, max_pages=args.max_pages,
+                                      **fetch_kwargs(args))
+        return {"Results": listings, "failed_requests": counting.failures}
+    lat_min, lon_min, lat_max, lon_max = args.bbox
+    return client.fetch(lat_max, lon_max, lat_min, lon_min, page_number=args.page, **fetch_kwargs(args))
+
+
+def crawl(args):
+    from listing_store import ListingStore
+    from two_phase_crawl import two_phase_crawl
+
+    client = make_client(args)
+    store = ListingStore(args.store)
+    reports = []
+    try:
+        # One crawl per shape: merged into one even-odd polygon, the overlap of two shapes would be left out.
+        for number, shape in enumerate(load_shapes(args.shapes)):
+            if isinstance(shape, dict):
+                described = {"id": shape.get("id", number), "name": shape.get("name")}
+                polygon, polygons = shape.get("polygon"), shape.get("polygons")
+            else:
+                described = {"id": number, "name": None}
+                polygon, polygons = shape, None
+            if not polygon and not polygons:
+                print(f"Shape {described['id']} has no polygon; skipping it.")
+                continue
+            report = two_phase_crawl(polygon=polygon, polygons=polygons, client=client, store=store,
+                                     **fetch_kwargs(args))
+            reports.append(dict(described, **report))
+    finally:
+        store.close()
+    return {"shapes": reports, "failed_requests": sum(report["failed_requests"] for report in reports)}
+
+
+def sync(args):
+    from delta_sync import sync_area
+    from listing_store import ListingStore
+
+    store = ListingStore(args.store)
+    try:
+        return sync_area(tuple(args.bbox), client=make_client(args), store=store, **fetch_kwargs(args))
+    finally:
+        store.close()
+
+
+def export(args):
+    from listing_export import ListingColumns
+    from listing_store import ListingStore
+
+    store = ListingStore(args.store)
+    try:
+        columns = ListingColumns.from_store(store)
+    finally:
+        store.close()
+    columns.save(args.output)
+    return {"listings": len(columns), "output": args.output}
+
+
+def add_fetch_options(parser, sort_order=True):
+    if sort_order:
+        parser.add_argument("--sort-order", help="Sort parameter, e.g. 6-D.")
+    parser.add_argument("--zoom-level", type=int)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="realtor", description="Realtor.ca search, crawl, sync and export.")
+    parser.add_argument("--config", help="Configuration file to use instead of config.json.")
+    parser.add_argument("--api-url", help="PropertySearch_Post endpoint to use instead of Realtor.ca's.")
+    parser.add_argument("--cookie", default=os.environ.get("REALTOR_COOKIE"),
+                        help="Fixed cookie (name=value) instead of one captured by the browser "
+                             "(default: $REALTOR_COOKIE).")
+    parser.add_argument("--store", default=DEFAULT_STORE_PATH, help="Listing store file (default: %(default)s).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    search_parser = commands.add_parser("search", help="Search a bounding box and print the response.")
+    search_parser.add_argument("--bbox", type=float, nargs=4, required=True, metavar=BBOX_METAVAR)
+    search_parser.add_argument("--page", type=int, default=1, help="Page to fetch (default: %(default)s).")
+    search_parser.add_argument("--all-pages", action="store_true", help="Fetch every reachable page.")
+    search_parser.add_argument("--max-pages", type=int, help="Cap on the pages fetched with --all-pages.")
+    add_fetch_options(search_parser)
+    search_parser.set_defaults(handler=search)
+
+    crawl_parser = commands.add_parser("crawl", help="Crawl the shapes of a polygon file into the listing store.")
+    crawl_parser.add_argument("shapes", help="JSON file with the shapes (as sent by the map app).")
+    add_fetch_options(crawl_parser)
+    crawl_parser.set_defaults(handler=crawl)
+
+    sync_parser = commands.add_parser("sync", help="Bring the listing store up to date for a bounding box.")
+    sync_parser.add_argument("--bbox", type=float, nargs=4, required=True, metavar=BBOX_METAVAR)
+    # Syncing always reads newest-first.
+    add_fetch_options(sync_parser, sort_order=False)
+    sync_parser.set_defaults(handler=sync, sort_order=None)
+
+    export_parser = commands.add_parser("export", help="Export the listing store to .npz or .parquet.")
+    export_parser.add_argument("output", help="Output path; '.parquet' needs pyarrow, anything else is written as .npz.")
+    export_parser.set_defaults(handler=export)
+
+    args = parser.parse_args(argv)
+    ready = time.perf_counter()
+    print(f"Started in {(ready - STARTED) * 1000:.0f} ms.", file=sys.stderr)
+    # Progress messages from the modules go to stderr so stdout carries only the JSON result.
+    with contextlib.redirect_stdout(sys.stderr):
+        result = args.handler(args)
+    if result is not None:
+        print(json.dumps(result, indent=2, default=str))
+    print(f"{args.command} took {time.perf_counter() - ready:.2f}s.", file=sys.stderr)
+    # Cron jobs rely on the exit status to notice failed runs.
+    reason = failure(args.command, result)
+    if reason:
+        print(f"{args.command} failed: {reason}.", file=sys.stderr)
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,36 @@
-import requests
 import json
-from cookie_retriever import get_realtor_cookie # Assuming cookie_retriever.py is in the same directory or accessible via PYTHONPATH
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from cookie_provider import get_default_provider # Assuming cookie_provider.py is in the same directory or accessible via PYTHONPATH
+from listing_parser import DEFAULT_CHUNK_SIZE as STREAM_CHUNK_SIZE, parse_listing_stream
+from metrics import RECORDER, REGISTRY, configure_capture, increment, timed
+from rate_limiter import (
+    DEFAULT_BURST, DEFAULT_REQUESTS_PER_SECOND, DEFAULT_STATE_PATH, AdaptiveConcurrency, RateLimiter, TokenBucket,
+    is_block_response, retry_after_seconds
+)
+from response_cache import ResponseCache, make_key
 
-CONFIG_FILE_PATH = 'config.json'
+# Next to this module, so the CLI and the map app (run from map_drawer_app/) read the same file.
+CONFIG_FILE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'config.json')
 API_DEFAULTS = {}
+RESPONSE_CACHE_SETTINGS = {}
+RATE_LIMIT_SETTINGS = {}
+_config_loaded = False
+_config_lock = threading.Lock()
 
 def load_config():
-    global API_DEFAULTS
+    global API_DEFAULTS, RESPONSE_CACHE_SETTINGS, RATE_LIMIT_SETTINGS
     try:
         with open(CONFIG_FILE_PATH, 'r') as f:
             config_data = json.load(f)
             API_DEFAULTS = config_data.get('realtor_api_defaults', {})
+            RESPONSE_CACHE_SETTINGS = config_data.get('response_cache', {})
+            RATE_LIMIT_SETTINGS = config_data.get('rate_limit', {})
+            configure_capture(**config_data.get('capture', {}))
         print("Configuration loaded successfully.")
     except FileNotFoundError:
         print(f"Warning: Configuration file '{CONFIG_FILE_PATH}' not found. Using hardcoded defaults.")
@@ -30,7 +50,15 @@ def load_config():
             "DefaultRecordsPerPage": 12, "DefaultZoomLevel": 15
         }
 
-load_config() # Load config when module is imported
+def ensure_config():
+    """Loads config.json on first use; later calls (from any thread) return immediately."""
+    global _config_loaded
+    if _config_loaded:
+        return
+    with _config_lock:
+        if not _config_loaded:
+            load_config()
+            _config_loaded = True
 
 FALLBACK_COOKIE_FILE_PATH = 'MapSearchAPI_Header.json'
 
@@ -79,6 +107,430 @@ DEFAULT_HEADERS = {
 
 REALTOR_API_URL = "https://api2.realtor.ca/Listing.svc/PropertySearch_Post"
 
+# Connection pool sizing for the shared session. One host is ever contacted, so a
+# single pool is enough; its size bounds how many requests can be in flight at once.
+DEFAULT_POOL_MAXSIZE = 16
+DEFAULT_TIMEOUT_SECONDS = 30
+
+# Payload parameters that do not change between pages of a search, in the order the
+# website sends them, mapped to (API_DEFAULTS key, hardcoded fallback).
+STATIC_PAYLOAD_DEFAULTS = {
+    "Sort": ("Sort", "6-D"),
+    "PropertyTypeGroupID": ("PropertyTypeGroupID", "1"),
+    "TransactionTypeId": ("TransactionTypeId", "2"),
+    "PropertySearchTypeId": ("PropertySearchTypeId", "0"),
+    "Currency": ("Currency", "CAD"),
+    "IncludeHiddenListings": ("IncludeHiddenListings", False),
+    "ApplicationId": ("ApplicationId", "1"),
+    "CultureId": ("CultureId", "1"),
+    "Version": ("Version", "7.0"),
+}
+
+# fetch_property_listings keyword -> payload parameter it overrides
+STATIC_PAYLOAD_OVERRIDES = {
+    "sort_order": "Sort",
+    "property_type_group_id": "PropertyTypeGroupID",
+    "transaction_type_id": "TransactionTypeId",
+    "property_search_type_id": "PropertySearchTypeId",
+    "currency": "Currency",
+    "include_hidden_listings": "IncludeHiddenListings",
+    "application_id": "ApplicationId",
+    "culture_id": "CultureId",
+    "version": "Version",
+}
+
+
+def normalize_bbox(bbox):
+    """
+    Normalizes a bounding box to a (lat_min, lon_min, lat_max, lon_max) tuple of floats.
+
+    Args:
+        bbox: Either a rectangle dict with 'lat_min', 'lon_min', 'lat_max' and 'lon_max'
+            keys (as sent by the map app, values may be strings) or a 4-sequence in
+            (lat_min, lon_min, lat_max, lon_max) order.
+
+    Returns:
+        tuple: (lat_min, lon_min, lat_max, lon_max)
+    """
+    if isinstance(bbox, dict):
+        bbox = (bbox['lat_min'], bbox['lon_min'], bbox['lat_max'], bbox['lon_max'])
+    lat_min, lon_min, lat_max, lon_max = (float(v) for v in bbox)
+    return min(lat_min, lat_max), min(lon_min, lon_max), max(lat_min, lat_max), max(lon_min, lon_max)
+
+
+class RealtorClient:
+    """
+    Client for PropertySearch_Post that reuses one pooled, keep-alive HTTP session.
+
+    Base headers are installed on the session once and the static part of the
+    form payload is pre-encoded, so each call only fills in the bounding box,
+    zoom level, page size and page number. Every request goes through a
+    RateLimiter; blocked requests are retried after a backoff with a fresh cookie.
+    """
+
+    def __init__(self, api_url=REALTOR_API_URL, cookie_provider=None,
+                 pool_maxsize=DEFAULT_POOL_MAXSIZE, timeout=DEFAULT_TIMEOUT_SECONDS, cache=None,
+                 rate_limiter=None):
+        """
+        Args:
+            api_url (str): PropertySearch_Post endpoint.
+            cookie_provider: Object with get_cookie()/invalidate(cookie); defaults to the
+                process-wide CookieProvider.
+            pool_maxsize (int): Maximum number of kept-alive connections.
+            timeout (float): Per-request timeout in seconds.
+            cache (ResponseCache): Optional on-disk cache for successful responses.
+            rate_limiter (RateLimiter): Rate control for requests; defaults to the
+                process-wide limiter, which shares its budget with other processes.
+        """
+        ensure_config()
+        self.api_url = api_url
+        self.cookie_provider = cookie_provider
+        self.rate_limiter = rate_limiter
+        self.timeout = timeout
+        self.cache = cache
+
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize, pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.session.headers.clear()
+        self.session.headers.update(DEFAULT_HEADERS)
+
+        self.default_zoom_level = API_DEFAULTS.get("DefaultZoomLevel", 15)
+        self.default_records_per_page = API_DEFAULTS.get("DefaultRecordsPerPage", 12)
+        self.static_params = {
+            name: API_DEFAULTS.get(config_key, fallback)
+            for name, (config_key, fallback) in STATIC_PAYLOAD_DEFAULTS.items()
+        }
+        self._templates = {}
+        self._templates_lock = threading.Lock()
+
+    def close(self):
+        self.session.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _get_cookie_provider(self):
+        if self.cookie_provider is None:
+            self.cookie_provider = get_default_provider()
+        return self.cookie_provider
+
+    def _get_rate_limiter(self):
+        if self.rate_limiter is None:
+            self.rate_limiter = get_default_rate_limiter()
+        return self.rate_limiter
+
+    def _payload_template(self, overrides):
+        """Returns (static_params, format string) for the given static overrides, building it once."""
+        key = tuple(sorted(overrides.items()))
+        template = self._templates.get(key)
+        if template is None:
+            params = dict(self.static_params, **overrides)
+            params["IncludeHiddenListings"] = str(params["IncludeHiddenListings"]).lower()
+            head = "&".join(f"{name}={params[name]}" for name in ("Sort", "PropertyTypeGroupID", "TransactionTypeId",
+                                                                   "PropertySearchTypeId", "Currency", "IncludeHiddenListings"))
+            tail = "&".join(f"{name}={params[name]}" for name in ("ApplicationId", "CultureId", "Version"))
+            # Literal braces in the static values must survive str.format.
+            head = head.replace("{", "{{").replace("}", "}}")
+            tail = tail.replace("{", "{{").replace("}", "}}")
+            fmt = ("ZoomLevel={zoom}&LatitudeMax={lat_max}&LongitudeMax={lon_max}"
+                   "&LatitudeMin={lat_min}&LongitudeMin={lon_min}&" + head +
+                   "&RecordsPerPage={per_page}&" + tail + "&CurrentPage={page}")
+            template = (params, fmt)
+            with self._templates_lock:
+                self._templates[key] = template
+        return template
+
+    def build_payload(self, latitude_max, longitude_max, latitude_min, longitude_min,
+                      page_number=1, zoom_level=None, records_per_page=None, **overrides):
+        """
+        Builds the form payload for one page of a search.
+
+        Args:
+            overrides: Any of the fetch_property_listings keywords for static parameters
+                (sort_order, currency, ...); None values are ignored.
+
+        Returns:
+            tuple: (payload_params dict, URL-encoded payload string)
+        """
+        static_overrides = {
+            STATIC_PAYLOAD_OVERRIDES[name]: value for name, value in overrides.items() if value is not None
+        }
+        static_params, fmt = self._payload_template(static_overrides)
+        zoom = zoom_level if zoom_level is not None else self.default_zoom_level
+        per_page = records_per_page if records_per_page is not None else self.default_records_per_page
+        payload_str = fmt.format(
+            zoom=zoom, lat_max=latitude_max, lon_max=longitude_max, lat_min=latitude_min,
+            lon_min=longitude_min, per_page=per_page, page=page_number
+        )
+        payload_params = {
+            "ZoomLevel": zoom,
+            "LatitudeMax": latitude_max,
+            "LongitudeMax": longitude_max,
+            "LatitudeMin": latitude_min,
+            "LongitudeMin": longitude_min,
+            **static_params,
+            "RecordsPerPage": per_page,
+            "CurrentPage": page_number,
+        }
+        return payload_params, payload_str
+
+    def _get_cookie(self):
+        """Returns (cookie, is_dynamic): the provider's cookie, or the fallback cookie if none."""
+        dynamic_cookie = None
+        try:
+            dynamic_cookie = self._get_cookie_provider().get_cookie()
+            if not dynamic_cookie:
+                print("Failed to retrieve dynamic cookie.")
+        except Exception as e:
+            print(f"Error during dynamic cookie retrieval: {e}")
+        if dynamic_cookie:
+            return dynamic_cookie, True
+
+        print("Attempting to load fallback cookie...")
+        fallback_cookie = load_fallback_cookie()
+        if not fallback_cookie:
+            print("No dynamic or fallback cookie available. Proceeding without cookie (API call may fail).")
+        return fallback_cookie, False
+
+    def _post(self, payload_params, payload_str, stream=False):
+        """
+        Sends one PropertySearch_Post request.
+
+        Returns:
+            requests.Response: The successful response, or None if an error occurred.
+        """
+        # Request/response capture is opt-in and sampled (see 'capture' in config.json).
+        capture = RECORDER.sampled()
+        if capture:
+            RECORDER.record("request", {
+                "url": self.api_url,
+                "headers_before_cookie": dict(self.session.headers), # Headers without cookie
+                "payload_params": payload_params,
+                "payload_str": payload_str
+            })
+
+        limiter = self._get_rate_limiter()
+        for attempt in range(limiter.max_retries + 1):
+            with timed("cookie_acquire"):
+                cookie, is_dynamic = self._get_cookie()
+            headers = {"Cookie": cookie} if cookie else None
+
+            print(f"Making POST request to {self.api_url}")
+            print(f"Payload: {payload_str}")
+
+            response = None
+            try:
+                waiting_since = time.perf_counter()
+                with limiter.slot():
+                    REGISTRY.observe("rate_limit_wait", time.perf_counter() - waiting_since)
+                    increment("requests")
+                    increment("bytes_sent", len(payload_str))
+                    with timed("network_round_trip"):
+                        response = self.session.post(self.api_url, headers=headers, data=payload_str,
+                                                     timeout=self.timeout, stream=stream)
+                if is_block_response(response):
+                    delay = limiter.record_block(attempt, retry_after_seconds(response))
+                    increment("blocks")
+                    response.close()
+                    if is_dynamic:
+                        # Blocks are tied to the session cookie; retry with a freshly captured one.
+                        self._get_cookie_provider().invalidate(cookie)
+                    if attempt < limiter.max_retries:
+                        increment("retries")
+                        print(f"Request blocked (HTTP {response.status_code}); retrying in {delay:.1f}s "
+                              f"(attempt {attempt + 1} of {limiter.max_retries}).")
+                    continue
+                if response.status_code >= 500:
+                    limiter.record_server_error()
+                response.raise_for_status()  # Raises an HTTPError for bad responses (4XX or 5XX)
+                # Only healthy responses grow the concurrency limit; other 4XX errors leave it unchanged.
+                limiter.record_success()
+                print(f"API request successful. Status: {response.status_code}")
+                if capture and not stream:
+                    RECORDER.record("response", {
+                        "status": response.status_code,
+                        "headers": dict(response.headers),
+                        "body": response.text
+                    })
+                return response
+            except requests.exceptions.HTTPError as http_err:
+                increment("request_errors")
+                print(f"HTTP error occurred: {http_err}")
+                print(f"Response content: {response.text}")
+                if response.status_code == 401 and is_dynamic:
+                    # The cookie was rejected; make the provider capture a new one through the browser.
+                    self._get_cookie_provider().invalidate(cookie)
+            except requests.exceptions.ConnectionError as conn_err:
+                increment("request_errors")
+                print(f"Connection error occurred: {conn_err}")
+            except requests.exceptions.Timeout as timeout_err:
+                increment("request_errors")
+                print(f"Timeout error occurred: {timeout_err}")
+            except requests.exceptions.RequestException as req_err:
+                increment("request_errors")
+                print(f"An error occurred during the request: {req_err}")
+            return None
+        print(f"Request still blocked after {limiter.max_retries} retries; giving up.")
+        return None
+
+    def fetch(self, latitude_max, longitude_max, latitude_min, longitude_min,
+              page_number=1, zoom_level=None, records_per_page=None, use_cache=True, **overrides):
+        """
+        Fetches one page of property listings. Takes the same arguments as fetch_property_listings.
+
+        `use_cache=False` always asks the API (the response is not cached either);
+        crawls and syncs that must see current data pass it.
+
+        Returns:
+            dict: The JSON response from the API, or None if an error occurs.
+        """
+        with timed("payload_build"):
+            payload_params, payload_str = self.build_payload(
+                latitude_max, longitude_max, latitude_min, longitude_min,
+                page_number=page_number, zoom_level=zoom_level, records_per_page=records_per_page, **overrides
+            )
+
+        cache_key = None
+        if self.cache is not None and use_cache:
+            cache_key = make_key("page", payload_params)
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                increment("cache_hits")
+                print(f"Serving page {page_number} from response cache.")
+                return cached
+            increment("cache_misses")
+
+        response = self._post(payload_params, payload_str)
+        if response is None:
+            return None
+        increment("bytes_received", len(response.content))
+        try:
+            with timed("json_decode"):
+                data = response.json()
+        except json.JSONDecodeError:
+            print("Failed to decode JSON response.")
+            print(f"Response content: {response.text}")
+            return None
+        if cache_key is not None and data.get("ErrorCode", {}).get("Id", 200) == 200:
+            self.cache.put(cache_key, data)
+        return data
+
+    def fetch_listings(self, latitude_max, longitude_max, latitude_min, longitude_min,
+                       page_number=1, zoom_level=None, records_per_page=None,
+                       fields=None, keep_raw=(), **overrides):
+        """
+        Fetches one page and parses it incrementally into compact Listing records.
+
+        The body is streamed and each listing is projected as soon as it has
+        arrived, so the full nested response is never held in memory. Bypasses
+        the response cache, which stores full responses.
+
+        Args:
+            fields (iterable): Names from listing_parser.LISTING_FIELDS to extract; defaults to all.
+            keep_raw (iterable): Dotted paths (e.g. 'Property.Photo') whose raw JSON is kept.
+            Other arguments are the same as for fetch.
+
+        Returns:
+            listing_parser.ListingPage: Parsed page, or None if an error occurs.
+        """
+        with timed("payload_build"):
+            payload_params, payload_str = self.build_payload(
+                latitude_max, longitude_max, latitude_min, longitude_min,
+                page_number=page_number, zoom_level=zoom_level, records_per_page=records_per_page, **overrides
+            )
+        response = self._post(payload_params, payload_str, stream=True)
+        if response is None:
+            return None
+
+        def counted_chunks():
+            for chunk in response.iter_content(STREAM_CHUNK_SIZE):
+                increment("bytes_received", len(chunk))
+                yield chunk
+
+        try:
+            # Streaming overlaps download and parsing, so this times both.
+            with response, timed("stream_parse"):
+                return parse_listing_stream(counted_chunks(), fields, keep_raw)
+        except ValueError as e:
+            print(f"Failed to parse streamed response: {e}")
+        except requests.exceptions.RequestException as req_err:
+            print(f"An error occurred while streaming the response: {req_err}")
+        return None
+
+
+_default_rate_limiter = None
+_default_rate_limiter_lock = threading.Lock()
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def make_rate_limiter(journal_mode="WAL"):
+    """
+    Creates a RateLimiter configured from config.json.
+
+    Its token bucket is shared by every process through the state file, which a
+    relative 'state_path' places next to config.json. The bucket runs at the
+    rate_limiter defaults unless config.json sets a rate; a rate of 0 turns it off.
+
+    Args:
+        journal_mode (str): Journal mode of the bucket's state file (see TokenBucket).
+    """
+    ensure_config()
+    settings = RATE_LIMIT_SETTINGS
+    bucket = None
+    rate = settings.get("requests_per_second", DEFAULT_REQUESTS_PER_SECOND)
+    if rate:
+        bucket = TokenBucket(
+            path=os.path.join(os.path.dirname(os.path.abspath(CONFIG_FILE_PATH)),
+                              settings.get("state_path", DEFAULT_STATE_PATH)),
+            rate=rate,
+            burst=settings.get("burst", DEFAULT_BURST),
+            journal_mode=journal_mode
+        )
+    concurrency = AdaptiveConcurrency(
+        initial=settings.get("initial_concurrency", 4),
+        minimum=settings.get("min_concurrency", 1),
+        maximum=settings.get("max_concurrency", 16)
+    )
+    return RateLimiter(
+        bucket, concurrency,
+        max_retries=settings.get("max_retries", 4),
+        backoff_base_seconds=settings.get("backoff_base_seconds", 2.0),
+        backoff_max_seconds=settings.get("backoff_max_seconds", 120.0)
+    )
+
+
+def get_default_rate_limiter():
+    """Returns the process-wide RateLimiter (see make_rate_limiter), creating it on first use."""
+    global _default_rate_limiter
+    with _default_rate_limiter_lock:
+        if _default_rate_limiter is None:
+            _default_rate_limiter = make_rate_limiter()
+        return _default_rate_limiter
+
+
+def get_default_client():
+    """Returns the process-wide RealtorClient, creating it on first use."""
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            ensure_config()
+            cache = None
+            if RESPONSE_CACHE_SETTINGS.get("enabled"):
+                cache = ResponseCache(
+                    path=RESPONSE_CACHE_SETTINGS.get("path", "realtor_response_cache.sqlite"),
+                    ttl_seconds=RESPONSE_CACHE_SETTINGS.get("ttl_seconds", 900),
+                    max_bytes=RESPONSE_CACHE_SETTINGS.get("max_megabytes", 256) * 1024 * 1024
+                )
+            _default_client = RealtorClient(cache=cache)
+        return _default_client
+
+
 def fetch_property_listings(
     latitude_max, longitude_max, latitude_min, longitude_min,
     page_number=1,
@@ -90,6 +542,9 @@ def fetch_property_listings(
     """
     Fetches property listings from Realtor.ca API.
 
+    Thin wrapper around the process-wide RealtorClient, so consecutive calls share
+    its pooled connections.
+
     Args:
         latitude_max (float): Maximum latitude for the search bounding box.
         longitude_max (float): Maximum longitude for the search bounding box.
@@ -111,111 +566,14 @@ def fetch_property_listings(
     Returns:
         dict: The JSON response from the API, or None if an error occurs.
     """
-    # Use provided values or fall back to config defaults
-    current_zoom_level = zoom_level if zoom_level is not None else API_DEFAULTS.get("DefaultZoomLevel", 15)
-    current_records_per_page = records_per_page if records_per_page is not None else API_DEFAULTS.get("DefaultRecordsPerPage", 12)
-    current_sort_order = sort_order if sort_order is not None else API_DEFAULTS.get("Sort", "6-D")
-    current_property_type_group_id = property_type_group_id if property_type_group_id is not None else API_DEFAULTS.get("PropertyTypeGroupID", "1")
-    current_transaction_type_id = transaction_type_id if transaction_type_id is not None else API_DEFAULTS.get("TransactionTypeId", "2")
-    current_property_search_type_id = property_search_type_id if property_search_type_id is not None else API_DEFAULTS.get("PropertySearchTypeId", "0")
-    current_currency = currency if currency is not None else API_DEFAULTS.get("Currency", "CAD")
-    current_include_hidden_listings = include_hidden_listings if include_hidden_listings is not None else API_DEFAULTS.get("IncludeHiddenListings", False)
-    current_application_id = application_id if application_id is not None else API_DEFAULTS.get("ApplicationId", "1")
-    current_culture_id = culture_id if culture_id is not None else API_DEFAULTS.get("CultureId", "1")
-    current_version = version if version is not None else API_DEFAULTS.get("Version", "7.0")
-
-    # Define payload first (moved up, original cookie logic removed)
-    payload_params = {
-        "ZoomLevel": current_zoom_level,
-        "LatitudeMax": latitude_max,
-        "LongitudeMax": longitude_max,
-        "LatitudeMin": latitude_min,
-        "LongitudeMin": longitude_min,
-        "Sort": current_sort_order,
-        "PropertyTypeGroupID": current_property_type_group_id,
-        "TransactionTypeId": current_transaction_type_id,
-        "PropertySearchTypeId": current_property_search_type_id,
-        "Currency": current_currency,
-        "IncludeHiddenListings": str(current_include_hidden_listings).lower(),
-        "RecordsPerPage": current_records_per_page,
-        "ApplicationId": current_application_id,
-        "CultureId": current_culture_id,
-        "Version": current_version,
-        "CurrentPage": page_number
-    }
-    payload_str = "&".join([f"{key}={value}" for key, value in payload_params.items()])
-
-    # Define initial headers (without cookie)
-    initial_headers = DEFAULT_HEADERS.copy()
-
-    # --- Capture initial request details (before cookie attempt) ---
-    request_details_to_save = {
-        "url": REALTOR_API_URL,
-        "headers_before_cookie": initial_headers, # Headers without cookie
-        "payload_params": payload_params,
-        "payload_str": payload_str
-    }
-    try:
-        with open('intercepted_request.json', 'w') as f_json:
-            json.dump(request_details_to_save, f_json, indent=4)
-        print("Successfully saved initial intercepted request details to intercepted_request.json")
-    except IOError as e:
-        print(f"Error saving initial intercepted request details: {e}")
-    # --- End capture initial request details ---
-
-    print("Attempting to fetch property listings...") # Moved this print down
-
-    # Now, attempt to get the cookie
-    dynamic_cookie = None
-    try:
-        print("Retrieving cookie dynamically...")
-        dynamic_cookie = get_realtor_cookie()
-        if dynamic_cookie:
-            print(f"Dynamic cookie retrieved: {dynamic_cookie[:50]}...")
-        else:
-            print("Failed to retrieve dynamic cookie.")
-    except Exception as e:
-        print(f"Error during dynamic cookie retrieval: {e}")
-
-    # Determine which cookie to use
-    final_cookie_to_use = dynamic_cookie
-    if not final_cookie_to_use:
-        print("Attempting to load fallback cookie...")
-        fallback_cookie = load_fallback_cookie()
-        if fallback_cookie:
-            final_cookie_to_use = fallback_cookie
-            print(f"Using fallback cookie: {fallback_cookie[:50]}...")
-        else:
-            print("No dynamic or fallback cookie available. Proceeding without cookie (API call may fail).")
-
-    # Prepare final headers for the actual request
-    final_headers = initial_headers.copy() # Start with headers that were saved
-    if final_cookie_to_use:
-        final_headers["Cookie"] = final_cookie_to_use
-    # The content-length will be set automatically by requests library for POST data
-
-    print(f"Making POST request to {REALTOR_API_URL}")
-    print(f"Payload: {payload_str}")
-    # print(f"Final Headers: {final_headers}") # Be cautious printing headers with cookies
-
-    try:
-        response = requests.post(REALTOR_API_URL, headers=final_headers, data=payload_str, timeout=30)
-        response.raise_for_status()  # Raises an HTTPError for bad responses (4XX or 5XX)
-        print(f"API request successful. Status: {response.status_code}")
-        return response.json()
-    except requests.exceptions.HTTPError as http_err:
-        print(f"HTTP error occurred: {http_err}")
-        print(f"Response content: {response.text}")
-    except requests.exceptions.ConnectionError as conn_err:
-        print(f"Connection error occurred: {conn_err}")
-    except requests.exceptions.Timeout as timeout_err:
-        print(f"Timeout error occurred: {timeout_err}")
-    except requests.exceptions.RequestException as req_err:
-        print(f"An error occurred during the request: {req_err}")
-    except json.JSONDecodeError:
-        print("Failed to decode JSON response.")
-        print(f"Response content: {response.text}")
-    return None
+    return get_default_client().fetch(
+        latitude_max, longitude_max, latitude_min, longitude_min,
+        page_number=page_number, zoom_level=zoom_level, records_per_page=records_per_page,
+        sort_order=sort_order, property_type_group_id=property_type_group_id,
+        transaction_type_id=transaction_type_id, property_search_type_id=property_search_type_id,
+        currency=currency, include_hidden_listings=include_hidden_listings,
+        application_id=application_id, culture_id=culture_id, version=version
+    )
 
 if __name__ == '__main__':
     print("Running realtor_client.py directly for testing...")
@@ -239,6 +597,9 @@ if __name__ == '__main__':
 
     if listings_data:
         print("\nSuccessfully fetched listings data!")
+        from listing_store import ListingStore
+        stored_listings, stored_pins = ListingStore().ingest_response(listings_data)
+        print(f"Stored {stored_listings} listings and {stored_pins} pins in the local listing store.")
         # print(json.dumps(listings_data, indent=2)) # Pretty print the JSON
         print(f"Found {listings_data.get('Paging', {}).get('TotalRecords', 0)} total records.")
         results = listings_data.get('Results', [])
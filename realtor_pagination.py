@@ -0,0 +1,136 @@
+import asyncio
+import math
+
+from realtor_client import get_default_client, normalize_bbox
+
+# Number of pages requested at the same time. Keep this at or below the client's
+# connection pool size so every in-flight page has a kept-alive connection.
+DEFAULT_PAGE_CONCURRENCY = 8
+
+
+class CountingClient:
+    """Wraps a RealtorClient to count the requests a crawl makes, and those that failed."""
+
+    def __init__(self, client):
+        self.client = client
+        self.requests = 0
+        self.failures = 0
+
+    def fetch(self, *args, **kwargs):
+        self.requests += 1
+        response = self.client.fetch(*args, **kwargs)
+        if response is None:
+            self.failures += 1
+        return response
+
+
+def reachable_page_count(paging):
+    """
+    Returns how many pages of a search can actually be requested.
+
+    The API reports TotalPages, but never serves more than MaxRecords listings
+    (see MapSearchAPI_Return.json: 657 total records, 600 max), so the count is
+    capped at MaxRecords / RecordsPerPage when both are present.
+
+    Args:
+        paging (dict): The 'Paging' block of a PropertySearch_Post response.
+    """
+    total_pages = int(paging.get("TotalPages") or 1)
+    max_records = paging.get("MaxRecords")
+    records_per_page = paging.get("RecordsPerPage")
+    if max_records and records_per_page:
+        total_pages = min(total_pages, math.ceil(int(max_records) / int(records_per_page)))
+    return max(total_pages, 1)
+
+
+async def fetch_all_pages(bbox, client=None, concurrency=DEFAULT_PAGE_CONCURRENCY, max_pages=None,
+                          first_page=None, **fetch_kwargs):
+    """
+    Streams every listing of a bounding box, fetching the pages concurrently.
+
+    Page 1 is fetched first to learn the paging; the remaining pages are then
+    requested with at most `concurrency` in flight, and their listings are
+    yielded as each page arrives (not in page order). Listings are deduplicated
+    by Id, since results can shift between pages while the crawl is running.
+
+    Args:
+        bbox: Bounding box accepted by realtor_client.normalize_bbox.
+        client (RealtorClient): Client to use; defaults to the process-wide client.
+        concurrency (int): Maximum number of pages in flight.
+        max_pages (int): Optional cap on the number of pages fetched.
+        first_page (dict): Already fetched response for page 1 of this bbox, if the caller has one.
+        fetch_kwargs: Extra arguments for RealtorClient.fetch (zoom_level, sort_order, ...).
+
+    Yields:
+        dict: Entries of the responses' 'Results' arrays.
+    """
+    client = client or get_default_client()
+    lat_min, lon_min, lat_max, lon_max = normalize_bbox(bbox)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def fetch_page(page_number):
+        async with semaphore:
+            return page_number, await asyncio.to_thread(
+                client.fetch, lat_max, lon_max, lat_min, lon_min, page_number=page_number, **fetch_kwargs
+            )
+
+    if first_page is None:
+        _, first_page = await fetch_page(1)
+    if first_page is None:
+        print("Failed to fetch the first page; no listings to stream.")
+        return
+
+    seen_ids = set()
+
+    def new_results(response):
+        for listing in response.get("Results", []):
+            listing_id = listing.get("Id")
+            if listing_id in seen_ids:
+                continue
+            seen_ids.add(listing_id)
+            yield listing
+
+    for listing in new_results(first_page):
+        yield listing
+
+    page_count = reachable_page_count(first_page.get("Paging", {}))
+    if max_pages is not None:
+        page_count = min(page_count, max_pages)
+    if page_count <= 1:
+        return
+
+    tasks = [asyncio.create_task(fetch_page(page_number)) for page_number in range(2, page_count + 1)]
+    try:
+        for next_done in asyncio.as_completed(tasks):
+            page_number, response = await next_done
+            if response is None:
+                print(f"Page {page_number} could not be fetched; its listings are missing from this crawl.")
+                continue
+            for listing in new_results(response):
+                yield listing
+    finally:
+        # Stop outstanding pages if the consumer stops iterating early.
+        for task in tasks:
+            task.cancel()
+
+
+def fetch_all_listings(bbox, **kwargs):
+    """
+    Synchronous helper that collects fetch_all_pages into a list.
+
+    Args:
+        bbox: Bounding box accepted by realtor_client.normalize_bbox.
+        kwargs: Passed through to fetch_all_pages.
+
+    Returns:
+        list: Deduplicated listing dicts.
+    """
+    async def collect():
+        return [listing async for listing in fetch_all_pages(bbox, **kwargs)]
+    return asyncio.run(collect())
+
+
+if __name__ == '__main__':
+    example_bbox = (45.41715, -75.72110, 45.43411, -75.68209)
+    listings = fetch_all_listings(example_bbox)
+    print(f"Fetched {len(listings)} unique listings.")
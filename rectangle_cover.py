@@ -0,0 +1,245 @@
+import heapq
+
+import numpy as np
+
+# Fractions below this are treated as zero, so rectangles whose edges only differ
+# by coordinate rounding (the map app sends 6 decimals) still count as adjacent.
+_AREA_EPSILON = 1e-9
+# Boxes whose first merge partner is searched at once (a block x n over-fetch matrix).
+_PARTNER_BLOCK_ROWS = 256
+
+
+def cover_mask(mask):
+    """
+    Covers the True cells of a grid mask with maximal rectangles, exactly.
+
+    Each row is split into runs of consecutive True cells, and a run is merged
+    into the rectangle above it when both span the same columns.
+
+    Args:
+        mask (numpy.ndarray): Boolean (rows, cols) grid, e.g. from polygon_geometry.grid_mask.
+
+    Returns:
+        list: (row_start, col_start, row_end, col_end) tuples with exclusive ends.
+    """
+    mask = np.asarray(mask, dtype=bool)
+    rows, cols = mask.shape
+    padded = np.zeros((rows, cols + 2), dtype=np.int8)
+    padded[:, 1:-1] = mask
+    edges = np.diff(padded, axis=1)
+    run_rows, run_starts = np.nonzero(edges == 1)
+    _, run_ends = np.nonzero(edges == -1)
+    row_bounds = np.searchsorted(run_rows, np.arange(rows + 1))
+
+    finished = []
+    active = {}  # (col_start, col_end) -> first row of a rectangle still growing downwards
+    for row in range(rows):
+        runs = zip(run_starts[row_bounds[row]:row_bounds[row + 1]].tolist(),
+                   run_ends[row_bounds[row]:row_bounds[row + 1]].tolist())
+        growing = {run: active.pop(run, row) for run in runs}
+        for (col_start, col_end), row_start in active.items():
+            finished.append((row_start, col_start, row, col_end))
+        active = growing
+    for (col_start, col_end), row_start in active.items():
+        finished.append((row_start, col_start, rows, col_end))
+    return finished
+
+
+def cells_to_bounds(cells, bounds, lat_step, lon_step):
+    """Converts (row_start, col_start, row_end, col_end) cell ranges into (lat_min, lon_min, lat_max, lon_max)."""
+    lat_min, lon_min = bounds[0], bounds[1]
+    return [
+        (lat_min + r0 * lat_step, lon_min + c0 * lon_step, lat_min + r1 * lat_step, lon_min + c1 * lon_step)
+        for r0, c0, r1, c1 in cells
+    ]
+
+
+def _area(rects):
+    return (rects[..., 2] - rects[..., 0]) * (rects[..., 3] - rects[..., 1])
+
+
+def check_tolerance(tolerance):
+    """Returns the over-fetch tolerance as a float; raises ValueError unless it is a number from 0 to 1."""
+    value = float(tolerance)
+    if not 0.0 <= value <= 1.0:  # Also rejects NaN.
+        raise ValueError(f"tolerance must be a number from 0 to 1, got {tolerance!r}")
+    return value
+
+
+def merge_rectangles(rects, tolerance=0.0, inside_areas=None):
+    """
+    Greedily merges rectangles into their bounding boxes while the over-fetch stays within tolerance.
+
+    The over-fetch of a merged rectangle is the fraction of its area not covered
+    by the area it was built from. At each step the pair with the smallest
+    over-fetch is merged, and any rectangle that ends up inside a merged bounding
+    box is absorbed into it. With tolerance 0 only merges that lose nothing
+    (adjacent rectangles with a shared edge) happen.
+
+    Args:
+        rects (list): (lat_min, lon_min, lat_max, lon_max) tuples; assumed not to overlap.
+        tolerance (float): Maximum over-fetch fraction per merged rectangle, 0 to 1.
+        inside_areas (list): Area of each rectangle that is actually wanted; defaults
+            to the full rectangle area.
+
+    Returns:
+        list: Merged (lat_min, lon_min, lat_max, lon_max) tuples.
+
+    Raises:
+        ValueError: If tolerance is not a number from 0 to 1.
+    """
+    tolerance = check_tolerance(tolerance)
+    if len(rects) < 2:
+        return [tuple(r) for r in rects]
+    boxes = np.array(rects, dtype=np.float64)
+    inside = _area(boxes) if inside_areas is None else np.array(inside_areas, dtype=np.float64)
+    alive = np.ones(len(boxes), dtype=bool)
+    limit = tolerance + _AREA_EPSILON
+    # One contiguous array per edge; merges grow the boxes in place here.
+    lat_min, lon_min, lat_max, lon_max = (np.ascontiguousarray(boxes[:, k]) for k in range(4))
+
+    def over_fetch(rows):
+        """Over-fetch of merging each box in `rows` with every box, inf where not allowed."""
+        rows = np.asarray(rows)[:, None]
+        union_area = ((np.maximum(lat_max, lat_max[rows]) - np.minimum(lat_min, lat_min[rows]))
+                      * (np.maximum(lon_max, lon_max[rows]) - np.minimum(lon_min, lon_min[rows])))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            waste = np.where(union_area > 0, 1.0 - (inside + inside[rows]) / union_area, 0.0)
+        waste = np.maximum(waste, 0.0)
+        waste[:, ~alive] = np.inf
+        waste[np.arange(len(rows)), rows[:, 0]] = np.inf
+        return waste
+
+    # Instead of an n x n over-fetch matrix, every box keeps only its best partner in a heap. Entries
+    # carry the versions of both boxes and are re-evaluated when popped if either box has changed
+    # since, so each merge costs O(n) rather than a scan and update of the whole matrix.
+    best = np.full(len(boxes), np.inf)
+    version = [0] * len(boxes)
+    heap = []
+
+    def push(i, j, waste):
+        best[i] = waste
+        if waste <= limit:
+            heapq.heappush(heap, (waste, i, j, version[i], version[j]))
+
+    def find_partner(i):
+        waste = over_fetch([i])[0]
+        j = int(np.argmin(waste))
+        push(i, j, float(waste[j]))
+        return waste
+
+    for start in range(0, len(boxes), _PARTNER_BLOCK_ROWS):
+        rows = np.arange(start, min(start + _PARTNER_BLOCK_ROWS, len(boxes)))
+        waste = over_fetch(rows)
+        partners = np.argmin(waste, axis=1)
+        for i, j, value in zip(rows.tolist(), partners.tolist(), waste[np.arange(len(rows)), partners].tolist()):
+            push(i, j, value)
+    while heap:
+        waste, i, j, version_i, version_j = heapq.heappop(heap)
+        if not alive[i] or version[i] != version_i:
+            continue  # Superseded by a newer entry for i.
+        if not alive[j] or version[j] != version_j:
+            find_partner(i)  # The partner was merged away or has grown.
+            continue
+        lat_min[i] = min(lat_min[i], lat_min[j])
+        lon_min[i] = min(lon_min[i], lon_min[j])
+        lat_max[i] = max(lat_max[i], lat_max[j])
+        lon_max[i] = max(lon_max[i], lon_max[j])
+        inside[i] += inside[j]
+        alive[j] = False
+        # Absorb anything the grown box now contains.
+        contained = (alive & (lat_min >= lat_min[i]) & (lon_min >= lon_min[i])
+                     & (lat_max <= lat_max[i]) & (lon_max <= lon_max[i]))
+        contained[i] = False
+        inside[i] += inside[contained].sum()
+        alive[contained] = False
+        version[i] += 1
+
+        # Boxes whose best partner died find a new one when popped; the grown box may be a better
+        # partner for any box, which the row computed for it shows directly.
+        row = find_partner(i)
+        for k in np.nonzero((row < best) & (row <= limit))[0].tolist():
+            push(k, i, float(row[k]))
+    merged = np.stack([lat_min, lon_min, lat_max, lon_max], axis=1)
+    return [tuple(box) for box in merged[alive].tolist()]
+
+
+def is_covered(rect, others):
+    """
+    Returns True if `rect` lies entirely inside the union of `others`.
+
+    Args:
+        rect (tuple): (lat_min, lon_min, lat_max, lon_max).
+        others (list): Rectangles in the same form.
+    """
+    lat_min, lon_min, lat_max, lon_max = rect
+    clipped = [
+        (max(o[0], lat_min), max(o[1], lon_min), min(o[2], lat_max), min(o[3], lon_max))
+        for o in others
+    ]
+    clipped = [c for c in clipped if c[0] < c[2] and c[1] < c[3]]
+    if not clipped:
+        return False
+    # Coordinate compression: the union covers rect iff it covers every elementary cell.
+    lats = np.unique([lat_min, lat_max] + [c[0] for c in clipped] + [c[2] for c in clipped])
+    lons = np.unique([lon_min, lon_max] + [c[1] for c in clipped] + [c[3] for c in clipped])
+    covered = np.zeros((len(lats) - 1, len(lons) - 1), dtype=bool)
+    for c in clipped:
+        r0, r1 = np.searchsorted(lats, [c[0], c[2]])
+        c0, c1 = np.searchsorted(lons, [c[1], c[3]])
+        covered[r0:r1, c0:c1] = True
+    return bool(covered.all())
+
+
+def drop_covered_rectangles(shape_rects):
+    """
+    Drops rectangles already fully covered by other shapes' rectangles in the same batch.
+
+    Rectangles are visited in order and removed only while the remaining set
+    still covers them, so the union of everything fetched never shrinks (two
+    identical rectangles from different shapes keep exactly one).
+
+    Args:
+        shape_rects (dict): shape id -> list of (lat_min, lon_min, lat_max, lon_max).
+
+    Returns:
+        dict: shape id -> list of the rectangles that still need fetching.
+    """
+    kept = {shape_id: list(rects) for shape_id, rects in shape_rects.items()}
+    for shape_id, rects in shape_rects.items():
+        others = [rect for other_id, other_rects in kept.items() if other_id != shape_id for rect in other_rects]
+        if not others:
+            continue
+        for rect in rects:
+            if is_covered(rect, others):
+                kept[shape_id].remove(rect)
+    return kept
+
+
+def optimize_shape_batch(shape_rects, tolerance=0.0):
+    """
+    Minimizes the number of PropertySearch_Post queries needed for a batch of shapes.
+
+    Each shape's rectangles are merged with merge_rectangles, then rectangles
+    fully covered by other shapes are dropped.
+
+    Args:
+        shape_rects (dict): shape id -> list of (lat_min, lon_min, lat_max, lon_max).
+        tolerance (float): Over-fetch tolerance passed to merge_rectangles.
+
+    Returns:
+        tuple: (dict shape id -> optimized rectangles, dict with the estimated
+        'before' and 'after' request counts, one request per rectangle)
+    """
+    merged = {shape_id: merge_rectangles(rects, tolerance) for shape_id, rects in shape_rects.items()}
+    optimized = drop_covered_rectangles(merged)
+    estimate = {
+        "before": sum(len(rects) for rects in shape_rects.values()),
+        "after": sum(len(rects) for rects in optimized.values()),
+    }
+    return optimized, estimate
+
+
+def rect_to_dict(rect):
+    """Converts a (lat_min, lon_min, lat_max, lon_max) tuple into the map app's rectangle dict."""
+    return {'lat_min': rect[0], 'lon_min': rect[1], 'lat_max': rect[2], 'lon_max': rect[3]}
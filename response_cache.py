@@ -0,0 +1,165 @@
+import hashlib
+import json
+import math
+import sqlite3
+import threading
+import time
+import zlib
+
+DEFAULT_CACHE_PATH = 'realtor_response_cache.sqlite'
+DEFAULT_TTL_SECONDS = 15 * 60
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Eviction trims the store to this fraction of max_bytes so it doesn't run on every put.
+_EVICTION_TARGET = 0.9
+# Degrees at zoom level 0; each zoom level halves the tile edge (zoom 15 is about 0.011 degrees).
+_TILE_DEGREES_AT_ZOOM_0 = 360.0
+_COORDINATE_DECIMALS = 6
+
+
+def tile_size_degrees(zoom_level):
+    """Edge length, in degrees, of a cache tile at the given zoom level."""
+    return _TILE_DEGREES_AT_ZOOM_0 / (2 ** int(zoom_level))
+
+
+def tiles_for_bbox(bbox, zoom_level):
+    """
+    Returns the (tile_x, tile_y) indices of every tile that intersects a bbox.
+
+    Args:
+        bbox (tuple): (lat_min, lon_min, lat_max, lon_max).
+        zoom_level (int): Zoom level the tile grid is keyed on.
+    """
+    size = tile_size_degrees(zoom_level)
+    lat_min, lon_min, lat_max, lon_max = bbox
+    x0, x1 = math.floor(lon_min / size), math.ceil(lon_max / size)
+    y0, y1 = math.floor(lat_min / size), math.ceil(lat_max / size)
+    return [(x, y) for y in range(y0, max(y1, y0 + 1)) for x in range(x0, max(x1, x0 + 1))]
+
+
+def tile_bbox(tile_x, tile_y, zoom_level):
+    """Returns the (lat_min, lon_min, lat_max, lon_max) of a tile."""
+    size = tile_size_degrees(zoom_level)
+    return (round(tile_y * size, 9), round(tile_x * size, 9),
+            round((tile_y + 1) * size, 9), round((tile_x + 1) * size, 9))
+
+
+def make_key(kind, params):
+    """
+    Builds a cache key from a kind prefix and request parameters.
+
+    Floats are rounded so that bboxes which only differ by float noise share a key.
+
+    Args:
+        kind (str): Namespace of the entry, e.g. 'page' or 'tile'.
+        params (dict): Parameters identifying the request.
+    """
+    normalized = {
+        name: round(value, _COORDINATE_DECIMALS) if isinstance(value, float) else value
+        for name, value in params.items()
+    }
+    digest = hashlib.sha1(json.dumps(normalized, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+    return f"{kind}:{digest}"
+
+
+class ResponseCache:
+    """
+    On-disk store for decoded API responses, compressed with zlib in SQLite.
+
+    Entries expire after a per-entry TTL, and the least recently used entries
+    are evicted once the stored size exceeds max_bytes. Hit and miss counters
+    are kept per instance. Safe to share between threads; several processes may
+    open the same file.
+    """
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, ttl_seconds=DEFAULT_TTL_SECONDS, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS entries ("
+            " key TEXT PRIMARY KEY, body BLOB NOT NULL, size INTEGER NOT NULL,"
+            " expires_at REAL NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS entries_last_access ON entries (last_access)")
+        self._conn.commit()
+
+    def get(self, key):
+        """Returns the cached value for key, or None if missing or expired."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT body, expires_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            body, expires_at = row
+            if expires_at <= now:
+                self._conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+                self._conn.commit()
+                self.expired += 1
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE entries SET last_access = ? WHERE key = ?", (now, key))
+            self._conn.commit()
+            self.hits += 1
+        return json.loads(zlib.decompress(body))
+
+    def put(self, key, value, ttl_seconds=None):
+        """Stores a JSON-serializable value under key, evicting old entries if over max_bytes."""
+        body = zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'))
+        now = time.time()
+        ttl = self.ttl_seconds if ttl_seconds is None else ttl_seconds
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO entries (key, body, size, expires_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                (key, body, len(body), now + ttl, now)
+            )
+            self._conn.commit()
+            self._evict_locked()
+
+    def _evict_locked(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        self._conn.execute("DELETE FROM entries WHERE expires_at <= ?", (time.time(),))
+        target = self.max_bytes * _EVICTION_TARGET
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM entries").fetchone()[0]
+        doomed = []
+        for key, size in self._conn.execute("SELECT key, size FROM entries ORDER BY last_access"):
+            if total <= target:
+                break
+            doomed.append((key,))
+            total -= size
+        self._conn.executemany("DELETE FROM entries WHERE key = ?", doomed)
+        self._conn.commit()
+        self.evictions += len(doomed)
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM entries")
+            self._conn.commit()
+
+    def stats(self):
+        """Returns hit/miss counters and the current entry count and stored size."""
+        with self._lock:
+            entries, stored = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "expired": self.expired,
+            "evictions": self.evictions,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": entries,
+            "bytes": stored,
+        }
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
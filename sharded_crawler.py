@@ -0,0 +1,501 @@
+import argparse
+import json
+import math
+import multiprocessing
+import multiprocessing.forkserver
+import os
+import signal
+import socket
+import sqlite3
+import threading
+import time
+from queue import Empty
+
+from listing_store import DEFAULT_STORE_PATH, ListingStore
+from metrics import REGISTRY, write_summary
+from quadtree_crawler import DEFAULT_MAX_DEPTH, is_truncated
+from realtor_client import normalize_bbox
+from realtor_pagination import reachable_page_count
+
+DEFAULT_QUEUE_PATH = 'realtor_crawl_queue.sqlite'
+# Edge of the initial grid tiles; dense tiles are split further while crawling.
+DEFAULT_TILE_DEGREES = 0.05
+# A leased tile whose worker has not checkpointed for this long is handed to another worker.
+DEFAULT_LEASE_SECONDS = 5 * 60
+# Failed attempts after which a tile is parked as 'failed' instead of being retried.
+DEFAULT_MAX_ATTEMPTS = 3
+# Seconds an idle worker waits before asking the queue again while other workers still hold tiles.
+_IDLE_POLL_SECONDS = 5.0
+# Added to a page's worst-case fetch time (token waits, storing the page, checkpointing) when sizing leases.
+_LEASE_MARGIN_SECONDS = 60
+# Imported once by the fork server that workers are started from ('__main__' is the script that started the crawl).
+WORKER_PRELOAD_MODULES = ["__main__", "sharded_crawler", "realtor_client", "cookie_provider", "quadtree_crawler"]
+
+_SCHEMA = [
+    "CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT NOT NULL)",
+    "CREATE TABLE IF NOT EXISTS tiles ("
+    " tile_id INTEGER PRIMARY KEY AUTOINCREMENT, parent_id INTEGER, depth INTEGER NOT NULL,"
+    " lat_min REAL NOT NULL, lon_min REAL NOT NULL, lat_max REAL NOT NULL, lon_max REAL NOT NULL,"
+    " state TEXT NOT NULL DEFAULT 'pending', lease_owner TEXT, lease_expires REAL,"
+    " next_page INTEGER NOT NULL DEFAULT 1, page_count INTEGER, listing_count INTEGER NOT NULL DEFAULT 0,"
+    " attempts INTEGER NOT NULL DEFAULT 0, updated REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS tiles_state ON tiles (state, lease_expires)",
+]
+
+
+def partition_region(bbox, tile_degrees=DEFAULT_TILE_DEGREES):
+    """Splits a bbox into a grid of tiles at most `tile_degrees` on each side."""
+    lat_min, lon_min, lat_max, lon_max = normalize_bbox(bbox)
+    # The epsilon keeps float noise (0.2 / 0.1 = 2.0000000000000004) from adding a sliver row or column.
+    rows = max(1, math.ceil((lat_max - lat_min) / tile_degrees - 1e-9))
+    cols = max(1, math.ceil((lon_max - lon_min) / tile_degrees - 1e-9))
+    lat_step, lon_step = (lat_max - lat_min) / rows, (lon_max - lon_min) / cols
+    return [
+        (lat_min + row * lat_step, lon_min + col * lon_step,
+         lat_max if row == rows - 1 else lat_min + (row + 1) * lat_step,
+         lon_max if col == cols - 1 else lon_min + (col + 1) * lon_step)
+        for row in range(rows) for col in range(cols)
+    ]
+
+
+def worker_name():
+    """Lease owner id of this process; unique across machines sharing one queue file."""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+class TileQueue:
+    """
+    Work queue of crawl tiles in a SQLite file, with lease/ack semantics.
+
+    A worker leases a tile, fetches its pages in order and checkpoints after
+    each one (next_page is advanced and the lease extended), then acks it.
+    Tiles whose lease ran out, because the worker crashed or was killed, are
+    handed out again and resume at their checkpointed page. Dense tiles are
+    split into quadrants that enter the queue as new tiles.
+
+    The file uses a rollback journal rather than WAL, since WAL needs shared
+    memory and does not work for processes on different machines sharing the
+    file over a network filesystem.
+    """
+
+    def __init__(self, path=DEFAULT_QUEUE_PATH, lease_seconds=DEFAULT_LEASE_SECONDS,
+                 max_attempts=DEFAULT_MAX_ATTEMPTS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=60, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=DELETE")
+        for statement in _SCHEMA:
+            self._conn.execute(statement)
+
+    def close(self):
+        self._conn.close()
+
+    def _transaction(self, body):
+        """Runs body(conn) inside a write transaction taken up front, so concurrent leases can't collide."""
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = body(self._conn)
+                self._conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+
+    def initialize(self, bbox, tile_degrees=DEFAULT_TILE_DEGREES, max_depth=DEFAULT_MAX_DEPTH, fetch_kwargs=None):
+        """
+        Seeds an empty queue with the grid tiles of a region. A queue that already has tiles is left alone,
+        so re-running a crawl resumes it.
+
+        Returns:
+            int: Tiles added.
+        """
+        tiles = partition_region(bbox, tile_degrees)
+        settings = {"bbox": list(normalize_bbox(bbox)), "tile_degrees": tile_degrees,
+                    "max_depth": max_depth, "fetch_kwargs": fetch_kwargs or {}}
+
+        def seed(conn):
+            if conn.execute("SELECT COUNT(*) FROM tiles").fetchone()[0]:
+                return 0
+            conn.executemany("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)",
+                             [(key, json.dumps(value)) for key, value in settings.items()])
+            now = time.time()
+            conn.executemany(
+                "INSERT INTO tiles (depth, lat_min, lon_min, lat_max, lon_max, updated) VALUES (0, ?, ?, ?, ?, ?)",
+                [tile + (now,) for tile in tiles]
+            )
+            return len(tiles)
+
+        return self._transaction(seed)
+
+    def settings(self):
+        with self._lock:
+            return {key: json.loads(value) for key, value in self._conn.execute("SELECT key, value FROM meta")}
+
+    def lease(self, owner):
+        """
+        Leases the next available tile: pending, or leased with an expired lease.
+
+        Returns:
+            dict: The tile row (tile_id, depth, bbox, next_page, page_count, listing_count), or None.
+        """
+        def take(conn):
+            now = time.time()
+            row = conn.execute(
+                "SELECT tile_id, depth, lat_min, lon_min, lat_max, lon_max, next_page, page_count, listing_count"
+                " FROM tiles WHERE state = 'pending' OR (state = 'leased' AND lease_expires < ?)"
+                " ORDER BY state = 'leased' DESC, depth DESC, tile_id LIMIT 1", (now,)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE tiles SET state = 'leased', lease_owner = ?, lease_expires = ?, updated = ? WHERE tile_id = ?",
+                (owner, now + self.lease_seconds, now, row[0])
+            )
+            return {"tile_id": row[0], "depth": row[1], "bbox": tuple(row[2:6]),
+                    "next_page": row[6], "page_count": row[7], "listing_count": row[8]}
+
+        return self._transaction(take)
+
+    def _update_owned(self, tile_id, owner, assignments, params=()):
+        """Applies an update to a tile only while `owner` still holds its lease; returns True if it did."""
+        def update(conn):
+            cursor = conn.execute(
+                f"UPDATE tiles SET {assignments}, updated = ? WHERE tile_id = ? AND lease_owner = ? AND state = 'leased'",
+                tuple(params) + (time.time(), tile_id, owner)
+            )
+            return cursor.rowcount == 1
+
+        return self._transaction(update)
+
+    def checkpoint(self, tile_id, owner, next_page, page_count, listing_count):
+        """Records a completed page and extends the lease. False means the lease was lost to another worker."""
+        return self._update_owned(
+            tile_id, owner, "next_page = ?, page_count = ?, listing_count = ?, lease_expires = ?",
+            (next_page, page_count, listing_count, time.time() + self.lease_seconds)
+        )
+
+    def ack(self, tile_id, owner):
+        return self._update_owned(tile_id, owner, "state = 'done', lease_owner = NULL, lease_expires = NULL")
+
+    def release(self, tile_id, owner):
+        """Returns a leased tile to the queue unfinished, keeping its checkpoint (used on shutdown)."""
+        return self._update_owned(tile_id, owner, "state = 'pending', lease_owner = NULL, lease_expires = NULL")
+
+    def fail(self, tile_id, owner):
+        """Counts a failed attempt; the tile goes back to pending until max_attempts is reached."""
+        return self._update_owned(
+            tile_id, owner,
+            "attempts = attempts + 1, state = CASE WHEN attempts + 1 >= ? THEN 'failed' ELSE 'pending' END,"
+            " lease_owner = NULL, lease_expires = NULL", (self.max_attempts,)
+        )
+
+    def split(self, tile_id, owner, children, depth):
+        """Replaces a leased tile by its quadrants; the parent is marked 'split'."""
+        def replace(conn):
+            cursor = conn.execute(
+                "UPDATE tiles SET state = 'split', lease_owner = NULL, lease_expires = NULL, updated = ?"
+                " WHERE tile_id = ? AND lease_owner = ? AND state = 'leased'", (time.time(), tile_id, owner)
+            )
+            if cursor.rowcount != 1:
+                return False
+            now = time.time()
+            conn.executemany(
+                "INSERT INTO tiles (parent_id, depth, lat_min, lon_min, lat_max, lon_max, updated)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [(tile_id, depth) + tuple(child) + (now,) for child in children]
+            )
+            return True
+
+        return self._transaction(replace)
+
+    def reset_failed(self):
+        """Puts failed tiles back in the queue with a fresh attempt count."""
+        return self._transaction(lambda conn: conn.execute(
+            "UPDATE tiles SET state = 'pending', attempts = 0, updated = ? WHERE state = 'failed'", (time.time(),)
+        ).rowcount)
+
+    def has_open_tiles(self):
+        """True while any tile is pending or leased (a lease may still expire and need another worker)."""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT 1 FROM tiles WHERE state IN ('pending', 'leased') LIMIT 1"
+            ).fetchone() is not None
+
+    def status(self):
+        """Tile counts by state, plus completed pages and listings stored."""
+        with self._lock:
+            counts = dict(self._conn.execute("SELECT state, COUNT(*) FROM tiles GROUP BY state"))
+            pages, listings = self._conn.execute(
+                "SELECT COALESCE(SUM(next_page - 1), 0), COALESCE(SUM(listing_count), 0) FROM tiles"
+            ).fetchone()
+        return {"tiles": counts, "pages_fetched": pages, "listings": listings}
+
+
+def _quadrants(bbox):
+    lat_min, lon_min, lat_max, lon_max = bbox
+    lat_mid, lon_mid = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+    return [(lat_mid, lon_min, lat_max, lon_mid), (lat_mid, lon_mid, lat_max, lon_max),
+            (lat_min, lon_min, lat_mid, lon_mid), (lat_min, lon_mid, lat_mid, lon_max)]
+
+
+def crawl_tile(tile, queue, store, client, owner, fetch_kwargs, max_depth, stop_event=None):
+    """
+    Fetches the remaining pages of a leased tile, checkpointing after each page.
+
+    Returns:
+        str: 'done', 'split', 'failed', 'stopped' or 'lost' (the lease went to another worker).
+    """
+    lat_min, lon_min, lat_max, lon_max = tile["bbox"]
+    page_number = tile["next_page"]
+    page_count = tile["page_count"]
+    listing_count = tile["listing_count"]
+    while page_count is None or page_number <= page_count:
+        if stop_event is not None and stop_event.is_set():
+            queue.release(tile["tile_id"], owner)
+            return "stopped"
+        response = client.fetch(lat_max, lon_max, lat_min, lon_min, page_number=page_number, **fetch_kwargs)
+        if response is None:
+            queue.fail(tile["tile_id"], owner)
+            return "failed"
+        paging = response.get("Paging", {})
+        if page_number == 1 and is_truncated(paging) and tile["depth"] < max_depth:
+            # Too dense to page through completely; crawl its quadrants instead.
+            return "split" if queue.split(tile["tile_id"], owner, _quadrants(tile["bbox"]), tile["depth"] + 1) \
+                else "lost"
+        if page_count is None:
+            page_count = reachable_page_count(paging)
+        listing_count += store.ingest_response(response)[0]
+        page_number += 1
+        if not queue.checkpoint(tile["tile_id"], owner, page_number, page_count, listing_count):
+            return "lost"
+    return "done" if queue.ack(tile["tile_id"], owner) else "lost"
+
+
+def page_lease_seconds(client):
+    """
+    Lease needed to finish one page in the worst case: every attempt times out and
+    every retry waits the longest backoff. The lease is only extended after a page.
+    """
+    from realtor_client import get_default_rate_limiter
+
+    limiter = client.rate_limiter or get_default_rate_limiter()
+    attempts = limiter.max_retries + 1
+    return attempts * client.timeout + limiter.max_retries * limiter.backoff_max_seconds + _LEASE_MARGIN_SECONDS
+
+
+def run_worker(queue_path, store_path=DEFAULT_STORE_PATH, stop_event=None, lease_seconds=DEFAULT_LEASE_SECONDS,
+               api_url=None, cookie=None, results=None, spawned_at=None):
+    """
+    Worker loop: leases tiles until the queue is drained or `stop_event` is set.
+
+    Each worker process has its own RealtorClient (and so its own HTTP session
+    and cookie); its rate limiter's token bucket still shares one request
+    budget with the other workers. `api_url` overrides the PropertySearch_Post endpoint
+    and `cookie` replaces the browser-captured cookie. When `results` (a
+    multiprocessing queue) is given, the worker's outcomes and metrics snapshot
+    are put on it at the end. `spawned_at` (time.time() in the parent) lets the
+    worker report how long it took to start. `lease_seconds` is raised to
+    page_lease_seconds() when shorter, so a page spending its retries in backoff
+    doesn't lose its tile to another worker.
+    """
+    from cookie_provider import StaticCookieProvider
+    from realtor_client import REALTOR_API_URL, RealtorClient, make_rate_limiter
+
+    if stop_event is not None:
+        # Ctrl-C is handled by the parent, which asks the workers to stop after their current page.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+    # Like the queue, the rate limit state and the store may be shared over a network filesystem,
+    # so they don't use WAL either.
+    client = RealtorClient(api_url=api_url or REALTOR_API_URL,
+                           cookie_provider=StaticCookieProvider(cookie) if cookie else None,
+                           rate_limiter=make_rate_limiter(journal_mode="DELETE"))
+    queue = TileQueue(queue_path, lease_seconds=max(lease_seconds, page_lease_seconds(client)))
+    store = ListingStore(store_path, journal_mode="DELETE")
+    settings = queue.settings()
+    fetch_kwargs = settings.get("fetch_kwargs", {})
+    max_depth = settings.get("max_depth", DEFAULT_MAX_DEPTH)
+    owner = worker_name()
+    if spawned_at is not None:
+        startup = max(0.0, time.time() - spawned_at)
+        REGISTRY.observe("worker_startup", startup)
+        print(f"[{owner}] Worker ready {startup * 1000:.0f} ms after spawn.")
+    outcomes = {}
+    try:
+        while stop_event is None or not stop_event.is_set():
+            tile = queue.lease(owner)
+            if tile is None:
+                if not queue.has_open_tiles():
+                    break
+                # Other workers hold the remaining tiles; wait in case a lease expires or tiles get split.
+                if stop_event is not None:
+                    stop_event.wait(_IDLE_POLL_SECONDS)
+                else:
+                    time.sleep(_IDLE_POLL_SECONDS)
+                continue
+            try:
+                outcome = crawl_tile(tile, queue, store, client, owner, fetch_kwargs, max_depth, stop_event)
+            except Exception as e:
+                print(f"[{owner}] Tile {tile['tile_id']} failed: {e}")
+                queue.fail(tile["tile_id"], owner)
+                outcome = "failed"
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+    finally:
+        client.close()
+        store.close()
+        queue.close()
+    print(f"[{owner}] Worker finished: {outcomes}")
+    if results is not None:
+        results.put({"owner": owner, "outcomes": outcomes, "metrics": REGISTRY.snapshot()})
+    return outcomes
+
+
+def start_forkserver(context):
+    """
+    Starts the fork server and waits until it has imported the preloads.
+
+    The server's own start (one interpreter plus the preloads) is then paid
+    once, up front, instead of delaying the first workers.
+    """
+    started = time.perf_counter()
+    # The server is a fresh `python -c` whose sys.path only has the working directory (it doesn't
+    # get this process's path), and preloads that fail to import are skipped silently.
+    previous = os.environ.get("PYTHONPATH")
+    os.environ["PYTHONPATH"] = os.pathsep.join(filter(None, [os.path.dirname(os.path.abspath(__file__)), previous]))
+    try:
+        multiprocessing.forkserver.ensure_running()
+    finally:
+        if previous is None:
+            del os.environ["PYTHONPATH"]
+        else:
+            os.environ["PYTHONPATH"] = previous
+    # ensure_running() returns before the preloads are imported; the server forks only once it has.
+    warmup = context.Process(target=int, name="crawl-forkserver-warmup")
+    warmup.start()
+    warmup.join()
+    print(f"Fork server ready in {(time.perf_counter() - started) * 1000:.0f} ms.")
+
+
+def run_crawl(queue_path=DEFAULT_QUEUE_PATH, store_path=DEFAULT_STORE_PATH, workers=None,
+              lease_seconds=DEFAULT_LEASE_SECONDS, api_url=None, cookie=None, metrics_path=None):
+    """
+    Runs worker processes against a queue until it is drained.
+
+    Ctrl-C asks every worker to stop after its current page and hand its tile
+    back; a second Ctrl-C terminates them (their leases then expire and the
+    tiles resume from the last checkpoint on the next run). The workers'
+    metrics are merged into this process's registry; `metrics_path` also
+    writes them as a JSON summary ('-' prints it).
+
+    Returns:
+        dict: The queue status after the run.
+    """
+    workers = workers or os.cpu_count() or 1
+    # Workers must not inherit the parent's threads or sockets (cookie browser, HTTP pool), so they are
+    # never forked from this process. Where available they fork from a fresh single-threaded server
+    # that has already imported the crawler modules, which makes starting one take milliseconds
+    # instead of an interpreter start plus imports; otherwise they are spawned.
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        context.set_forkserver_preload(WORKER_PRELOAD_MODULES)
+        start_forkserver(context)
+    else:
+        context = multiprocessing.get_context("spawn")
+    stop_event = context.Event()
+    results = context.Queue()
+    processes = [
+        context.Process(target=run_worker,
+                        args=(queue_path, store_path, stop_event, lease_seconds, api_url, cookie, results,
+                              time.time()),
+                        name=f"crawl-worker-{number}")
+        for number in range(workers)
+    ]
+
+    def collect_results():
+        while True:
+            try:
+                REGISTRY.merge(results.get_nowait()["metrics"])
+            except Empty:
+                return
+
+    def wait_for_workers():
+        # Results are drained while waiting: a worker can't exit while its queued result is unread.
+        for process in processes:
+            while process.is_alive():
+                process.join(0.5)
+                collect_results()
+
+    for process in processes:
+        process.start()
+    print(f"Started {workers} crawl workers on {queue_path}.")
+    try:
+        wait_for_workers()
+    except KeyboardInterrupt:
+        print("Stopping workers after their current page (Ctrl-C again to terminate)...")
+        stop_event.set()
+        try:
+            wait_for_workers()
+        except KeyboardInterrupt:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.join()
+    collect_results()
+    if metrics_path:
+        write_summary(None if metrics_path == "-" else metrics_path)
+    queue = TileQueue(queue_path)
+    try:
+        return queue.status()
+    finally:
+        queue.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Resumable multi-process Realtor.ca crawler.")
+    parser.add_argument("--queue", default=DEFAULT_QUEUE_PATH, help="Work queue file (default: %(default)s).")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    init = commands.add_parser("init", help="Partition a region into tiles and queue them.")
+    init.add_argument("--bbox", type=float, nargs=4, required=True,
+                      metavar=("LAT_MIN", "LON_MIN", "LAT_MAX", "LON_MAX"))
+    init.add_argument("--tile-degrees", type=float, default=DEFAULT_TILE_DEGREES)
+    init.add_argument("--max-depth", type=int, default=DEFAULT_MAX_DEPTH)
+    init.add_argument("--sort-order", help="Sort parameter, e.g. 6-D.")
+    init.add_argument("--zoom-level", type=int)
+
+    run = commands.add_parser("run", help="Crawl queued tiles with worker processes (resumes after a stop).")
+    run.add_argument("--workers", type=int, default=os.cpu_count(), help="Worker processes (default: %(default)s).")
+    run.add_argument("--store", default=DEFAULT_STORE_PATH, help="Listing store file (default: %(default)s).")
+    run.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS,
+                     help="Tile lease (default: %(default)s); at least one page's worst-case retry time.")
+    run.add_argument("--api-url", help="PropertySearch_Post endpoint to use instead of Realtor.ca's.")
+    run.add_argument("--cookie", help="Fixed cookie (name=value) instead of one captured by the browser.")
+    run.add_argument("--metrics", help="Write the workers' merged metrics as JSON to this file ('-' prints them).")
+
+    commands.add_parser("status", help="Show tile counts by state.")
+    commands.add_parser("retry-failed", help="Requeue tiles that ran out of attempts.")
+
+    args = parser.parse_args(argv)
+    if args.command == "run":
+        print(json.dumps(run_crawl(args.queue, args.store, args.workers, args.lease_seconds,
+                                   args.api_url, args.cookie, args.metrics), indent=2))
+        return
+
+    queue = TileQueue(args.queue)
+    try:
+        if args.command == "init":
+            fetch_kwargs = {key: value for key, value in
+                            (("sort_order", args.sort_order), ("zoom_level", args.zoom_level)) if value is not None}
+            added = queue.initialize(args.bbox, args.tile_degrees, args.max_depth, fetch_kwargs)
+            print(f"Queued {added} tiles." if added else "Queue already initialized; run resumes it.")
+        elif args.command == "retry-failed":
+            print(f"Requeued {queue.reset_failed()} failed tiles.")
+        print(json.dumps(queue.status(), indent=2))
+    finally:
+        queue.close()
+
+
+if __name__ == '__main__':
+    main()
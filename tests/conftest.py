@@ -0,0 +1,27 @@
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+sys.path.insert(0, os.path.join(REPO_ROOT, 'benchmarks'))
+
+from cookie_provider import StaticCookieProvider
+from listing_store import ListingStore
+from rate_limiter import AdaptiveConcurrency, RateLimiter
+from realtor_client import RealtorClient
+
+
+def make_client(server):
+    """Client for a replay server: fixed cookie, no shared token bucket, no retries."""
+    limiter = RateLimiter(None, AdaptiveConcurrency(initial=4, minimum=1, maximum=4),
+                          max_retries=0, backoff_base_seconds=0.01, backoff_max_seconds=0.01)
+    return RealtorClient(server.url, cookie_provider=StaticCookieProvider("test=1"), rate_limiter=limiter)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ListingStore(str(tmp_path / 'listings.sqlite'))
+    yield store
+    store.close()
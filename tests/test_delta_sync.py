@@ -0,0 +1,38 @@
+from conftest import make_client
+from delta_sync import area_key_for_bbox, sync_area
+from replay_server import ListingCorpus, ReplayServer
+
+AREA = (45.30, -75.70, 45.31, -75.69)
+
+
+class FailingPageCorpus(ListingCorpus):
+    """Corpus whose server answers one page number with an error."""
+
+    failing_page = None
+
+    def render(self, lat_min, lon_min, lat_max, lon_max, page=1, per_page=12):
+        if page == self.failing_page:
+            raise ValueError(f"page {page} is unavailable")
+        return super().render(lat_min, lon_min, lat_max, lon_max, page=page, per_page=per_page)
+
+
+def test_failed_page_keeps_the_watermark(store):
+    corpus = FailingPageCorpus(count=100, area=AREA)
+    key = area_key_for_bbox(AREA)
+    with ReplayServer(corpus) as server:
+        client = make_client(server)
+
+        corpus.failing_page = 2
+        failed = sync_area(AREA, client=client, store=store)
+        assert failed["failed_requests"] >= 1
+        assert store.get_area_watermark(key) is None
+
+        corpus.failing_page = None
+        synced = sync_area(AREA, client=client, store=store)
+        assert synced["failed_requests"] == 0
+        watermark = store.get_area_watermark(key)
+        assert watermark is not None
+
+        corpus.failing_page = 2
+        sync_area(AREA, client=client, store=store, stop_after_known=1000)
+        assert store.get_area_watermark(key) == watermark
@@ -0,0 +1,53 @@
+import json
+
+import pytest
+
+import realtor
+import realtor_client
+from listing_store import ListingStore
+from rate_limiter import AdaptiveConcurrency, RateLimiter
+from replay_server import ListingCorpus, ReplayServer
+
+AREA = (45.30, -75.70, 45.32, -75.68)
+# Two overlapping squares, as (lat_min, lon_min, lat_max, lon_max).
+SQUARES = {"a": (45.300, -75.700, 45.315, -75.685), "b": (45.305, -75.695, 45.320, -75.680)}
+
+
+def ring(bbox):
+    lat_min, lon_min, lat_max, lon_max = bbox
+    return [[lat_min, lon_min], [lat_max, lon_min], [lat_max, lon_max], [lat_min, lon_max]]
+
+
+@pytest.fixture(autouse=True)
+def unlimited_default_limiter(monkeypatch):
+    """The CLI builds its client with the process-wide limiter; keep it off the shared token bucket."""
+    monkeypatch.setattr(realtor_client, "_default_rate_limiter",
+                        RateLimiter(None, AdaptiveConcurrency(initial=4, minimum=1, maximum=4), max_retries=0))
+
+
+def test_crawl_takes_the_map_app_shapes_file(tmp_path, capsys):
+    corpus = ListingCorpus(count=300, area=AREA)
+    shapes_path = tmp_path / 'shapes.json'
+    shapes_path.write_text(json.dumps({"shapes": [
+        {"id": shape_id, "name": f"Shape {shape_id}", "polygon": ring(bbox)} for shape_id, bbox in SQUARES.items()
+    ]}))
+    store_path = str(tmp_path / 'listings.sqlite')
+
+    with ReplayServer(corpus) as server:
+        realtor.main(["--api-url", server.url, "--cookie", "test=1", "--store", store_path,
+                      "crawl", str(shapes_path)])
+    result = json.loads(capsys.readouterr().out)
+
+    expected = {shape_id: {json.loads(entry[3])["Id"] for entry in corpus.search(*bbox)}
+                for shape_id, bbox in SQUARES.items()}
+    assert [shape["id"] for shape in result["shapes"]] == ["a", "b"]
+    assert [shape["inside"] for shape in result["shapes"]] == [len(expected["a"]), len(expected["b"])]
+    assert result["failed_requests"] == 0
+    # The overlap of the two shapes is crawled too.
+    assert expected["a"] & expected["b"]
+    store = ListingStore(store_path)
+    try:
+        stored = {str(listing["id"]) for listing in store.listings_in_bbox(AREA)}
+    finally:
+        store.close()
+    assert stored == expected["a"] | expected["b"]
@@ -0,0 +1,31 @@
+import math
+
+from conftest import make_client
+from replay_server import ListingCorpus, ReplayServer
+from two_phase_crawl import two_phase_crawl
+
+AREA = (45.30, -75.70, 45.31, -75.69)
+
+
+def test_new_area_is_hydrated_with_about_as_many_requests_as_paging(store):
+    with ReplayServer(ListingCorpus(count=60, area=AREA)) as server:
+        client = make_client(server)
+        report = two_phase_crawl(bbox=AREA, client=client, store=store)
+
+    pages = math.ceil(report["pins"] / client.default_records_per_page)
+    assert report["stale"] == report["pins"] > 40
+    assert report["hydrated"] == report["stale"]
+    assert report["hydration_requests"] <= pages + 1
+
+
+def test_scattered_changes_are_hydrated_in_small_groups(store):
+    with ReplayServer(ListingCorpus(count=400, area=AREA)) as server:
+        client = make_client(server)
+        first = two_phase_crawl(bbox=AREA, client=client, store=store)
+        stored = store.listings_in_bbox(AREA)
+        store.delete_listings([stored[0]["id"], stored[-1]["id"]])
+        second = two_phase_crawl(bbox=AREA, client=client, store=store)
+
+    assert first["hydrated"] == first["pins"]
+    assert second["stale"] == second["hydrated"] == 2
+    assert second["hydration_requests"] <= 2
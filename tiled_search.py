@@ -0,0 +1,148 @@
+import asyncio
+
+from realtor_client import get_default_client, normalize_bbox
+from realtor_pagination import CountingClient, fetch_all_pages
+from quadtree_crawler import crawl_bbox, is_truncated
+from response_cache import make_key, tile_bbox, tiles_for_bbox
+
+# Missing tiles fetched at once; each tile also fetches its own pages concurrently.
+DEFAULT_TILE_CONCURRENCY = 4
+
+
+def listing_coordinates(listing):
+    """Returns (lat, lon) of a 'Results' entry, or None if it has no usable address coordinates."""
+    address = listing.get("Property", {}).get("Address", {})
+    try:
+        return float(address["Latitude"]), float(address["Longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def _inside(lat, lon, bbox):
+    lat_min, lon_min, lat_max, lon_max = bbox
+    return lat_min <= lat <= lat_max and lon_min <= lon <= lon_max
+
+
+async def _fetch_tile(client, bbox, semaphore, fetch_kwargs):
+    """
+    Fetches every page of one tile as a cacheable {'Paging', 'Results', 'Pins'} entry.
+
+    Returns:
+        tuple: (entry or None, number of page requests that failed)
+    """
+    async with semaphore:
+        return await _fetch_tile_pages(CountingClient(client), bbox, fetch_kwargs)
+
+
+async def _fetch_tile_pages(client, bbox, fetch_kwargs):
+    lat_min, lon_min, lat_max, lon_max = bbox
+    # The tile itself is cached; its pages don't need a second copy in the page cache.
+    fetch_kwargs = dict(fetch_kwargs, use_cache=False)
+    first_page = await asyncio.to_thread(
+        client.fetch, lat_max, lon_max, lat_min, lon_min, page_number=1, **fetch_kwargs
+    )
+    if first_page is None:
+        return None, client.failures
+    if is_truncated(first_page.get("Paging", {})):
+        # Dense tile: split it so the MaxRecords cap doesn't drop listings.
+        listings = crawl_bbox(bbox, client=client, first_page=first_page, **fetch_kwargs)
+    else:
+        listings = fetch_all_pages(bbox, client=client, first_page=first_page, **fetch_kwargs)
+    results = [listing async for listing in listings]
+    entry = {"Paging": first_page.get("Paging", {}), "Results": results, "Pins": first_page.get("Pins", [])}
+    return entry, client.failures
+
+
+async def fetch_area_async(bbox, client=None, cache=None, zoom_level=None,
+                           concurrency=DEFAULT_TILE_CONCURRENCY, **fetch_kwargs):
+    """
+    Assembles all listings and pins of a bbox from tile-aligned cache entries.
+
+    The bbox is snapped to the response cache's tile grid for the zoom level.
+    Tiles already in the cache are served from disk; only missing tiles are
+    fetched (every page of them) and then stored; a tile with a failed page
+    is used for this result but not cached. The combined result is clipped
+    back to the requested bbox.
+
+    Args:
+        bbox: Bounding box accepted by realtor_client.normalize_bbox.
+        client (RealtorClient): Client to use; defaults to the process-wide client.
+        cache (ResponseCache): Tile store; defaults to the client's cache.
+        zoom_level (int): Zoom level of the request and of the tile grid.
+        concurrency (int): Maximum number of missing tiles fetched at once.
+        fetch_kwargs: Extra arguments for RealtorClient.fetch (sort_order, ...).
+
+    Returns:
+        dict: {'Results', 'Pins', 'Paging': {'TotalRecords'}, 'Tiles': {'total', 'cached', 'fetched', 'incomplete', 'failed'}}
+    """
+    client = client or get_default_client()
+    cache = cache if cache is not None else client.cache
+    zoom = zoom_level if zoom_level is not None else client.default_zoom_level
+    bbox = normalize_bbox(bbox)
+    fetch_kwargs = dict(fetch_kwargs, zoom_level=zoom)
+    # Tiles are keyed on the zoom level plus every effective static search parameter.
+    static_key = dict(client.static_params, **{k: v for k, v in fetch_kwargs.items() if v is not None})
+
+    tiles = tiles_for_bbox(bbox, zoom)
+    entries = {}
+    missing = []
+    for tile in tiles:
+        key = make_key("tile", dict(static_key, tile_x=tile[0], tile_y=tile[1]))
+        entry = cache.get(key) if cache is not None else None
+        if entry is None:
+            missing.append((tile, key))
+        else:
+            entries[tile] = entry
+
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    fetched = await asyncio.gather(*(
+        _fetch_tile(client, tile_bbox(tile[0], tile[1], zoom), semaphore, fetch_kwargs) for tile, _ in missing
+    ))
+    failed = 0
+    incomplete = 0
+    for (tile, key), (entry, failures) in zip(missing, fetched):
+        if entry is None:
+            failed += 1
+            continue
+        entries[tile] = entry
+        if failures:
+            # Serving a tile with missing pages for the whole TTL would hide those listings.
+            incomplete += 1
+        elif cache is not None:
+            cache.put(key, entry)
+
+    results = {}
+    pins = {}
+    for entry in entries.values():
+        for listing in entry.get("Results", []):
+            coordinates = listing_coordinates(listing)
+            if coordinates and _inside(coordinates[0], coordinates[1], bbox):
+                results.setdefault(listing.get("Id"), listing)
+        for pin in entry.get("Pins", []):
+            try:
+                lat, lon = float(pin["latitude"]), float(pin["longitude"])
+            except (KeyError, TypeError, ValueError):
+                continue
+            if _inside(lat, lon, bbox):
+                pins.setdefault((pin.get("propertyId"), pin.get("key")), pin)
+
+    print(f"Assembled area from {len(tiles)} tiles: {len(tiles) - len(missing)} cached, "
+          f"{len(missing) - failed} fetched ({incomplete} incomplete), {failed} failed.")
+    return {
+        "Results": list(results.values()),
+        "Pins": list(pins.values()),
+        "Paging": {"TotalRecords": len(results)},
+        "Tiles": {"total": len(tiles), "cached": len(tiles) - len(missing),
+                  "fetched": len(missing) - failed, "incomplete": incomplete, "failed": failed},
+    }
+
+
+def fetch_area(bbox, **kwargs):
+    """Synchronous wrapper around fetch_area_async."""
+    return asyncio.run(fetch_area_async(bbox, **kwargs))
+
+
+if __name__ == '__main__':
+    area = fetch_area((45.41715, -75.72110, 45.43411, -75.68209))
+    print(f"{len(area['Results'])} listings, {len(area['Pins'])} pins, tiles: {area['Tiles']}")
+    print(f"Cache stats: {get_default_client().cache.stats() if get_default_client().cache else 'disabled'}")
@@ -0,0 +1,284 @@
+import asyncio
+import math
+
+import numpy as np
+
+from listing_store import ListingStore
+from polygon_geometry import normalize_polygons, points_in_polygons, polygons_bounds
+from realtor_client import get_default_client, normalize_bbox
+from realtor_pagination import CountingClient, reachable_page_count
+
+# Pins are clustered (count > 1) at coarse zoom levels; clustered areas are
+# re-queried one zoom level deeper until this level is reached.
+MAX_PIN_ZOOM_LEVEL = 20
+# Wanted listings are hydrated in groups of nearby pins; groups are not split below this size in degrees.
+DEFAULT_HYDRATION_CELL_DEGREES = 0.002
+# Pad around a group's pins so listings exactly on the bbox edge are returned.
+_HYDRATION_PAD_DEGREES = 0.00002
+# The API pages through at most this many records of a search (MaxRecords).
+_MAX_RECORDS = 600
+# A stored listing counts as moved when its coordinates differ from its pin by more than this.
+_MOVED_DEGREES = 0.00005
+DEFAULT_CONCURRENCY = 4
+
+
+def _quadrants(bbox):
+    lat_min, lon_min, lat_max, lon_max = bbox
+    lat_mid, lon_mid = (lat_min + lat_max) / 2, (lon_min + lon_max) / 2
+    return [(lat_mid, lon_min, lat_max, lon_mid), (lat_mid, lon_mid, lat_max, lon_max),
+            (lat_min, lon_min, lat_mid, lon_mid), (lat_min, lon_mid, lat_mid, lon_max)]
+
+
+def _pin_coordinates(pin):
+    try:
+        return float(pin["latitude"]), float(pin["longitude"])
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+async def harvest_pins(bbox, client, zoom_level, semaphore, pins, fetch_kwargs):
+    """
+    Phase one: collects {propertyId: (lat, lon)} for every listing in a bbox from Pins only.
+
+    Each query asks for a single result per page, since only the Pins array is
+    used. Quadrants holding clustered pins (count > 1) are queried again one
+    zoom level deeper until the clusters resolve into single properties.
+    """
+    lat_min, lon_min, lat_max, lon_max = bbox
+    async with semaphore:
+        response = await asyncio.to_thread(
+            client.fetch, lat_max, lon_max, lat_min, lon_min,
+            page_number=1, zoom_level=zoom_level, records_per_page=1, **fetch_kwargs
+        )
+    if response is None:
+        print(f"Pin harvest failed for {bbox}; its listings are missing from this scan.")
+        return
+
+    clustered = []
+    for pin in response.get("Pins", []):
+        coordinates = _pin_coordinates(pin)
+        if coordinates is None:
+            continue
+        if int(pin.get("count") or 1) > 1 or not pin.get("propertyId"):
+            clustered.append(coordinates)
+        else:
+            pins[str(pin["propertyId"])] = coordinates
+
+    if not clustered:
+        return
+    if zoom_level >= MAX_PIN_ZOOM_LEVEL:
+        print(f"{len(clustered)} pin clusters in {bbox} did not resolve by zoom level {MAX_PIN_ZOOM_LEVEL}.")
+        return
+    # Only quadrants that contain a cluster need a finer query.
+    finer = [
+        quadrant for quadrant in _quadrants(bbox)
+        if any(quadrant[0] <= lat <= quadrant[2] and quadrant[1] <= lon <= quadrant[3] for lat, lon in clustered)
+    ]
+    await asyncio.gather(*(
+        harvest_pins(quadrant, client, zoom_level + 1, semaphore, pins, fetch_kwargs) for quadrant in finer
+    ))
+
+
+def select_stale(pins, store):
+    """
+    Diffs harvested pins against the listing store.
+
+    Returns:
+        dict: {propertyId: (lat, lon)} for pins that are not stored yet or whose
+        stored coordinates no longer match the pin.
+    """
+    known = store.get_coordinates(pins)
+    stale = {}
+    for property_id, (lat, lon) in pins.items():
+        stored = known.get(int(property_id))
+        if stored is None or stored[0] is None or stored[1] is None \
+                or abs(stored[0] - lat) > _MOVED_DEGREES or abs(stored[1] - lon) > _MOVED_DEGREES:
+            stale[property_id] = (lat, lon)
+    return stale
+
+
+def plan_hydration(wanted, pins, records_per_page, cell_degrees=DEFAULT_HYDRATION_CELL_DEGREES):
+    """
+    Groups wanted pins into the bboxes that hydrate them in the fewest requests.
+
+    Hydrating a bbox pages through every listing in it, so its cost is about
+    ceil(pins in the bbox / records_per_page) requests. Starting from the bbox
+    of all wanted pins, an area is split into quadrants only while that lowers
+    the estimated cost, down to cells of cell_degrees: scattered changes get
+    small bboxes, while an area that is mostly new is paged as a whole.
+
+    Args:
+        wanted (dict): {propertyId: (lat, lon)} to hydrate.
+        pins (dict): {propertyId: (lat, lon)} of every listing known to be in the area,
+            wanted ones included; they are what the hydration pages go through.
+        records_per_page (int): Listings per hydration page.
+        cell_degrees (float): Smallest area that is split further.
+
+    Returns:
+        list: (bbox, set of wanted ids) per group.
+    """
+    if not wanted:
+        return []
+    per_page = max(1, int(records_per_page))
+    wanted_ids = list(wanted)
+    wanted_points = np.array([wanted[pid] for pid in wanted_ids], dtype=np.float64)
+    pin_points = np.array(list(pins.values()), dtype=np.float64).reshape(-1, 2)
+
+    def plan(region, members, others):
+        points = wanted_points[members]
+        lat_min, lon_min = points.min(axis=0) - _HYDRATION_PAD_DEGREES
+        lat_max, lon_max = points.max(axis=0) + _HYDRATION_PAD_DEGREES
+        inside = others[(others[:, 0] >= lat_min) & (others[:, 0] <= lat_max)
+                        & (others[:, 1] >= lon_min) & (others[:, 1] <= lon_max)]
+        listed = max(len(inside), len(members))
+        cost = -(-listed // per_page) if listed <= _MAX_RECORDS else math.inf
+        group = [((float(lat_min), float(lon_min), float(lat_max), float(lon_max)),
+                  {wanted_ids[index] for index in members.tolist()})]
+        region_lat_min, region_lon_min, region_lat_max, region_lon_max = region
+        if cost <= 1 or (region_lat_max - region_lat_min <= cell_degrees
+                         and region_lon_max - region_lon_min <= cell_degrees):
+            return cost, group
+
+        lat_mid = (region_lat_min + region_lat_max) / 2
+        lon_mid = (region_lon_min + region_lon_max) / 2
+
+        def quadrant_index(coordinates):
+            # Position in _quadrants' order; a point on a split line lands in exactly one quadrant.
+            return (coordinates[:, 0] < lat_mid) * 2 + (coordinates[:, 1] >= lon_mid)
+
+        member_quadrants = quadrant_index(wanted_points[members])
+        other_quadrants = quadrant_index(others)
+        split_cost, groups = 0, []
+        for index, quadrant in enumerate(_quadrants(region)):
+            quadrant_members = members[member_quadrants == index]
+            if not len(quadrant_members):
+                continue
+            quadrant_cost, quadrant_groups = plan(quadrant, quadrant_members, others[other_quadrants == index])
+            split_cost += quadrant_cost
+            groups.extend(quadrant_groups)
+            if math.isfinite(cost) and split_cost >= cost:
+                return cost, group
+        # An area too dense to page through is always split.
+        return split_cost, groups
+
+    lat_min, lon_min = wanted_points.min(axis=0)
+    lat_max, lon_max = wanted_points.max(axis=0)
+    return plan((lat_min, lon_min, lat_max, lon_max), np.arange(len(wanted_ids)), pin_points)[1]
+
+
+async def hydrate_group(bbox, wanted, client, semaphore, fetch_kwargs):
+    """
+    Phase two: pages through a small bbox until every wanted listing has been seen.
+
+    Returns:
+        list: Full 'Results' entries for the wanted Ids that were found.
+    """
+    lat_min, lon_min, lat_max, lon_max = bbox
+    remaining = set(wanted)
+    found = []
+    page_number, page_count = 1, 1
+    while remaining and page_number <= page_count:
+        async with semaphore:
+            response = await asyncio.to_thread(
+                client.fetch, lat_max, lon_max, lat_min, lon_min,
+                page_number=page_number, zoom_level=MAX_PIN_ZOOM_LEVEL, **fetch_kwargs
+            )
+        if response is None:
+            break
+        page_count = reachable_page_count(response.get("Paging", {}))
+        for listing in response.get("Results", []):
+            if listing.get("Id") in remaining:
+                remaining.discard(listing["Id"])
+                found.append(listing)
+        page_number += 1
+    return found
+
+
+async def two_phase_crawl_async(bbox=None, polygon=None, polygons=None, client=None, store=None,
+                                zoom_level=None, concurrency=DEFAULT_CONCURRENCY,
+                                cell_degrees=DEFAULT_HYDRATION_CELL_DEGREES, **fetch_kwargs):
+    """
+    Crawls an area pins-first and only fetches details for new or changed listings.
+
+    Phase one harvests property Ids and coordinates from Pins, resolving
+    clusters with finer sub-queries, filters them to the drawn polygon and diffs
+    them against the listing store. Phase two fetches full details only for the
+    remaining Ids, paging through bboxes around groups of nearby pins (see
+    plan_hydration), and upserts them into the store.
+
+    Args:
+        bbox: Area to scan; defaults to the polygon's bounding box.
+        polygon (list): Single [lat, lon] ring to restrict the scan to.
+        polygons (list): Multi-polygon, as accepted by polygon_geometry.normalize_polygons.
+        client (RealtorClient): Client to use; defaults to the process-wide client.
+        store (ListingStore): Store to diff against and write to; defaults to the default store file.
+        zoom_level (int): Zoom level of the first pin query.
+        concurrency (int): Maximum requests in flight.
+        cell_degrees (float): Smallest area plan_hydration groups pins into.
+        fetch_kwargs: Extra arguments for RealtorClient.fetch (sort_order, ...).
+
+    Returns:
+        dict: Counts per phase: pins, inside, stale, hydrated, missing and requests,
+        plus failed_requests (requests that got no response; their areas are incomplete).
+    """
+    client = client or get_default_client()
+    store = store or ListingStore()
+    shapes = normalize_polygons(polygon, polygons)
+    if bbox is None:
+        if not shapes:
+            raise ValueError("two_phase_crawl needs a bbox or a polygon.")
+        bbox = polygons_bounds(shapes)
+    bbox = normalize_bbox(bbox)
+    zoom = zoom_level if zoom_level is not None else client.default_zoom_level
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    # The diff against the store needs current pins and details, not cached pages.
+    fetch_kwargs = dict(fetch_kwargs, use_cache=False)
+
+    harvest_client = CountingClient(client)
+    pins = {}
+    await harvest_pins(bbox, harvest_client, zoom, semaphore, pins, fetch_kwargs)
+    store.upsert_pins({"propertyId": pid, "latitude": lat, "longitude": lon, "count": 1}
+                      for pid, (lat, lon) in pins.items())
+
+    inside = pins
+    if shapes and pins:
+        ids = list(pins)
+        coordinates = np.array([pins[pid] for pid in ids], dtype=np.float64)
+        mask = points_in_polygons(coordinates[:, 0], coordinates[:, 1], shapes)
+        inside = {pid: pins[pid] for pid, keep in zip(ids, mask.tolist()) if keep}
+
+    stale = select_stale(inside, store)
+    print(f"Phase one: {len(pins)} pins in {harvest_client.requests} requests, "
+          f"{len(inside)} inside the polygon, {len(stale)} new or changed.")
+
+    hydrate_client = CountingClient(client)
+    results = await asyncio.gather(*(
+        hydrate_group(group_bbox, wanted, hydrate_client, semaphore, fetch_kwargs)
+        for group_bbox, wanted in plan_hydration(stale, pins, client.default_records_per_page, cell_degrees)
+    ))
+    hydrated = [listing for found in results for listing in found]
+    store.upsert_listings(hydrated)
+    missing = len(stale) - len(hydrated)
+    print(f"Phase two: hydrated {len(hydrated)} listings in {hydrate_client.requests} requests"
+          f"{f', {missing} not found' if missing else ''}.")
+
+    return {
+        "pins": len(pins),
+        "inside": len(inside),
+        "stale": len(stale),
+        "hydrated": len(hydrated),
+        "missing": missing,
+        "harvest_requests": harvest_client.requests,
+        "hydration_requests": hydrate_client.requests,
+        "failed_requests": harvest_client.failures + hydrate_client.failures,
+    }
+
+
+def two_phase_crawl(**kwargs):
+    """Synchronous wrapper around two_phase_crawl_async."""
+    return asyncio.run(two_phase_crawl_async(**kwargs))
+
+
+if __name__ == '__main__':
+    downtown = [[45.41715, -75.72110], [45.43411, -75.72110], [45.43411, -75.68209], [45.41715, -75.68209]]
+    print(two_phase_crawl(polygon=downtown))